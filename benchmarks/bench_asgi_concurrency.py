@@ -0,0 +1,178 @@
+"""
+WSGI vs ASGI: how many slow uploads can one process hold at once?
+
+Both sides upload N small PDFs concurrently and process them inline (scan,
+sanitize, extract, save). The malware scanner is replaced by a fake
+``clamscan`` that sleeps for --scan-delay seconds, which is what makes a
+real upload slow.
+
+- WSGI: a sync view driven by a pool of --threads threads, like a threaded
+  WSGI server: at most one request per thread is in flight.
+- ASGI: the async view (data_capture.async_views.api_upload_file) on a single
+  event loop, all N requests gathered at once. Each request gets its own
+  thread for sync work, as under Django's ASGIHandler; with --shared-thread
+  they all share one, which shows what still blocks the loop's sync thread.
+
+Run from the project root:
+
+    python benchmarks/bench_asgi_concurrency.py --requests 200 --threads 16
+"""
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scrap_project.settings')
+
+from asgiref.sync import ThreadSensitiveContext  # noqa: E402
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.http import JsonResponse  # noqa: E402
+from django.test import AsyncClient, Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.urls import include, path  # noqa: E402
+from django.views.decorators.csrf import csrf_exempt  # noqa: E402
+from PyPDF2 import PdfWriter  # noqa: E402
+
+from data_capture.models import DataSource, ExtractedData  # noqa: E402
+from data_capture.pipeline import Upload, analysis_pipeline  # noqa: E402
+from data_capture.uploadhandlers import install_streaming_handler  # noqa: E402
+
+
+@csrf_exempt
+def sync_upload(request):
+    """What a WSGI worker does for an inline upload: everything blocks its thread."""
+    install_streaming_handler(request)
+    uploaded_file = request.FILES['file']
+    file_path = uploaded_file.commit()
+    result = analysis_pipeline.run(
+        Upload(request.user, 'pdf', uploaded_file.name, file_path, uploaded_file.sha256)
+    )
+    source = DataSource.objects.create(
+        user=request.user, source_type='pdf', file_name=uploaded_file.name, file_hash=uploaded_file.sha256,
+    )
+    ExtractedData.objects.create(source=source, user=request.user, data=result.data_json or '{}')
+    return JsonResponse({'status': result.status})
+
+
+urlpatterns = [
+    path('bench/sync/upload/', sync_upload),
+    path('', include('data_capture.urls')),
+]
+
+
+def make_pdf(i: int) -> bytes:
+    # Distinct bytes per request so the dedup shortcut never kicks in
+    writer = PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    writer.add_metadata({'/Title': f'bench {i}'})
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def install_fake_clamscan(bin_dir: Path, delay: float):
+    script = bin_dir / 'clamscan'
+    script.write_text(f'#!/bin/sh\nsleep {delay}\nexit 0\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    os.environ['PATH'] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+
+
+def run_wsgi(pdfs, threads, cookies):
+    local = threading.local()
+
+    def one(i):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = Client()
+            client.cookies = cookies
+        upload = SimpleUploadedFile(f'wsgi_{i}.pdf', pdfs[i], content_type='application/pdf')
+        response = client.post('/bench/sync/upload/', {'file': upload})
+        return response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        codes = list(pool.map(one, range(len(pdfs))))
+    return time.perf_counter() - started, codes
+
+
+def run_asgi(pdfs, cookies, shared_thread=False):
+    async def main():
+        client = AsyncClient()
+        client.cookies = cookies
+
+        async def one(i):
+            upload = SimpleUploadedFile(f'asgi_{i}.pdf', pdfs[i], content_type='application/pdf')
+            # Like Django's ASGIHandler: each request gets its own thread for sync_to_async work
+            async with nullcontext() if shared_thread else ThreadSensitiveContext():
+                response = await client.post('/async/api/upload/', {'file': upload, 'source_type': 'pdf'})
+            return response.status_code
+
+        return await asyncio.gather(*(one(i) for i in range(len(pdfs))))
+
+    started = time.perf_counter()
+    codes = asyncio.run(main())
+    return time.perf_counter() - started, codes
+
+
+def report(label, elapsed, codes, n):
+    ok = sum(1 for c in codes if c == 200)
+    print(f"{label:<6} {elapsed:8.2f}s  {n / elapsed:8.1f} req/s  ({ok}/{n} OK)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+    parser.add_argument('--scan-delay', type=float, default=0.5, help='seconds the fake scanner sleeps')
+    parser.add_argument('--shared-thread', action='store_true',
+                        help='run the sync work of all ASGI requests on one thread')
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix='bench_asgi_'))
+    try:
+        install_fake_clamscan(workdir, args.scan_delay)
+        settings.MEDIA_ROOT = workdir / 'media'
+        (settings.MEDIA_ROOT / 'uploads').mkdir(parents=True)
+        settings.ROOT_URLCONF = __name__
+        settings.EXTRACTION_WORKERS = {'pdf': 0}  # extraction is not what's being measured
+        settings.DEBUG = False
+
+        setup_test_environment()
+        # A file (not in-memory) database so the WSGI threads can share it
+        connection.settings_dict['TEST']['NAME'] = str(workdir / 'bench.sqlite3')
+        connection.settings_dict.setdefault('OPTIONS', {})['timeout'] = 60
+        connection.creation.create_test_db(verbosity=0, serialize=False)
+
+        user = get_user_model().objects.create_user('bench', password='bench-pass-123')
+        login = Client()
+        login.force_login(user)
+
+        pdfs = [make_pdf(i) for i in range(args.requests)]
+        print(f"{args.requests} uploads, scanner delay {args.scan_delay}s, {args.threads} WSGI threads")
+
+        report('WSGI', *run_wsgi(pdfs, args.threads, login.cookies), args.requests)
+        report('ASGI', *run_asgi(pdfs, login.cookies, args.shared_thread), args.requests)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+extract_excel_data() on a workbook with many sheets.
+
+Writes a workbook with --sheets sheets of --rows x --cols cells and times
+the previous implementation (pd.ExcelFile to list the sheets, then
+pd.read_excel once per sheet, which re-opens and re-parses the file every
+time) against the current one (one read-only open, rows streamed in
+chunks, sanitized and written to the sheet store as they come), and checks
+that both give the same rows. With --memory, peak
+traced memory is measured too, in a separate (much slower) run.
+
+Run from the project root:
+
+    python benchmarks/bench_excel_extraction.py --sheets 40 --rows 2000 --cols 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scrap_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import openpyxl  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from django.conf import settings  # noqa: E402
+
+from data_capture.sheetstore import load_sheets  # noqa: E402
+from data_capture.utils import extract_excel_data  # noqa: E402
+
+
+def legacy_extract_excel_data(file_path):
+    """The version this replaced."""
+    excel_file = pd.ExcelFile(file_path)
+    sheets_data = {}
+    for sheet_name in excel_file.sheet_names:
+        df = pd.read_excel(file_path, sheet_name=sheet_name)
+        sheets_data[sheet_name] = {
+            'columns': df.columns.tolist(),
+            'rows': df.values.tolist(),
+            'row_count': len(df)
+        }
+    return {'type': 'excel', 'sheets': sheets_data}
+
+
+def make_workbook(path, sheets: int, rows: int, cols: int):
+    wb = openpyxl.Workbook(write_only=True)
+    for s in range(sheets):
+        ws = wb.create_sheet(f'Sheet {s}')
+        ws.append([f'Column {c}' for c in range(cols)])
+        for r in range(rows):
+            ws.append([r * cols + c if c % 2 else f'cell {r}/{c}' for c in range(cols)])
+    wb.save(path)
+
+
+def timed(fn, path):
+    started = time.perf_counter()
+    result = fn(path)
+    return time.perf_counter() - started, result
+
+
+def peak_memory(fn, path):
+    tracemalloc.start()
+    try:
+        fn(path)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sheets', type=int, default=40)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--cols', type=int, default=10)
+    parser.add_argument('--memory', action='store_true', help='also measure peak traced memory')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.SHEET_STORE_DIR = Path(tmp) / 'sheets'
+        path = os.path.join(tmp, 'bench.xlsx')
+        make_workbook(path, args.sheets, args.rows, args.cols)
+        size = os.path.getsize(path)
+        print(f"{args.sheets} sheets x {args.rows:,} rows x {args.cols} cols, {size / 1e6:.1f} MB on disk")
+
+        results = {}
+        timings = {}
+        for label, fn in (('legacy', legacy_extract_excel_data), ('current', extract_excel_data)):
+            elapsed, results[label] = timed(fn, path)
+            timings[label] = elapsed
+            line = f"{label:<8} {elapsed:8.2f}s"
+            if args.memory:
+                line += f"  peak {peak_memory(fn, path) / 1e6:8.1f} MB"
+            print(line)
+        print(f"speedup  {timings['legacy'] / timings['current']:8.1f}x")
+
+        current = load_sheets(results['current'])
+        for name, sheet in results['legacy']['sheets'].items():
+            assert sheet['rows'] == current['sheets'][name]['rows'], f"{name} differs"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+OCR preprocessing (data_capture/ocrprep.py): time and accuracy per step.
+
+Builds a photographed-document stand-in: --lines of text on a --dpi page,
+tilted by --skew degrees, under lighting that darkens towards one side,
+with sensor noise, saved as JPEG. It then runs prepare_for_ocr() with the
+steps switched on one at a time.
+
+For each configuration it reports the preprocessing time and the size of
+the image OCR gets. When Tesseract is installed it also reports OCR time
+and character accuracy against the text that was drawn (1.0 = identical).
+
+Run from the project root:
+
+    python benchmarks/bench_ocr_preprocess.py --dpi 600 --skew 2
+"""
+import argparse
+import difflib
+import io
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scrap_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import numpy as np  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+
+from data_capture.ocr import close_ocr_pool, ocr_available, ocr_image  # noqa: E402
+from data_capture.ocrprep import prepare_for_ocr  # noqa: E402
+
+WORDS = ('invoice total amount paid pending customer account reference date '
+         'balance payment received order number quantity price tax').split()
+
+# (label, settings): each step added to the ones before it, then Otsu instead of Sauvola
+CONFIGS = [
+    ('none', dict(OCR_PREPROCESS_GRAYSCALE=False, OCR_TARGET_DPI=0, OCR_DESKEW=False, OCR_BINARIZE='')),
+    ('grayscale', dict(OCR_PREPROCESS_GRAYSCALE=True, OCR_TARGET_DPI=0, OCR_DESKEW=False, OCR_BINARIZE='')),
+    ('+downscale', dict(OCR_PREPROCESS_GRAYSCALE=True, OCR_TARGET_DPI=300, OCR_DESKEW=False, OCR_BINARIZE='')),
+    ('+deskew', dict(OCR_PREPROCESS_GRAYSCALE=True, OCR_TARGET_DPI=300, OCR_DESKEW=True, OCR_BINARIZE='')),
+    ('+sauvola', dict(OCR_PREPROCESS_GRAYSCALE=True, OCR_TARGET_DPI=300, OCR_DESKEW=True, OCR_BINARIZE='sauvola')),
+    ('otsu', dict(OCR_PREPROCESS_GRAYSCALE=True, OCR_TARGET_DPI=300, OCR_DESKEW=True, OCR_BINARIZE='otsu')),
+]
+
+
+def make_page(dpi: int, lines: int, skew: float, seed: int = 0):
+    """(JPEG bytes, the text drawn) for an A4 page at `dpi`."""
+    rng = random.Random(seed)
+    text = [' '.join(rng.choice(WORDS) for _ in range(8)) for _ in range(lines)]
+
+    # Pillow's built-in font is 11 px high; draw at 1/scale and enlarge so
+    # the glyphs are about 10pt at `dpi`
+    scale = max(1, round(dpi / 100))
+    width, height = round(8.27 * dpi), round(11.69 * dpi)
+    small = Image.new('L', (width // scale, height // scale), 255)
+    draw = ImageDraw.Draw(small)
+    for n, line in enumerate(text):
+        draw.text((40, 40 + n * 20), line, fill=0)
+    page = small.resize((width, height), Image.Resampling.BICUBIC)
+    page = page.rotate(skew, Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+
+    gray = np.asarray(page, dtype=np.float64)
+    lighting = np.linspace(1.0, 0.45, gray.shape[1])[None, :]
+    noise = np.random.default_rng(seed).normal(0, 8, gray.shape)
+    gray = np.clip(gray * lighting + noise, 0, 255).astype(np.uint8)
+    rgb = Image.fromarray(gray).convert('RGB')
+
+    buffer = io.BytesIO()
+    rgb.save(buffer, 'JPEG', quality=90, dpi=(dpi, dpi))
+    return buffer.getvalue(), '\n'.join(text)
+
+
+def accuracy(expected: str, actual: str) -> float:
+    return difflib.SequenceMatcher(None, ' '.join(expected.split()), ' '.join(actual.split()), autojunk=False).ratio()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dpi', type=int, default=600)
+    parser.add_argument('--lines', type=int, default=40)
+    parser.add_argument('--skew', type=float, default=2.0, help='degrees the page is tilted by')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data, expected = make_page(args.dpi, args.lines, args.skew)
+    with_ocr = ocr_available()
+    width, height = Image.open(io.BytesIO(data)).size
+    print(f"A4 page at {args.dpi} dpi ({width}x{height}), {args.lines} lines, {args.skew} degrees skew")
+    if not with_ocr:
+        print("Tesseract not found: preprocessing times only")
+
+    header = f"{'steps':<12} {'prep':>8} {'OCR input':>12}"
+    if with_ocr:
+        header += f" {'OCR':>8} {'total':>8} {'accuracy':>9}"
+    print(header)
+
+    for label, config in CONFIGS:
+        with override_settings(**config):
+            best = None
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                prepared, info = prepare_for_ocr(Image.open(io.BytesIO(data)))
+                prepared.load()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+
+        row = f"{label:<12} {best:7.3f}s {'x'.join(map(str, info['size'])):>12}"
+        if with_ocr:
+            started = time.perf_counter()
+            text = ocr_image(prepared)
+            ocr_seconds = time.perf_counter() - started
+            row += f" {ocr_seconds:7.2f}s {best + ocr_seconds:7.2f}s {accuracy(expected, text):9.3f}"
+        print(row)
+
+    close_ocr_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+sanitize_extracted_data() on a large workbook payload.
+
+Builds an in-memory spreadsheet extraction with --rows x --cols
+cells (1M by default): mostly numbers and plain words, with a small share
+(--dirty) of cells that contain markup or quotes. Times the previous
+recursive implementation (rebuilds the whole tree, full treatment for every
+string) against the current one (in place, skips strings with nothing to
+sanitize) and checks that both give the same result.
+
+Run from the project root:
+
+    python benchmarks/bench_sanitize_extracted_data.py --rows 50000 --cols 20
+"""
+import argparse
+import copy
+import html
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scrap_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from data_capture.security import (  # noqa: E402
+    SCRIPT_RE,
+    TAG_RE,
+    sanitize_extracted_data,
+)
+
+PLAIN = ['Dublin', 'Cork', 'invoice', 'paid', 'pending', 'John Smith', 'N/A', '2026-10-16', 'EUR']
+DIRTY = ['<b>bold</b>', 'Tom & Jerry', "O'Brien", '<script>alert(1)</script>', 'a > b']
+
+
+def legacy_sanitize_text(value):
+    if not isinstance(value, str):
+        return value
+    value = SCRIPT_RE.sub("", value)
+    value = TAG_RE.sub("", value)
+    value = html.escape(value)
+    return value.replace("DROP TABLE", "[REMOVED]").replace("drop table", "[REMOVED]")
+
+
+def legacy_sanitize_extracted_data(obj):
+    """The recursive version this replaced."""
+    if isinstance(obj, dict):
+        return {k: legacy_sanitize_extracted_data(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [legacy_sanitize_extracted_data(x) for x in obj]
+    if isinstance(obj, str):
+        return legacy_sanitize_text(obj)
+    return obj
+
+
+def make_payload(rows: int, cols: int, dirty: float, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+
+    def cell(j):
+        if j % 3 == 0:
+            return rng.randint(0, 10 ** 6)
+        if j % 3 == 1:
+            return rng.random() * 1000
+        return rng.choice(DIRTY) if rng.random() < dirty else rng.choice(PLAIN)
+
+    return {
+        'type': 'excel',
+        'sheets': {
+            'Sheet1': {
+                'columns': [f'Column {j}' for j in range(cols)],
+                'rows': [[cell(j) for j in range(cols)] for _ in range(rows)],
+                'row_count': rows,
+            },
+        },
+    }
+
+
+def timed(fn, payload):
+    started = time.perf_counter()
+    result = fn(payload)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--cols', type=int, default=20)
+    parser.add_argument('--dirty', type=float, default=0.01, help='share of text cells needing sanitization')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    payload = make_payload(args.rows, args.cols, args.dirty)
+    cells = args.rows * args.cols
+    print(f"{cells:,} cells ({args.rows:,} rows x {args.cols} cols), {args.dirty:.1%} of text cells dirty")
+
+    best = {}
+    for _ in range(args.repeat):
+        elapsed, expected = timed(legacy_sanitize_extracted_data, payload)
+        best['legacy'] = min(best.get('legacy', elapsed), elapsed)
+        # The new one works in place, so give it a fresh copy each time
+        fresh = copy.deepcopy(payload)
+        elapsed, result = timed(sanitize_extracted_data, fresh)
+        best['current'] = min(best.get('current', elapsed), elapsed)
+
+    assert result == expected, "implementations disagree"
+    for label, elapsed in best.items():
+        print(f"{label:<8} {elapsed:8.3f}s  {cells / elapsed / 1e6:6.2f} M cells/s")
+    print(f"speedup  {best['legacy'] / best['current']:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Columnar sheet store against JSON for a large extracted sheet.
+
+Builds an in-memory spreadsheet extraction with --rows x --cols cells (ints,
+floats, dates, short strings, some blanks) and compares it stored as JSON
+in ExtractedData.data (the previous format) with the sheet store: bytes on
+disk, write time, time to read every row back, and time to read one page of
+rows or one column.
+
+Run from the project root:
+
+    python benchmarks/bench_sheet_store.py --rows 200000 --cols 10
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scrap_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import override_settings  # noqa: E402
+
+from data_capture.sheetstore import load_sheets, open_sheets, store_sheets  # noqa: E402
+
+WORDS = ['Dublin', 'Cork', 'invoice', 'paid', 'pending', 'John Smith', 'EUR']
+
+
+def make_payload(rows: int, cols: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    start = datetime.datetime(2020, 1, 1)
+
+    def cell(j):
+        if rng.random() < 0.05:
+            return None
+        kind = j % 4
+        if kind == 0:
+            return rng.randint(0, 10 ** 6)
+        if kind == 1:
+            return round(rng.random() * 1000, 2)
+        if kind == 2:
+            return start + datetime.timedelta(days=rng.randint(0, 2000))
+        return rng.choice(WORDS)
+
+    return {
+        'type': 'excel',
+        'sheets': {
+            'Sheet1': {
+                'columns': [f'Column {j}' for j in range(cols)],
+                'rows': [[cell(j) for j in range(cols)] for _ in range(rows)],
+                'row_count': rows,
+            },
+        },
+    }
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--cols', type=int, default=10)
+    args = parser.parse_args()
+
+    payload = make_payload(args.rows, args.cols)
+    print(f"{args.rows * args.cols:,} cells ({args.rows:,} rows x {args.cols} cols)")
+
+    write_json, data_json = timed(lambda: json.dumps(payload, default=str))
+    read_json, _ = timed(lambda: json.loads(data_json))
+
+    with tempfile.TemporaryDirectory() as tmp, override_settings(SHEET_STORE_DIR=tmp):
+        write_store, summary = timed(lambda: json.dumps(store_sheets(payload)))
+        size = os.path.getsize(os.path.join(tmp, json.loads(summary)['file'])) + len(summary)
+        read_store, restored = timed(lambda: load_sheets(json.loads(summary)))
+        with open_sheets(json.loads(summary)) as sheets:
+            page, _ = timed(lambda: sheets.read_rows('Sheet1', args.rows // 2, args.rows // 2 + 50))
+            column, _ = timed(lambda: sheets.read_column('Sheet1', 0))
+
+    expected = json.loads(json.dumps(payload, default=str))
+    assert json.loads(json.dumps(restored, default=str)) == expected, "round trip differs"
+
+    print(f"{'':<12} {'bytes':>12} {'write':>9} {'read all':>9}")
+    print(f"{'json':<12} {len(data_json):>12,} {write_json:>8.2f}s {read_json:>8.2f}s")
+    print(f"{'sheet store':<12} {size:>12,} {write_store:>8.2f}s {read_store:>8.2f}s")
+    print(f"size {len(data_json) / size:.1f}x smaller; "
+          f"50 rows from the middle {page * 1000:.1f} ms, one whole column {column * 1000:.1f} ms "
+          f"(JSON has to parse everything: {read_json * 1000:.0f} ms)")
+
+
+if __name__ == '__main__':
+    main()
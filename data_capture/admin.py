@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import DataSource, ExtractedData, ContactMessage, AuditLog
+from .models import DataSource, ExtractedData, ContactMessage, AuditLog, ExtractionJob, UploadSession, ScanVerdict, WebPageCache
 
 
 @admin.register(DataSource)
@@ -46,7 +46,7 @@ class ExtractedDataAdmin(admin.ModelAdmin):
     )
     list_filter = ('created_at', 'user')
     search_fields = ('data', 'content_hash', 'source__file_name', 'user__username')
-    readonly_fields = ('content_hash', 'created_at')
+    readonly_fields = ('content_hash', 'extractor_version', 'created_at')
 
     fieldsets = (
         (None, {
@@ -56,7 +56,7 @@ class ExtractedDataAdmin(admin.ModelAdmin):
             'fields': ('data',),
         }),
         ('Security / Integrity', {
-            'fields': ('content_hash',),
+            'fields': ('content_hash', 'extractor_version'),
         }),
         ('Timestamps', {
             'fields': ('created_at',),
@@ -83,3 +83,34 @@ class AuditLogAdmin(admin.ModelAdmin):
     list_filter = ('action', 'created_at', 'user')
     search_fields = ('message', 'user__username', 'ip_address', 'user_agent')
     readonly_fields = ('created_at', 'user', 'action', 'message', 'ip_address', 'user_agent')
+
+
+@admin.register(ExtractionJob)
+class ExtractionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'file_name', 'source_type', 'user', 'status', 'dedup_hit', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'source_type', 'dedup_hit', 'created_at')
+    search_fields = ('file_name', 'user__username', 'detail')
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'source', 'metrics')
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'file_name', 'source_type', 'user', 'status', 'offset', 'total_size', 'updated_at')
+    list_filter = ('status', 'source_type')
+    search_fields = ('file_name', 'user__username')
+    readonly_fields = ('offset', 'staging_path', 'job', 'created_at', 'updated_at')
+
+
+@admin.register(ScanVerdict)
+class ScanVerdictAdmin(admin.ModelAdmin):
+    list_display = ('file_hash', 'signature_version', 'is_clean', 'hits', 'created_at')
+    list_filter = ('is_clean', 'signature_version')
+    search_fields = ('file_hash', 'detail')
+    readonly_fields = ('created_at',)
+
+
+@admin.register(WebPageCache)
+class WebPageCacheAdmin(admin.ModelAdmin):
+    list_display = ('url', 'etag', 'last_modified', 'hits', 'fetched_at')
+    search_fields = ('url',)
+    readonly_fields = ('url_hash', 'body_hash', 'fetched_at')
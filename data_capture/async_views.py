@@ -0,0 +1,158 @@
+"""
+Native async versions of the dashboard, upload and detail views.
+
+Served under /async/ and meant for an ASGI server (``scrap_project.asgi``).
+Database reads use the async ORM; an upload runs the same pipeline stages
+as the WSGI views and the worker (``pipeline.inline_pipeline``) through
+Pipeline.arun(), which awaits the malware scanner and the extraction pool
+and keeps the stages that use the DB on the request's thread, so the event
+loop keeps serving other requests while the file is streamed, scanned and
+extracted.
+
+Unlike the WSGI upload views these process the file inline and return the
+result, because holding a slow request open is cheap here.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, JsonResponse
+from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.middleware.csrf import CsrfViewMiddleware
+
+from .models import DataSource
+from .pipeline import Upload, inline_pipeline
+from .sheetstore import load_sheets
+from .uploadhandlers import discard_uploaded_files
+from .views import source_detail_context, pending_jobs_for
+
+
+# Django 4.2's login_required/csrf_exempt wrap views in sync functions,
+# which would turn these coroutines into sync views. These keep them async.
+
+async def _is_authenticated(request) -> bool:
+    # Loading the session/user hits the database
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+def async_login_required(view_func):
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        if not await _is_authenticated(request):
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def async_api_login_required(view_func):
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        if not await _is_authenticated(request):
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def async_csrf_exempt(view_func):
+    view_func.csrf_exempt = True
+    return view_func
+
+
+def _result_data(upload):
+    """The extracted data to return for a processed or duplicate upload."""
+    if upload.reused is not None:
+        return load_sheets(json.loads(upload.reused.data))
+    return load_sheets(upload.extracted_data)
+
+
+@async_login_required
+async def home(request):
+    """Dashboard – show tools + recent uploads for this user."""
+    sources = [
+        source async for source in
+        DataSource.objects
+        .filter(user=request.user)
+        .order_by('-created_at')
+        .prefetch_related('extracted_items')
+    ]
+    pending_jobs = [job async for job in pending_jobs_for(request.user)]
+
+    # Rendering reads the session (messages) and is CPU work: keep it off the loop
+    return await sync_to_async(render)(request, 'data_capture/home.html', {
+        'sources': sources,
+        'pending_jobs': pending_jobs,
+        'upload_url': reverse('async_upload_file'),
+    })
+
+
+@async_csrf_exempt
+@async_login_required
+async def upload_file(request):
+    """Upload, scan, sanitize and extract one file, then go back to the dashboard."""
+    if request.method != 'POST':
+        return redirect('async_home')
+
+    # The streaming handler must be in place before the body is parsed, which
+    # is why CSRF is checked here rather than by the middleware.
+    upload = Upload.from_request(request)
+    refused = await sync_to_async(_csrf_refusal, thread_sensitive=False)(request)
+    if refused is not None:
+        # The check streamed the body to disk to read the token
+        await sync_to_async(discard_uploaded_files, thread_sensitive=False)(request)
+        return refused
+
+    await inline_pipeline.arun(upload)
+
+    if upload.status in (Upload.PROCESSED, Upload.DUPLICATE):
+        messages.success(request, 'File uploaded successfully.')
+    else:
+        messages.error(request, upload.detail)
+    return redirect('async_home')
+
+
+def _csrf_refusal(request):
+    """The 403 response if the request fails the CSRF check, else None."""
+    middleware = CsrfViewMiddleware(lambda request: None)
+    middleware.process_request(request)
+    return middleware.process_view(request, None, (), {})
+
+
+@async_csrf_exempt
+@async_api_login_required
+async def api_upload_file(request):
+    """JSON upload API that processes the file inline and returns the extracted data."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    upload = await inline_pipeline.arun(Upload.from_request(request))
+
+    if upload.status == Upload.REJECTED:
+        return JsonResponse({'error': upload.detail}, status=400)
+    if upload.status == Upload.BLOCKED:
+        return JsonResponse({'error': upload.detail}, status=422)
+    if upload.status == Upload.FAILED:
+        return JsonResponse({'error': upload.detail}, status=500)
+
+    return JsonResponse({
+        'message': 'File uploaded and processed successfully',
+        'source_id': upload.data_source.id,
+        'job_id': upload.job.id,
+        'status': upload.status,
+        'data': await sync_to_async(_result_data)(upload),
+    })
+
+
+@async_login_required
+async def source_detail(request, pk):
+    """Show one upload with its extracted data, nicely formatted per type."""
+    source = await DataSource.objects.filter(pk=pk, user=request.user).afirst()
+    if source is None:
+        raise Http404("No DataSource matches the given query.")
+
+    extracted_obj = await source.extracted_items.defer('data').order_by('-created_at').afirst()
+
+    context = await sync_to_async(source_detail_context)(source, extracted_obj, request.GET)
+    return await sync_to_async(render)(request, 'data_capture/source_detail.html', context)
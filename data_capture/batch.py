@@ -0,0 +1,178 @@
+"""
+Synchronous multi-file ingest for api_upload_batch.
+
+Files are processed concurrently on a bounded thread pool (the CPU-heavy
+extraction itself runs on the engine's process pools), and all resulting
+rows are written with one bulk INSERT per table.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import DataSource, ExtractedData, ExtractedPage, AuditLog
+from .pages import build_pages, INSERT_BATCH_SIZE
+from .pipeline import Upload, analysis_pipeline
+from .security import build_audit_event
+from .sheetstore import ensure_sheets
+from .storage import remove_file
+from .utils import EXTRACTOR_VERSIONS
+
+DEFAULT_BATCH_WORKERS = 8
+
+
+def _reusable_extractions(keys):
+    """{(file_hash, source_type): ExtractedData} for earlier identical clean uploads, in one query."""
+    hashes = {file_hash for file_hash, _ in keys}
+    found = {}
+    candidates = (
+        ExtractedData.objects
+        .filter(source__file_hash__in=hashes, source__scanned_clean=True)
+        .exclude(source__stored_name='')
+        .select_related('source')
+        .order_by('-created_at')
+    )
+    for item in candidates:
+        key = (item.source.file_hash, item.source.source_type)
+        if key in keys and key not in found and item.extractor_version == EXTRACTOR_VERSIONS.get(key[1], ''):
+            found[key] = item
+    return found
+
+
+def _analyze(request, file_path, source_type, file_name, file_hash) -> Upload:
+    upload = Upload(request.user, source_type, file_name, file_path, file_hash)
+    try:
+        return analysis_pipeline.run(upload)
+    finally:
+        # The scan cache may have opened a connection on this pool thread
+        connection.close()
+
+
+def process_batch(request, files):
+    """
+    Process `files` ([(file_name, file_path, source_type, file_hash), ...]).
+
+    Returns one result dict per file, in input order.
+    """
+    keys = {(file_hash, source_type) for _, _, source_type, file_hash in files}
+    reusable = _reusable_extractions(keys)
+    for (_, source_type), existing in reusable.items():
+        # Saved before the sheet store: move its rows in once, so the copies share the store file
+        if source_type == 'excel' and ensure_sheets(existing) is not None:
+            existing.refresh_from_db(fields=['data', 'content_hash'])
+
+    # Identical files inside the batch are only analyzed once
+    to_analyze = {}
+    for file_name, file_path, source_type, file_hash in files:
+        key = (file_hash, source_type)
+        if key not in reusable and key not in to_analyze:
+            to_analyze[key] = (file_path, source_type, file_name, file_hash)
+
+    workers = getattr(settings, 'BATCH_UPLOAD_WORKERS', DEFAULT_BATCH_WORKERS)
+    analyzed = {}
+    if to_analyze:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(to_analyze)))) as pool:
+            futures = {key: pool.submit(_analyze, request, *args) for key, args in to_analyze.items()}
+            for key, future in futures.items():
+                try:
+                    analyzed[key] = future.result()
+                except Exception as e:
+                    file_path, source_type, file_name, file_hash = to_analyze[key]
+                    failed = Upload(request.user, source_type, file_name, file_path, file_hash)
+                    failed.audit('extraction_failed', f"{file_name}: {e}")
+                    failed.halt(Upload.FAILED, f"Processing error: {e}")
+                    analyzed[key] = failed
+
+    # --------- Build all rows, then insert them in bulk ----------
+    results = []
+    sources = []
+    pending_data = []   # (DataSource, entry, data_json, content_hash, extractor_version, extracted data or None)
+    audit_entries = []
+    first_seen = set()
+
+    for file_name, file_path, source_type, file_hash in files:
+        key = (file_hash, source_type)
+        entry = {'file_name': file_name, 'source_type': source_type, 'source_id': None}
+
+        if key in reusable:
+            existing = reusable[key]
+            # A PDF copy gets its own pages, written with the fresh ones below
+            pages = json.loads(existing.data) if source_type == 'pdf' else None
+            data = (existing.data, existing.content_hash, existing.extractor_version, pages)
+            stored_name, scanned_clean = existing.source.stored_name, existing.source.scanned_clean
+            entry.update(status='duplicate', detail='Identical to an earlier upload; extraction reused.', timings={}, metrics=[])
+            audit_entries.append(build_audit_event(
+                request, 'extraction_reused', f"{file_name}: identical to source #{existing.source_id}."
+            ))
+        else:
+            result = analyzed[key]
+            entry.update(
+                status=result.status if key not in first_seen else 'duplicate',
+                detail=result.detail,
+                timings={stage: round(seconds, 4) for stage, seconds in result.timings.items()},
+                metrics=result.metrics,
+            )
+            if key not in first_seen:
+                audit_entries.extend(build_audit_event(request, action, message) for action, message in result.audit_events)
+            first_seen.add(key)
+            if result.status != Upload.PROCESSED:
+                entry['status'] = result.status
+                results.append(entry)
+                if file_path != to_analyze[key][0]:
+                    remove_file(file_path)
+                continue
+            data = (result.data_json, result.content_hash, EXTRACTOR_VERSIONS.get(source_type, ''), result.extracted_data)
+            stored_name, scanned_clean = os.path.basename(result.file_path), result.scanned_clean
+
+        if os.path.basename(file_path) != stored_name:
+            # A duplicate: the raw copy was never scanned or sanitized, share the stored file instead
+            remove_file(file_path)
+
+        source = DataSource(
+            user=request.user,
+            source_type=source_type,
+            file_name=file_name,
+            file_hash=file_hash,
+            stored_name=stored_name,
+            scanned_clean=scanned_clean,
+        )
+        sources.append(source)
+        pending_data.append((source, entry) + data)
+        results.append(entry)
+
+    with transaction.atomic():
+        DataSource.objects.bulk_create(sources)
+        extracted_rows = ExtractedData.objects.bulk_create([
+            ExtractedData(
+                source=source,
+                user=request.user,
+                data=data_json,
+                content_hash=content_hash,
+                extractor_version=extractor_version,
+                paged=source.source_type == 'pdf' and extracted_data is not None,
+            )
+            for source, _, data_json, content_hash, extractor_version, extracted_data in pending_data
+        ])
+        ExtractedPage.objects.bulk_create([
+            page
+            for extracted, (*_, extracted_data) in zip(extracted_rows, pending_data)
+            if extracted.paged
+            for page in build_pages(extracted, extracted_data)
+        ], batch_size=INSERT_BATCH_SIZE)
+        AuditLog.objects.bulk_create(audit_entries)
+
+    for source, entry, *_ in pending_data:
+        entry['source_id'] = source.pk
+
+    return results
+
+
+def summarize(results, started: float) -> dict:
+    summary = {}
+    for entry in results:
+        summary[entry['status']] = summary.get(entry['status'], 0) + 1
+    summary['elapsed'] = round(time.perf_counter() - started, 4)
+    return summary
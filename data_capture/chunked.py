@@ -0,0 +1,256 @@
+"""
+Resumable (chunked) uploads.
+
+Protocol, all JSON, under /api/uploads/:
+
+    POST   uploads/                    {file_name, source_type, total_size} -> session id
+    PUT    uploads/<id>/               raw bytes, Content-Range: bytes a-b/total
+    GET    uploads/<id>/               -> current offset (where to resume)
+    DELETE uploads/<id>/               abort and delete the staging file
+    POST   uploads/<id>/finalize/      -> hands the file to the extraction queue
+
+Chunks are appended to a staging file while a running SHA-256 is kept per
+session, so finalizing a multi-GB upload does not need to re-read it.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadSession
+from .security import detect_file_type, SNIFF_BYTES
+from .storage import new_stored_path, upload_dir
+
+DEFAULT_MAX_CHUNK_SIZE = 16 * 1024 * 1024        # 16 MB
+DEFAULT_MAX_UPLOAD_SIZE = 4 * 1024 * 1024 * 1024  # 4 GB
+READ_BLOCK_SIZE = 1024 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class ChunkError(Exception):
+    """A chunk or finalize request that can't be accepted; carries an HTTP status."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+# Running hashes keyed by session id: {id: (offset, sha256)}. They live in
+# this process only; if a session moves between processes (or the server
+# restarts) finalize() falls back to hashing the staging file.
+_MAX_CACHED_HASHERS = 256
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def _cached_hasher(session_id, offset):
+    with _hashers_lock:
+        entry = _hashers.get(session_id)
+        if entry and entry[0] == offset:
+            _hashers.move_to_end(session_id)
+            return entry[1].copy()
+    if offset == 0:
+        return hashlib.sha256()
+    return None
+
+
+def _store_hasher(session_id, offset, hasher):
+    with _hashers_lock:
+        _hashers[session_id] = (offset, hasher)
+        _hashers.move_to_end(session_id)
+        while len(_hashers) > _MAX_CACHED_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def _drop_hasher(session_id):
+    with _hashers_lock:
+        _hashers.pop(session_id, None)
+
+
+def staging_dir():
+    path = upload_dir() / '.sessions'
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def max_chunk_size():
+    return getattr(settings, 'UPLOAD_CHUNK_MAX_SIZE', DEFAULT_MAX_CHUNK_SIZE)
+
+
+def max_upload_size():
+    return getattr(settings, 'UPLOAD_SESSION_MAX_SIZE', DEFAULT_MAX_UPLOAD_SIZE)
+
+
+def create_session(user, file_name: str, source_type: str, total_size: int) -> UploadSession:
+    if total_size <= 0:
+        raise ChunkError("total_size must be a positive number of bytes.")
+    if total_size > max_upload_size():
+        raise ChunkError("File is larger than the maximum allowed upload size.", status=413)
+
+    session = UploadSession(
+        user=user,
+        file_name=os.path.basename(file_name),
+        source_type=source_type,
+        total_size=total_size,
+    )
+    session.staging_path = str(staging_dir() / f"{session.id}.part")
+    open(session.staging_path, 'wb').close()
+    session.save()
+    return session
+
+
+def parse_content_range(header: str, total_size: int):
+    """Return (start, length) from a 'bytes a-b/total' header."""
+    match = CONTENT_RANGE_RE.match(header.strip())
+    if not match:
+        raise ChunkError("Invalid Content-Range header, expected 'bytes start-end/total'.")
+    start, end, total = match.groups()
+    start, end = int(start), int(end)
+    if end < start:
+        raise ChunkError("Invalid Content-Range: end is before start.")
+    if total != '*' and int(total) != total_size:
+        raise ChunkError("Content-Range total does not match the session size.")
+    return start, end - start + 1
+
+
+def append_chunk(session: UploadSession, stream, start: int, length: int) -> int:
+    """
+    Write `length` bytes from `stream` at `start` and return the new offset.
+
+    Only the chunk at the current offset is accepted. Writing is done with
+    seek+write, so a client that retries a chunk it already sent cannot
+    corrupt the file; the conditional UPDATE makes sure the offset only
+    advances once.
+    """
+    if session.status != UploadSession.STATUS_ACTIVE:
+        raise ChunkError("Upload session is not accepting chunks.", status=409)
+    if start != session.offset:
+        raise ChunkError("Chunk does not start at the current offset.", status=409, offset=session.offset)
+    if length <= 0:
+        raise ChunkError("Empty chunk.")
+    if length > max_chunk_size():
+        raise ChunkError("Chunk is larger than the maximum chunk size.", status=413)
+    if start + length > session.total_size:
+        raise ChunkError("Chunk goes past the declared total size.")
+
+    hasher = _cached_hasher(session.id, start)
+
+    received = 0
+    with open(session.staging_path, 'r+b') as f:
+        f.seek(start)
+        while received < length:
+            block = stream.read(min(READ_BLOCK_SIZE, length - received))
+            if not block:
+                break
+            f.write(block)
+            if hasher is not None:
+                hasher.update(block)
+            received += len(block)
+
+    if received != length:
+        # Connection dropped mid-chunk: the offset is not advanced, the client resends
+        raise ChunkError("Chunk body shorter than declared.", offset=session.offset)
+
+    new_offset = start + length
+    advanced = (
+        UploadSession.objects
+        .filter(pk=session.pk, offset=start, status=UploadSession.STATUS_ACTIVE)
+        .update(offset=new_offset, updated_at=timezone.now())
+    )
+    if not advanced:
+        session.refresh_from_db()
+        raise ChunkError("Chunk was already received.", status=409, offset=session.offset)
+
+    session.offset = new_offset
+    if hasher is not None:
+        _store_hasher(session.id, new_offset, hasher)
+    return new_offset
+
+
+def _hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def complete_session(session: UploadSession, enqueue):
+    """
+    Check a fully received session, move its file into the uploads folder
+    and hand it to `enqueue(final_path, sha256)`, which returns the
+    ExtractionJob. Returns the job.
+
+    The session is claimed with a conditional UPDATE, so of two concurrent
+    finalize requests only one gets past it; the claim, the job and the
+    file move succeed or fail together.
+    """
+    if session.status != UploadSession.STATUS_ACTIVE:
+        raise ChunkError("Upload session is already finalized.", status=409)
+    if session.offset != session.total_size:
+        raise ChunkError("Upload is incomplete.", status=409, offset=session.offset)
+
+    try:
+        with open(session.staging_path, 'rb') as f:
+            header = f.read(SNIFF_BYTES)
+        if detect_file_type(header) != session.source_type:
+            raise ChunkError(f"File content does not look like a valid {session.source_type.upper()} file.")
+        hasher = _cached_hasher(session.id, session.offset)
+        file_hash = hasher.hexdigest() if hasher is not None else _hash_file(session.staging_path)
+    except FileNotFoundError:
+        # Moved by a concurrent finalize, or lost
+        session.refresh_from_db()
+        if session.status != UploadSession.STATUS_ACTIVE:
+            raise ChunkError("Upload session is already finalized.", status=409)
+        abort_session(session)
+        raise ChunkError("The uploaded data is gone; start a new upload.", status=409)
+
+    final_path = new_stored_path(session.file_name)
+    with transaction.atomic():
+        claimed = (
+            UploadSession.objects
+            .filter(pk=session.pk, status=UploadSession.STATUS_ACTIVE, offset=session.total_size)
+            .update(status=UploadSession.STATUS_COMPLETE, updated_at=timezone.now())
+        )
+        if not claimed:
+            raise ChunkError("Upload session is already finalized.", status=409)
+        job = enqueue(str(final_path), file_hash)
+        UploadSession.objects.filter(pk=session.pk).update(job=job)
+        # Last, so that a failed move rolls the claim and the job back
+        try:
+            os.replace(session.staging_path, final_path)
+        except OSError as e:
+            raise ChunkError(f"Could not store the upload: {e}", status=500)
+
+    session.status = UploadSession.STATUS_COMPLETE
+    session.job = job
+    _drop_hasher(session.id)
+    return job
+
+
+def abort_session(session: UploadSession):
+    _drop_hasher(session.id)
+    try:
+        os.remove(session.staging_path)
+    except OSError:
+        pass
+    session.status = UploadSession.STATUS_ABORTED
+    session.save(update_fields=['status', 'updated_at'])
+
+
+def purge_stale_sessions(max_age) -> int:
+    """Abort active sessions that have not received a chunk for `max_age`."""
+    cutoff = timezone.now() - max_age
+    stale = UploadSession.objects.filter(status=UploadSession.STATUS_ACTIVE, updated_at__lt=cutoff)
+    count = 0
+    for session in stale:
+        abort_session(session)
+        count += 1
+    return count
@@ -0,0 +1,178 @@
+"""
+Client for a running clamd daemon.
+
+clamscan loads the whole signature database on every call; clamd keeps it
+in memory, so scanning through it costs a socket round trip instead of
+seconds. Files are streamed with INSTREAM (clamd does not need access to our
+filesystem) over connections opened in IDSESSION mode, which clamd keeps
+open between commands. Idle connections are kept in a small pool.
+"""
+import socket
+import struct
+import threading
+
+from django.conf import settings
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_PORT = 3310
+
+
+class ClamdError(Exception):
+    """clamd could not be reached or the connection broke."""
+
+
+class ClamdConnection:
+    """One socket in IDSESSION mode."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._buffer = b''
+        self._next_id = 1
+        self.sock.sendall(b'zIDSESSION\0')
+
+    def command(self, name: bytes, chunks=None) -> str:
+        """Send a command (and an INSTREAM body) and return clamd's reply."""
+        request_id = self._next_id
+        self._next_id += 1
+        try:
+            self.sock.sendall(b'z' + name + b'\0')
+            if chunks is not None:
+                for chunk in chunks:
+                    self.sock.sendall(struct.pack('!L', len(chunk)) + chunk)
+                self.sock.sendall(struct.pack('!L', 0))
+        except OSError:
+            # clamd hangs up mid-stream when StreamMaxLength is exceeded, but
+            # still sends its reply first
+            if chunks is None:
+                raise
+
+        reply = self._read_reply()
+        prefix = f"{request_id}: "
+        return reply[len(prefix):] if reply.startswith(prefix) else reply
+
+    def _read_reply(self) -> str:
+        while b'\0' not in self._buffer:
+            data = self.sock.recv(4096)
+            if not data:
+                raise ClamdError("clamd closed the connection.")
+            self._buffer += data
+        reply, _, self._buffer = self._buffer.partition(b'\0')
+        return reply.decode('utf-8', 'replace')
+
+    def close(self):
+        try:
+            self.sock.sendall(b'zEND\0')
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class ClamdClient:
+    """Thread-safe clamd client with a pool of idle session connections."""
+
+    def __init__(self, socket_path=None, host=None, port=DEFAULT_PORT, timeout=60, pool_size=4):
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> ClamdConnection:
+        try:
+            if self.socket_path:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+            else:
+                sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            return ClamdConnection(sock)
+        except OSError as e:
+            raise ClamdError(f"Cannot connect to clamd: {e}")
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _release(self, conn: ClamdConnection):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _run(self, name: bytes, chunks_factory=None) -> str:
+        while True:
+            conn, reused = self._acquire()
+            try:
+                reply = conn.command(name, chunks_factory() if chunks_factory else None)
+            except (OSError, ClamdError) as e:
+                conn.close()
+                if reused:
+                    # clamd drops sessions that sat idle too long; retry on a fresh one
+                    continue
+                raise ClamdError(f"clamd connection failed: {e}")
+
+            if reply.endswith('ERROR'):
+                # clamd ends the session after an error
+                conn.close()
+            else:
+                self._release(conn)
+            return reply
+
+    def ping(self) -> bool:
+        return self._run(b'PING') == 'PONG'
+
+    def version(self) -> str:
+        return self._run(b'VERSION')
+
+    def scan_file(self, file_path: str):
+        """
+        Stream `file_path` to clamd. Same (status, detail) values as
+        security.scan_file_for_malware(); raises ClamdError if clamd is down.
+        """
+        with open(file_path, 'rb') as f:
+            def chunks():
+                f.seek(0)
+                return iter(lambda: f.read(CHUNK_SIZE), b'')
+
+            reply = self._run(b'INSTREAM', chunks)
+
+        if reply.endswith(' FOUND'):
+            return False, reply
+        if reply.endswith('OK'):
+            return True, "File is clean (clamd)."
+        return None, f"clamd error: {reply}"
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_clamd_client():
+    """The process-wide client, or None when no clamd is configured."""
+    global _client
+    socket_path = getattr(settings, 'CLAMD_SOCKET', '')
+    host = getattr(settings, 'CLAMD_HOST', '')
+    if not socket_path and not host:
+        return None
+
+    with _client_lock:
+        if _client is None:
+            _client = ClamdClient(
+                socket_path=socket_path or None,
+                host=host or None,
+                port=getattr(settings, 'CLAMD_PORT', DEFAULT_PORT),
+                timeout=getattr(settings, 'CLAMD_TIMEOUT', 60),
+                pool_size=getattr(settings, 'CLAMD_POOL_SIZE', 4),
+            )
+        return _client
@@ -0,0 +1,314 @@
+"""
+Shared process-pool engine for the CPU-bound extractors in ``utils``.
+
+Each source type gets its own bounded ``ProcessPoolExecutor`` so a flood of
+OCR jobs cannot starve PDF extraction (and vice versa). Every task has a hard
+timeout, and a worker that crashes or hangs only takes its own pool down: the
+pool is torn down and rebuilt, and any sibling task that was caught in the
+crash is retried once on the fresh pool.
+
+Large PDFs are split into page ranges (see ``utils.plan_pdf_shards``) that
+run as separate tasks on the PDF pool and are merged back in page order.
+Scanned pages found in a PDF are then rendered and OCRed in batches on the
+image pool (see ``FOLLOWUPS``), so text-layer pages never pay for OCR.
+"""
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, TimeoutError as FuturesTimeout, wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+
+from .utils import (
+    extract_pdf_text,
+    extract_pdf_pages,
+    plan_pdf_shards,
+    merge_pdf_shards,
+    plan_pdf_ocr,
+    ocr_pdf_pages,
+    merge_pdf_ocr,
+    extract_excel_data,
+    extract_image_data,
+)
+
+
+EXTRACTORS = {
+    'pdf': extract_pdf_text,
+    'excel': extract_excel_data,
+    'image': extract_image_data,
+}
+
+# source_type -> (plan, extract_shard, merge). plan(file_path) runs in the
+# caller and returns the argument tuples for extract_shard, or None to
+# extract the file in a single task; merge() gets the shard results in order.
+SHARDED_EXTRACTORS = {
+    'pdf': (plan_pdf_shards, extract_pdf_pages, merge_pdf_shards),
+}
+
+# source_type -> (pool, plan, run, merge): a second pass over the extracted
+# result. plan(file_path, result) runs in the caller and returns the argument
+# tuples for run(), which runs on `pool`'s workers; merge(result, outputs)
+# gets the outputs in order (empty when plan() found nothing to do).
+FOLLOWUPS = {
+    'pdf': ('image', plan_pdf_ocr, ocr_pdf_pages, merge_pdf_ocr),
+}
+
+DEFAULT_TASK_TIMEOUT = 300  # seconds
+
+
+class ExtractionError(Exception):
+    """Raised when the engine could not produce a result for a file."""
+
+
+class ExtractionTimeout(ExtractionError):
+    pass
+
+
+class ExtractionCrashed(ExtractionError):
+    pass
+
+
+class ExtractionEngine:
+    """Per-source-type process pools with hard timeouts and crash isolation."""
+
+    def __init__(self, extractors=None, max_workers=None, timeout=DEFAULT_TASK_TIMEOUT, mp_context='spawn',
+                 sharded=None, shard_workers=None, followups=None):
+        self.extractors = dict(extractors or EXTRACTORS)
+        # {source_type: worker count}; 0 runs the extractor in-process
+        self.max_workers = dict(max_workers or {})
+        self.sharded = dict(SHARDED_EXTRACTORS if sharded is None else sharded)
+        # {source_type: shards of one file in flight at once}; default: the pool size
+        self.shard_workers = dict(shard_workers or {})
+        self.followups = dict(FOLLOWUPS if followups is None else followups)
+        self.timeout = timeout
+        self.mp_context = mp_context
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _workers_for(self, source_type: str) -> int:
+        default = max(1, (os.cpu_count() or 2) // 2)
+        return self.max_workers.get(source_type, default)
+
+    def _get_pool(self, source_type: str) -> ProcessPoolExecutor:
+        with self._lock:
+            pool = self._pools.get(source_type)
+            if pool is None:
+                pool = ProcessPoolExecutor(
+                    max_workers=self._workers_for(source_type),
+                    mp_context=multiprocessing.get_context(self.mp_context),
+                    # utils imports the models (the sheet store, sanitizing), so a
+                    # spawned worker needs the app registry before its first task
+                    initializer=django.setup,
+                )
+                self._pools[source_type] = pool
+            return pool
+
+    def _discard_pool(self, source_type: str, pool: ProcessPoolExecutor, kill: bool = False):
+        """Drop a broken/hung pool so the next task gets a fresh one."""
+        with self._lock:
+            if self._pools.get(source_type) is pool:
+                del self._pools[source_type]
+
+        if kill:
+            # A hung worker never returns, so shutdown() alone would not free it.
+            for proc in list((getattr(pool, '_processes', None) or {}).values()):
+                try:
+                    proc.terminate()
+                except Exception:
+                    pass
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def extract(self, source_type: str, file_path: str, timeout=None):
+        """Run the extractor for `source_type` on `file_path` and return its result."""
+        try:
+            func = self.extractors[source_type]
+        except KeyError:
+            raise ExtractionError(f"No extractor for source type '{source_type}'.")
+
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        if self._workers_for(source_type) <= 0:
+            result = func(file_path)
+        else:
+            shards = self._plan_shards(source_type, file_path)
+            if shards:
+                result = self._extract_sharded(source_type, file_path, shards, timeout, deadline)
+            else:
+                result = self._extract_single(source_type, func, file_path, timeout)
+
+        return self._follow_up(source_type, file_path, result, timeout, deadline)
+
+    def _extract_single(self, source_type: str, func, file_path: str, timeout):
+        # Two attempts: a task may die because a *sibling* in the same pool
+        # crashed it. A file that crashes its worker twice is the culprit.
+        for _ in range(2):
+            pool = self._get_pool(source_type)
+            try:
+                future = pool.submit(func, file_path)
+                return future.result(timeout=timeout)
+            except FuturesTimeout:
+                self._discard_pool(source_type, pool, kill=True)
+                raise ExtractionTimeout(
+                    f"Extraction of {os.path.basename(file_path)} exceeded {timeout}s."
+                )
+            except BrokenProcessPool:
+                self._discard_pool(source_type, pool)
+
+        raise ExtractionCrashed(
+            f"Extractor process crashed while processing {os.path.basename(file_path)}."
+        )
+
+    async def extract_async(self, source_type: str, file_path: str, timeout=None):
+        """Like extract(), but awaits the worker instead of blocking a thread."""
+        try:
+            func = self.extractors[source_type]
+        except KeyError:
+            raise ExtractionError(f"No extractor for source type '{source_type}'.")
+
+        loop = asyncio.get_running_loop()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        if self._workers_for(source_type) <= 0:
+            result = await loop.run_in_executor(None, func, file_path)
+        else:
+            shards = await loop.run_in_executor(None, self._plan_shards, source_type, file_path)
+            if shards:
+                # Waiting on several shards is easier from a thread than the event loop
+                result = await loop.run_in_executor(
+                    None, self._extract_sharded, source_type, file_path, shards, timeout, deadline,
+                )
+            else:
+                result = await self._extract_single_async(source_type, func, file_path, timeout)
+
+        if source_type not in self.followups:
+            return result
+        return await loop.run_in_executor(
+            None, self._follow_up, source_type, file_path, result, timeout, deadline,
+        )
+
+    async def _extract_single_async(self, source_type: str, func, file_path: str, timeout):
+        loop = asyncio.get_running_loop()
+        for _ in range(2):
+            pool = self._get_pool(source_type)
+            try:
+                future = asyncio.wrap_future(pool.submit(func, file_path), loop=loop)
+                return await asyncio.wait_for(future, timeout=timeout)
+            except asyncio.TimeoutError:
+                self._discard_pool(source_type, pool, kill=True)
+                raise ExtractionTimeout(
+                    f"Extraction of {os.path.basename(file_path)} exceeded {timeout}s."
+                )
+            except BrokenProcessPool:
+                self._discard_pool(source_type, pool)
+
+        raise ExtractionCrashed(
+            f"Extractor process crashed while processing {os.path.basename(file_path)}."
+        )
+
+    def _plan_shards(self, source_type: str, file_path: str):
+        sharding = self.sharded.get(source_type)
+        if sharding is None:
+            return None
+        plan = sharding[0]
+        return plan(file_path)
+
+    def _extract_sharded(self, source_type: str, file_path: str, shards, timeout, deadline):
+        """Run every shard on the source type's pool and merge the results in shard order."""
+        _, extract_shard, merge = self.sharded[source_type]
+        return merge(self._run_tasks(source_type, extract_shard, file_path, shards, timeout, deadline))
+
+    def _follow_up(self, source_type: str, file_path: str, result, timeout, deadline):
+        """Apply the FOLLOWUPS entry for `source_type`, if any, to `result`."""
+        followup = self.followups.get(source_type)
+        if followup is None:
+            return result
+        pool_type, plan, run, merge = followup
+
+        tasks = plan(file_path, result)
+        if not tasks or self._workers_for(pool_type) <= 0:
+            return merge(result, [run(file_path, *args) for args in tasks or []])
+        return merge(result, self._run_tasks(pool_type, run, file_path, tasks, timeout, deadline))
+
+    def _run_tasks(self, pool_type: str, func, file_path: str, tasks, timeout, deadline):
+        """
+        Run func(file_path, *args) for every args tuple in `tasks` on the
+        `pool_type` pool, at most shard_workers at a time so one big file does
+        not queue ahead of everything else, and return the results in task
+        order. `deadline` (time.monotonic()) covers the whole file.
+        """
+        limit = max(1, self.shard_workers.get(pool_type) or self._workers_for(pool_type))
+        results = [None] * len(tasks)
+        done_tasks = set()
+
+        # As in extract(): a crash gets one retry on a fresh pool. Tasks that
+        # already finished are kept.
+        for _ in range(2):
+            pool = self._get_pool(pool_type)
+            todo = [i for i in range(len(tasks)) if i not in done_tasks]
+            pending = {}
+            try:
+                while todo or pending:
+                    while todo and len(pending) < limit:
+                        i = todo.pop(0)
+                        pending[pool.submit(func, file_path, *tasks[i])] = i
+                    finished, _ = futures_wait(pending, timeout=max(0, deadline - time.monotonic()),
+                                               return_when=FIRST_COMPLETED)
+                    if not finished:
+                        raise FuturesTimeout()
+                    for future in finished:
+                        i = pending.pop(future)
+                        results[i] = future.result()
+                        done_tasks.add(i)
+                return results
+            except FuturesTimeout:
+                self._discard_pool(pool_type, pool, kill=True)
+                raise ExtractionTimeout(
+                    f"Extraction of {os.path.basename(file_path)} exceeded {timeout}s."
+                )
+            except BrokenProcessPool:
+                self._discard_pool(pool_type, pool)
+
+        raise ExtractionCrashed(
+            f"Extractor process crashed while processing {os.path.basename(file_path)}."
+        )
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_extraction_engine() -> ExtractionEngine:
+    """Return the process-wide engine configured from settings."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ExtractionEngine(
+                max_workers=getattr(settings, 'EXTRACTION_WORKERS', None),
+                timeout=getattr(settings, 'EXTRACTION_TASK_TIMEOUT', DEFAULT_TASK_TIMEOUT),
+                shard_workers={'pdf': getattr(settings, 'PDF_SHARD_WORKERS', 0)},
+            )
+            atexit.register(_engine.shutdown, wait=False)
+        return _engine
+
+
+def run_extraction(source_type: str, file_path: str):
+    """Extract `file_path` on the shared engine."""
+    return get_extraction_engine().extract(source_type, file_path)
+
+
+async def arun_extraction(source_type: str, file_path: str):
+    """Async variant of run_extraction() for the async pipeline (ExtractStage.arun)."""
+    return await get_extraction_engine().extract_async(source_type, file_path)
@@ -0,0 +1,157 @@
+"""
+Metadata stripping for PNG and JPEG by rewriting the container.
+
+The compressed image data is copied through untouched; only metadata
+(text chunks, EXIF/XMP, comments, thumbnails) and anything after the end
+marker are dropped. Nothing is decoded, so this runs at disk speed even on
+huge images.
+
+Each stripper returns False when the file is not something it can rewrite
+safely (truncated, bad CRC, unexpected structure); the caller then falls
+back to a full re-encode.
+"""
+import mmap
+import struct
+import zlib
+
+COPY_CHUNK = 1024 * 1024
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Chunks that affect how the pixels look; every other ancillary chunk is dropped
+PNG_KEEP_CHUNKS = {
+    b'IHDR', b'PLTE', b'IDAT', b'IEND',
+    b'tRNS', b'gAMA', b'cHRM', b'sRGB', b'iCCP', b'sBIT', b'pHYs',
+}
+
+JPEG_SOI = b'\xff\xd8'
+JPEG_EOI = b'\xff\xd9'
+JPEG_SOS = 0xDA
+
+# APPn segments kept, by their identifier: JFIF header, colour profile, Adobe colour transform
+JPEG_KEEP_APP = {
+    0xE0: b'JFIF\x00',
+    0xE2: b'ICC_PROFILE\x00',
+    0xEE: b'Adobe',
+}
+
+
+def strip_png(f_in, f_out) -> bool:
+    if f_in.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+        return False
+    f_out.write(PNG_SIGNATURE)
+
+    while True:
+        header = f_in.read(8)
+        if len(header) < 8:
+            return False  # no IEND
+        length, chunk_type = struct.unpack('>I4s', header)
+        if length > 0x7FFFFFFF:
+            return False
+
+        if chunk_type not in PNG_KEEP_CHUNKS:
+            if not chunk_type[0] & 0x20:
+                return False  # unknown critical chunk
+            f_in.seek(length + 4, 1)
+            continue
+
+        f_out.write(header)
+        crc = zlib.crc32(chunk_type)
+        remaining = length
+        while remaining:
+            data = f_in.read(min(remaining, COPY_CHUNK))
+            if not data:
+                return False
+            crc = zlib.crc32(data, crc)
+            f_out.write(data)
+            remaining -= len(data)
+
+        stored = f_in.read(4)
+        if len(stored) < 4 or struct.unpack('>I', stored)[0] != crc:
+            return False
+        f_out.write(stored)
+
+        if chunk_type == b'IEND':
+            return True  # anything after IEND is dropped
+
+
+def _keep_jpeg_segment(marker: int, payload: bytes) -> bool:
+    if marker == 0xFE:  # COM
+        return False
+    if 0xE0 <= marker <= 0xEF:
+        identifier = JPEG_KEEP_APP.get(marker)
+        return identifier is not None and payload.startswith(identifier)
+    return True
+
+
+def _scan_end(data, pos: int) -> int:
+    """Offset of the first marker after the entropy-coded data starting at `pos`, or -1."""
+    size = len(data)
+    while True:
+        pos = data.find(b'\xff', pos)
+        if pos == -1 or pos + 1 >= size:
+            return -1
+        following = data[pos + 1]
+        if following == 0x00 or 0xD0 <= following <= 0xD7:
+            pos += 2  # stuffed byte or restart marker: still inside the scan
+        elif following == 0xFF:
+            pos += 1  # fill byte
+        else:
+            return pos
+
+
+def _copy(data, start: int, end: int, f_out):
+    for offset in range(start, end, COPY_CHUNK):
+        f_out.write(data[offset:min(end, offset + COPY_CHUNK)])
+
+
+def strip_jpeg(f_in, f_out) -> bool:
+    try:
+        data = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        return False  # empty file
+
+    with data:
+        size = len(data)
+        if data[:2] != JPEG_SOI:
+            return False
+        f_out.write(JPEG_SOI)
+        pos = 2
+
+        while True:
+            if pos + 2 > size or data[pos] != 0xFF:
+                return False
+            marker = data[pos + 1]
+            if marker == 0xFF:
+                pos += 1
+                continue
+            if marker == 0xD9:
+                f_out.write(JPEG_EOI)
+                return True  # anything after EOI is dropped
+            if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+                f_out.write(data[pos:pos + 2])
+                pos += 2
+                continue
+
+            if pos + 4 > size:
+                return False
+            length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+            end = pos + 2 + length
+            if length < 2 or end > size:
+                return False
+            if _keep_jpeg_segment(marker, data[pos + 4:pos + 4 + 16]):
+                _copy(data, pos, end, f_out)
+            pos = end
+
+            if marker == JPEG_SOS:
+                scan_end = _scan_end(data, pos)
+                if scan_end == -1:
+                    return False
+                _copy(data, pos, scan_end, f_out)
+                pos = scan_end
+
+
+STRIPPERS = {
+    'PNG': strip_png,
+    'JPEG': strip_jpeg,
+}
@@ -0,0 +1,246 @@
+"""
+Background extraction jobs.
+
+Views only validate the upload and put the bytes on disk; everything after
+that (malware scan, sanitization, hashing, extraction, DB writes) runs here,
+driven by the ``process_extraction_jobs`` management command.
+
+The stages themselves live in ``pipeline``. Website captures are queued the
+same way, one job per URL; a worker claiming one also claims the other
+pending captures (up to WEB_CAPTURE_WORKERS), so their pages are fetched
+concurrently.
+"""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import AuditLog, ExtractionJob
+from .pipeline import Upload, processing_pipeline
+from .security import build_audit_event, record_audit_event
+from .webcapture import DEFAULT_WEB_CAPTURE_WORKERS, capture_pages, save_capture
+
+# A running job's worker touches heartbeat_at every HEARTBEAT_INTERVAL
+# seconds, however long the job takes. A job whose heartbeat is older than
+# STALE_JOB_TIMEOUT belongs to a worker that died and is put back in the queue.
+HEARTBEAT_INTERVAL = 30
+STALE_JOB_TIMEOUT = timedelta(minutes=5)
+MAX_JOB_ATTEMPTS = 3
+
+
+def enqueue_extraction(request, file_path, file_name: str, source_type: str, file_hash: str = '') -> ExtractionJob:
+    """Create a pending job for a file that has already been saved to disk."""
+    ip = request.META.get('REMOTE_ADDR') or request.META.get('HTTP_X_FORWARDED_FOR')
+    return ExtractionJob.objects.create(
+        user=request.user,
+        source_type=source_type,
+        file_name=file_name,
+        file_path=str(file_path),
+        file_hash=file_hash,
+        ip_address=ip or None,
+        user_agent=request.META.get('HTTP_USER_AGENT', '')[:255],
+    )
+
+
+def enqueue_captures(request, urls) -> list:
+    """Create a pending website capture job for each of `urls` (already checked by clean_urls)."""
+    ip = request.META.get('REMOTE_ADDR') or request.META.get('HTTP_X_FORWARDED_FOR')
+    with transaction.atomic():
+        jobs = [
+            ExtractionJob.objects.create(
+                user=request.user,
+                source_type='website',
+                file_name=url[:255],
+                url=url,
+                ip_address=ip or None,
+                user_agent=request.META.get('HTTP_USER_AGENT', '')[:255],
+            )
+            for url in urls
+        ]
+        AuditLog.objects.bulk_create(
+            build_audit_event(request, 'website_queued', f"{job.url} queued for capture (job #{job.id}).")
+            for job in jobs
+        )
+    return jobs
+
+
+def claim_next_job(source_type=None):
+    """
+    Atomically move the oldest pending job (of `source_type`, if given) to
+    "running" and return it. Returns None when the queue is empty.
+
+    The conditional UPDATE makes this safe with several workers, even on
+    databases without SELECT ... FOR UPDATE (SQLite).
+    """
+    while True:
+        pending = ExtractionJob.objects.filter(status=ExtractionJob.STATUS_PENDING)
+        if source_type is not None:
+            pending = pending.filter(source_type=source_type)
+        job = pending.order_by('created_at', 'pk').first()
+        if job is None:
+            return None
+
+        claimed = (
+            ExtractionJob.objects
+            .filter(pk=job.pk, status=ExtractionJob.STATUS_PENDING)
+            .update(
+                status=ExtractionJob.STATUS_RUNNING,
+                started_at=timezone.now(),
+                heartbeat_at=timezone.now(),
+                attempts=F('attempts') + 1,
+            )
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # Another worker got it first, try the next one
+
+
+def requeue_stale_jobs(timeout=STALE_JOB_TIMEOUT) -> int:
+    """Put jobs abandoned by a crashed worker back in the queue (or fail them)."""
+    cutoff = timezone.now() - timeout
+    stale = ExtractionJob.objects.filter(status=ExtractionJob.STATUS_RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    failed = stale.filter(attempts__gte=MAX_JOB_ATTEMPTS).update(
+        status=ExtractionJob.STATUS_FAILED,
+        detail='Worker stopped responding too many times.',
+        finished_at=timezone.now(),
+    )
+    requeued = stale.update(status=ExtractionJob.STATUS_PENDING)
+    return failed + requeued
+
+
+class Heartbeat:
+    """
+    ``with Heartbeat(job, ...):`` touches the jobs' heartbeat_at from a side
+    thread every `interval` seconds, so a long job is not mistaken for an
+    abandoned one by requeue_stale_jobs().
+    """
+
+    def __init__(self, *jobs, interval=None):
+        self.job_ids = [job.pk for job in jobs]
+        self.interval = HEARTBEAT_INTERVAL if interval is None else interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                ExtractionJob.objects.filter(
+                    pk__in=self.job_ids, status=ExtractionJob.STATUS_RUNNING,
+                ).update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _finish(job, status: str, detail: str = '', source=None):
+    job.status = status
+    job.detail = detail
+    job.source = source
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'detail', 'source', 'finished_at'])
+
+
+def _audit(job, action: str, message: str):
+    record_audit_event(
+        job.user,
+        action,
+        message,
+        ip_address=job.ip_address,
+        user_agent=job.user_agent,
+    )
+
+
+def dedup_stats() -> dict:
+    """Hit/miss counts of the duplicate-upload shortcut."""
+    hits = ExtractionJob.objects.filter(dedup_hit=True).count()
+    misses = ExtractionJob.objects.filter(dedup_hit=False).count()
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
+
+
+def process_job(job: ExtractionJob) -> ExtractionJob:
+    """Run a claimed job through the worker side of the upload pipeline."""
+    upload = processing_pipeline.run(Upload.from_job(job))
+
+    job.dedup_hit = upload.dedup_hit
+    job.metrics = list(job.metrics or []) + upload.metrics
+    job.save(update_fields=['dedup_hit', 'metrics'])
+
+    if upload.status in (Upload.PROCESSED, Upload.DUPLICATE):
+        _finish(job, ExtractionJob.STATUS_DONE, upload.detail, source=upload.data_source)
+    else:
+        _finish(job, ExtractionJob.STATUS_FAILED, upload.detail)
+    return job
+
+
+def process_capture_jobs(jobs) -> list:
+    """Capture the pages of claimed website jobs, fetching them concurrently."""
+    captures = capture_pages([job.url for job in jobs])
+    for job, capture in zip(jobs, captures):
+        if capture['data'] is None:
+            _audit(job, 'website_capture_failed', f"{job.url}: {capture['error']}")
+            _finish(job, ExtractionJob.STATUS_FAILED, capture['error'])
+            continue
+        source = save_capture(capture, job.user)
+        _audit(job, 'website_captured', f"{job.url} captured as source #{source.id}.")
+        _finish(job, ExtractionJob.STATUS_DONE, "Captured successfully.", source=source)
+    return jobs
+
+
+def run_next_job():
+    """
+    Claim and process a single job. Returns the job or None if idle. A
+    website job is processed together with the other pending captures.
+    """
+    job = claim_next_job()
+    if job is None:
+        return None
+
+    jobs = [job]
+    if job.source_type == 'website':
+        workers = getattr(settings, 'WEB_CAPTURE_WORKERS', DEFAULT_WEB_CAPTURE_WORKERS)
+        while len(jobs) < workers:
+            other = claim_next_job(source_type='website')
+            if other is None:
+                break
+            jobs.append(other)
+
+    try:
+        with Heartbeat(*jobs):
+            if job.source_type == 'website':
+                process_capture_jobs(jobs)
+            else:
+                process_job(job)
+    except Exception as e:
+        for each in jobs:
+            if each.status == ExtractionJob.STATUS_RUNNING:
+                _audit(each, 'extraction_failed', f"{each.file_name}: {e}")
+                _finish(each, ExtractionJob.STATUS_FAILED, f"Processing error: {e}")
+    return job
+
+
+def run_pending_jobs(limit=None) -> int:
+    """Process jobs until the queue is empty (or `limit` jobs were run)."""
+    processed = 0
+    while limit is None or processed < limit:
+        if run_next_job() is None:
+            break
+        processed += 1
+    return processed
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from data_capture.models import ExtractedData
+from data_capture.pages import ensure_pages
+from data_capture.sheetstore import ensure_sheets
+
+
+class Command(BaseCommand):
+    help = (
+        "Split PDF extractions saved before per-page storage into pages and move "
+        "spreadsheet rows still stored as JSON into the sheet store. Safe to re-run."
+    )
+
+    def handle(self, *args, **options):
+        pdfs = ExtractedData.objects.filter(source__source_type='pdf', paged=False).only('pk', 'paged')
+        split = 0
+        for extracted in pdfs.iterator():
+            ensure_pages(extracted)
+            split += extracted.paged
+
+        # Stored summaries are small; only JSON rows are rewritten
+        sheets = ExtractedData.objects.filter(source__source_type='excel').exclude(
+            data__contains='"storage": "sheets"',
+        ).only('pk')
+        moved = 0
+        for extracted in sheets.iterator():
+            moved += ensure_sheets(extracted) is not None
+
+        self.stdout.write(
+            f"Split {split} PDF extraction(s) into pages, "
+            f"moved {moved} spreadsheet extraction(s) into the sheet store."
+        )
@@ -0,0 +1,114 @@
+import threading
+import time
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from data_capture.jobs import run_next_job, requeue_stale_jobs, dedup_stats
+from data_capture import ocr, sheetstore
+from data_capture.chunked import purge_stale_sessions
+from data_capture.pipeline import stage_stats
+from data_capture.scancache import scan_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Run the background worker that scans, sanitizes and extracts uploaded files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the jobs currently queued and exit.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to sleep when the queue is empty (default: 2).',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Number of jobs processed at the same time (default: 1). '
+                 'Extraction itself runs on the shared process pools.',
+        )
+
+    def handle(self, *args, **options):
+        if not ocr.TESSEROCR_AVAILABLE:
+            message = (
+                "tesserocr is not installed: OCR starts tesseract and loads its model for every batch "
+                "of images (pip install -r requirements-ocr.txt keeps it loaded)."
+            )
+            if getattr(settings, 'OCR_REQUIRE_TESSEROCR', False):
+                raise CommandError(message)
+            self.stderr.write(self.style.WARNING(message))
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Recovered {requeued} stale job(s).")
+
+        removed = sheetstore.collect_garbage()
+        if removed:
+            self.stdout.write(f"Removed {removed} unused sheet store file(s).")
+
+        concurrency = max(1, options['concurrency'])
+        if concurrency == 1:
+            self._work(options)
+        else:
+            threads = [
+                threading.Thread(target=self._thread_main, args=(options,), daemon=True)
+                for _ in range(concurrency)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        stats = dedup_stats()
+        self.stdout.write(
+            f"Duplicate uploads reused: {stats['hits']} hit(s), {stats['misses']} miss(es) "
+            f"({stats['hit_rate']:.0%} hit rate)."
+        )
+
+        scans = scan_cache_stats()
+        self.stdout.write(
+            f"Malware scan cache: {scans['memory_hits']} memory hit(s), {scans['db_hits']} DB hit(s), "
+            f"{scans['misses']} miss(es) ({scans['hit_rate']:.0%} hit rate, "
+            f"{scans['stored_verdicts']} stored verdict(s))."
+        )
+
+        # Where the time went, per pipeline stage
+        for stage, entry in stage_stats().items():
+            line = (
+                f"  {stage:<16} {entry['count']:>6} run(s)  wall {entry['wall']:9.3f}s  "
+                f"cpu {entry['cpu']:9.3f}s  {entry['mb_per_s']:8.2f} MB/s"
+            )
+            if entry['peak_rss']:
+                line += f"  peak RSS {entry['peak_rss'] / 1e6:.0f} MB"
+            self.stdout.write(line)
+
+    def _thread_main(self, options):
+        try:
+            self._work(options)
+        finally:
+            # Each thread has its own DB connection
+            connection.close()
+
+    def _work(self, options):
+        while True:
+            job = run_next_job()
+
+            if job is not None:
+                self.stdout.write(f"{job}: {job.detail}")
+                continue
+
+            if options['once']:
+                break
+
+            time.sleep(options['interval'])
+            requeue_stale_jobs()
+            purge_stale_sessions(getattr(settings, 'UPLOAD_SESSION_TTL', timedelta(days=2)))
@@ -0,0 +1,48 @@
+# Generated by Django 4.2 on 2026-10-16 20:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('data_capture', '0004_auditlog'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(choices=[('upload_attempt', 'Upload attempt'), ('upload_blocked_malware', 'Upload blocked – malware detected'), ('upload_success', 'Upload success'), ('malware_scanner_unavailable', 'Malware scanner unavailable'), ('sanitization_failed', 'File sanitization failed'), ('upload_queued', 'Upload queued for processing'), ('extraction_failed', 'Extraction failed')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='datasource',
+            name='source_type',
+            field=models.CharField(choices=[('pdf', 'PDF'), ('excel', 'Excel'), ('image', 'Image')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ExtractionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_type', models.CharField(choices=[('pdf', 'PDF'), ('excel', 'Excel'), ('image', 'Image')], max_length=20)),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_path', models.CharField(max_length=500)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20)),
+                ('detail', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('user_agent', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='data_capture.datasource')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-16 20:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_capture', '0005_extractionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extracteddata',
+            name='extractor_version',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='extractionjob',
+            name='dedup_hit',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(choices=[('upload_attempt', 'Upload attempt'), ('upload_blocked_malware', 'Upload blocked – malware detected'), ('upload_success', 'Upload success'), ('malware_scanner_unavailable', 'Malware scanner unavailable'), ('sanitization_failed', 'File sanitization failed'), ('upload_queued', 'Upload queued for processing'), ('extraction_failed', 'Extraction failed'), ('extraction_reused', 'Extraction reused for duplicate file')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='datasource',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-16 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_capture', '0006_dedup_file_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='file_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(choices=[('upload_attempt', 'Upload attempt'), ('upload_blocked_malware', 'Upload blocked – malware detected'), ('upload_success', 'Upload success'), ('malware_scanner_unavailable', 'Malware scanner unavailable'), ('sanitization_failed', 'File sanitization failed'), ('upload_queued', 'Upload queued for processing'), ('extraction_failed', 'Extraction failed'), ('extraction_reused', 'Extraction reused for duplicate file'), ('upload_rejected', 'Upload rejected – content does not match type')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-16 21:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('data_capture', '0007_extractionjob_file_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(choices=[('upload_attempt', 'Upload attempt'), ('upload_blocked_malware', 'Upload blocked – malware detected'), ('upload_success', 'Upload success'), ('malware_scanner_unavailable', 'Malware scanner unavailable'), ('sanitization_failed', 'File sanitization failed'), ('upload_queued', 'Upload queued for processing'), ('extraction_failed', 'Extraction failed'), ('extraction_reused', 'Extraction reused for duplicate file'), ('upload_rejected', 'Upload rejected – content does not match type'), ('upload_session_started', 'Resumable upload started')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name', models.CharField(max_length=255)),
+                ('source_type', models.CharField(choices=[('pdf', 'PDF'), ('excel', 'Excel'), ('image', 'Image')], max_length=20)),
+                ('total_size', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('staging_path', models.CharField(max_length=500)),
+                ('status', models.CharField(choices=[('active', 'Receiving chunks'), ('complete', 'Complete'), ('aborted', 'Aborted')], default='active', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='data_capture.extractionjob')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
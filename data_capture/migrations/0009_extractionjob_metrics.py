@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-16 21:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_capture', '0008_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='metrics',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
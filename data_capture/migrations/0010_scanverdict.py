@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-16 21:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_capture', '0009_extractionjob_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanVerdict',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=64)),
+                ('signature_version', models.CharField(max_length=100)),
+                ('is_clean', models.BooleanField()),
+                ('detail', models.TextField(blank=True)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('file_hash', 'signature_version')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2 on 2026-10-16 22:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_capture', '0010_scanverdict'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extracteddata',
+            name='paged',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ExtractedPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('extracted', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='data_capture.extracteddata')),
+            ],
+            options={
+                'ordering': ['page'],
+                'unique_together': {('extracted', 'page')},
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2 on 2026-10-16 23:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_capture', '0011_extractedpage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebPageCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_hash', models.CharField(max_length=64, unique=True)),
+                ('url', models.TextField()),
+                ('etag', models.CharField(blank=True, max_length=255)),
+                ('last_modified', models.CharField(blank=True, max_length=64)),
+                ('body_hash', models.CharField(max_length=64)),
+                ('data', models.TextField()),
+                ('extractor_version', models.CharField(blank=True, max_length=20)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(choices=[('upload_attempt', 'Upload attempt'), ('upload_blocked_malware', 'Upload blocked – malware detected'), ('upload_success', 'Upload success'), ('malware_scanner_unavailable', 'Malware scanner unavailable'), ('sanitization_failed', 'File sanitization failed'), ('upload_queued', 'Upload queued for processing'), ('extraction_failed', 'Extraction failed'), ('extraction_reused', 'Extraction reused for duplicate file'), ('upload_rejected', 'Upload rejected – content does not match type'), ('upload_session_started', 'Resumable upload started'), ('website_captured', 'Website captured'), ('website_capture_failed', 'Website capture failed')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='datasource',
+            name='source_type',
+            field=models.CharField(choices=[('pdf', 'PDF'), ('excel', 'Excel'), ('image', 'Image'), ('website', 'Website')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='extractionjob',
+            name='source_type',
+            field=models.CharField(choices=[('pdf', 'PDF'), ('excel', 'Excel'), ('image', 'Image'), ('website', 'Website')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='source_type',
+            field=models.CharField(choices=[('pdf', 'PDF'), ('excel', 'Excel'), ('image', 'Image'), ('website', 'Website')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-16 23:52
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def stored_under_file_name(apps, schema_editor):
+    # Until now every upload was stored under its client file name
+    DataSource = apps.get_model('data_capture', 'DataSource')
+    DataSource.objects.exclude(file_name=None).update(stored_name=F('file_name'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_capture', '0013_extractionjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='scanned_clean',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='stored_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(stored_under_file_name, migrations.RunPython.noop),
+    ]
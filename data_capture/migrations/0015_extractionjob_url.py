@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_capture', '0014_datasource_stored_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='url',
+            field=models.URLField(blank=True, max_length=2048),
+        ),
+    ]
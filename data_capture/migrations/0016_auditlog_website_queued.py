@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_capture', '0015_extractionjob_url'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(choices=[('upload_attempt', 'Upload attempt'), ('upload_blocked_malware', 'Upload blocked – malware detected'), ('upload_success', 'Upload success'), ('malware_scanner_unavailable', 'Malware scanner unavailable'), ('sanitization_failed', 'File sanitization failed'), ('upload_queued', 'Upload queued for processing'), ('extraction_failed', 'Extraction failed'), ('extraction_reused', 'Extraction reused for duplicate file'), ('upload_rejected', 'Upload rejected – content does not match type'), ('upload_session_started', 'Resumable upload started'), ('website_captured', 'Website captured'), ('website_capture_failed', 'Website capture failed'), ('website_queued', 'Website queued for capture')], max_length=50),
+        ),
+    ]
@@ -2,6 +2,7 @@
 from django.db import models
 from django.conf import settings
 import json
+import uuid
 
 
 class DataSource(models.Model):
@@ -9,7 +10,8 @@ class DataSource(models.Model):
     SOURCE_TYPES = [
         ('pdf', 'PDF'),
         ('excel', 'Excel'),
-        ('image', 'Image')
+        ('image', 'Image'),
+        ('website', 'Website'),
     ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -19,8 +21,16 @@ class DataSource(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    # SHA-256 hash of the uploaded file contents
-    file_hash = models.CharField(max_length=64, null=True, blank=True)
+    # SHA-256 hash of the uploaded file contents (as received, before sanitization)
+    file_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+
+    # Name of the scanned and sanitized file in MEDIA_ROOT/uploads (see
+    # storage.py); sources of identical uploads share one file
+    stored_name = models.CharField(max_length=255, blank=True)
+
+    # Malware scan verdict: True = clean, None = not scanned (no scanner was
+    # available). Only extractions of clean files are reused for duplicates.
+    scanned_clean = models.BooleanField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.get_source_type_display()} - {self.user.username}"
@@ -40,6 +50,13 @@ class ExtractedData(models.Model):
     # SHA-256 hash of the JSON/text stored in `data`
     content_hash = models.CharField(max_length=64, null=True, blank=True)
 
+    # utils.EXTRACTOR_VERSIONS entry that produced `data`; only results from
+    # the current version are reused for duplicate uploads
+    extractor_version = models.CharField(max_length=20, blank=True)
+
+    # PDF text has also been stored as ExtractedPage rows (see pages.py)
+    paged = models.BooleanField(default=False)
+
     def __str__(self):
         return f"ExtractedData #{self.pk} for {self.source}"
 
@@ -51,6 +68,25 @@ class ExtractedData(models.Model):
         except Exception:
             return self.data
 
+
+class ExtractedPage(models.Model):
+    """Text of one PDF page, so the detail view can load pages on demand."""
+    extracted = models.ForeignKey(
+        ExtractedData,
+        on_delete=models.CASCADE,
+        related_name='pages'
+    )
+    page = models.PositiveIntegerField()
+    text = models.TextField()
+
+    class Meta:
+        ordering = ['page']
+        unique_together = [('extracted', 'page')]
+
+    def __str__(self):
+        return f"Page {self.page} of ExtractedData #{self.extracted_id}"
+
+
 class ContactMessage(models.Model):
     """Message sent by investigator/user to admin."""
     user = models.ForeignKey(
@@ -78,6 +114,14 @@ class AuditLog(models.Model):
         ('upload_success', 'Upload success'),
         ('malware_scanner_unavailable', 'Malware scanner unavailable'),
         ('sanitization_failed', 'File sanitization failed'),
+        ('upload_queued', 'Upload queued for processing'),
+        ('extraction_failed', 'Extraction failed'),
+        ('extraction_reused', 'Extraction reused for duplicate file'),
+        ('upload_rejected', 'Upload rejected – content does not match type'),
+        ('upload_session_started', 'Resumable upload started'),
+        ('website_captured', 'Website captured'),
+        ('website_capture_failed', 'Website capture failed'),
+        ('website_queued', 'Website queued for capture'),
     ]
 
     user = models.ForeignKey(
@@ -97,4 +141,140 @@ class AuditLog(models.Model):
 
     def __str__(self):
         user_str = self.user.username if self.user else "Anonymous"
-        return f"[{self.created_at:%Y-%m-%d %H:%M}] {self.action} by {user_str}"
\ No newline at end of file
+        return f"[{self.created_at:%Y-%m-%d %H:%M}] {self.action} by {user_str}"
+
+class ExtractionJob(models.Model):
+    """Queued scan/sanitize/extract work for a file that is already on disk, or a web page to capture."""
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Filled in by the worker once the DataSource has been created
+    source = models.ForeignKey(
+        DataSource,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='jobs',
+    )
+    source_type = models.CharField(max_length=20, choices=DataSource.SOURCE_TYPES)
+    file_name = models.CharField(max_length=255)
+    file_path = models.CharField(max_length=500)
+    # SHA-256 of the bytes as received, if the upload handler computed it
+    file_hash = models.CharField(max_length=64, blank=True)
+    # Page to fetch, for website capture jobs (file_name holds it shortened)
+    url = models.URLField(max_length=2048, blank=True)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True,
+    )
+    detail = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    # True when the result was copied from an earlier upload of the same
+    # file, False when it had to be extracted, None until decided
+    dedup_hit = models.BooleanField(null=True, blank=True)
+
+    # One {stage, wall, cpu, bytes} entry per pipeline stage, view and worker side
+    metrics = models.JSONField(default=list, blank=True)
+
+    # Request details kept so the worker can write audit entries
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    user_agent = models.CharField(max_length=255, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Touched periodically by the worker while the job runs (see jobs.py)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"Job #{self.pk} {self.file_name} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+
+class UploadSession(models.Model):
+    """A resumable upload: chunks are appended to a staging file until finalized."""
+
+    STATUS_ACTIVE = 'active'
+    STATUS_COMPLETE = 'complete'
+    STATUS_ABORTED = 'aborted'
+
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'Receiving chunks'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_ABORTED, 'Aborted'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    file_name = models.CharField(max_length=255)
+    source_type = models.CharField(max_length=20, choices=DataSource.SOURCE_TYPES)
+    total_size = models.BigIntegerField()
+    # Number of bytes received so far (= offset of the next chunk)
+    offset = models.BigIntegerField(default=0)
+    staging_path = models.CharField(max_length=500)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    job = models.ForeignKey(ExtractionJob, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.id} {self.file_name} ({self.offset}/{self.total_size})"
+
+
+class ScanVerdict(models.Model):
+    """Cached malware scan result for some bytes, valid for one signature database version."""
+
+    file_hash = models.CharField(max_length=64)
+    signature_version = models.CharField(max_length=100)
+    # True = clean, False = infected (scanner errors are never cached)
+    is_clean = models.BooleanField()
+    detail = models.TextField(blank=True)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('file_hash', 'signature_version')]
+
+    def __str__(self):
+        verdict = "clean" if self.is_clean else "infected"
+        return f"{self.file_hash[:12]}… {verdict} ({self.signature_version})"
+
+
+class WebPageCache(models.Model):
+    """Last capture of a URL, with the validators needed to revalidate it by conditional GET."""
+
+    # SHA-256 of the URL as requested (URLs can be longer than an index allows)
+    url_hash = models.CharField(max_length=64, unique=True)
+    url = models.TextField()
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    # SHA-256 of the page body, so an unchanged page without validators is not parsed again
+    body_hash = models.CharField(max_length=64)
+    # webcapture.parse_page() output as JSON; only reused while the version is current
+    data = models.TextField()
+    extractor_version = models.CharField(max_length=20, blank=True)
+    hits = models.PositiveIntegerField(default=0)
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.url} ({self.fetched_at:%Y-%m-%d %H:%M})"
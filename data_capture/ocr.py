@@ -0,0 +1,477 @@
+"""
+OCR through a pool of long-lived Tesseract workers.
+
+pytesseract starts a tesseract process for every image, and each process
+loads the language model again before it reads a pixel. Here a fixed number
+of worker threads (OCR_WORKERS per process, see default_ocr_workers) take
+images from a queue instead:
+
+* with tesserocr installed, each worker owns a TessBaseAPI that loads the
+  model once and keeps it for as long as the process runs;
+* otherwise a worker takes everything queued (up to OCR_BATCH_IMAGES) and
+  reads it in one tesseract run over a list file, so the model is loaded
+  once per batch instead of once per image.
+
+Recognition happens in native code (tesserocr releases the GIL, the CLI is a
+subprocess), so threads are enough to keep the cores busy.
+
+Images over OCR_TILE_THRESHOLD_PIXELS are cut into overlapping full-width
+strips that are read in parallel and stitched back together (``ocr_tiled``).
+
+The tesseract binary and its tessdata directory are looked up on PATH and in
+the usual install locations unless TESSERACT_CMD / TESSDATA_PREFIX are set.
+"""
+import atexit
+import glob
+import multiprocessing
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from difflib import SequenceMatcher
+from concurrent.futures import Future
+
+from django.conf import settings
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+DEFAULT_OCR_LANG = 'eng'
+DEFAULT_OCR_BATCH_IMAGES = 8
+DEFAULT_OCR_TIMEOUT = 120  # seconds per tesseract run
+DEFAULT_OCR_TILE_THRESHOLD_PIXELS = 20_000_000
+DEFAULT_OCR_TILE_HEIGHT = 2000
+DEFAULT_OCR_TILE_OVERLAP = 200
+
+# Most lines two neighbouring tiles are compared on when stitching
+TILE_OVERLAP_LINES = 20
+
+TESSERACT_PATHS = [
+    '/usr/bin/tesseract',
+    '/usr/local/bin/tesseract',
+    '/opt/homebrew/bin/tesseract',
+    '/opt/local/bin/tesseract',
+    r'C:\Program Files\Tesseract-OCR\tesseract.exe',
+]
+
+TESSDATA_PATTERNS = [
+    '/usr/share/tesseract-ocr/*/tessdata',
+    '/usr/share/tessdata',
+    '/usr/local/share/tessdata',
+    '/usr/local/share/tesseract-ocr/*/tessdata',
+    '/opt/homebrew/share/tessdata',
+]
+
+
+class OcrError(Exception):
+    """Tesseract is missing or could not read an image."""
+
+
+def find_tesseract():
+    """Path of the tesseract binary: TESSERACT_CMD, then PATH, then the usual locations."""
+    configured = getattr(settings, 'TESSERACT_CMD', '')
+    if configured:
+        return configured if os.path.isfile(configured) else shutil.which(configured)
+    found = shutil.which('tesseract')
+    if found:
+        return found
+    for path in TESSERACT_PATHS:
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def find_tessdata(lang=None, cmd=None):
+    """
+    A tessdata directory holding the traineddata for `lang`: TESSDATA_PREFIX,
+    then next to the tesseract binary, then the usual locations (newest
+    tesseract version first). None leaves it to tesseract's built-in default.
+    """
+    lang = (lang or ocr_lang()).split('+')[0]
+    configured = getattr(settings, 'TESSDATA_PREFIX', '') or os.environ.get('TESSDATA_PREFIX', '')
+    if configured:
+        return configured
+
+    candidates = []
+    cmd = cmd or find_tesseract()
+    if cmd:
+        prefix = os.path.dirname(os.path.dirname(os.path.realpath(cmd)))
+        candidates += [os.path.join(prefix, 'share', 'tessdata'), os.path.join(prefix, 'tessdata')]
+        candidates += sorted(glob.glob(os.path.join(prefix, 'share', 'tesseract-ocr', '*', 'tessdata')), reverse=True)
+    for pattern in TESSDATA_PATTERNS:
+        candidates += sorted(glob.glob(pattern), reverse=True)
+
+    for directory in candidates:
+        if os.path.isfile(os.path.join(directory, f'{lang}.traineddata')):
+            return directory
+    return None
+
+
+def ocr_lang():
+    return getattr(settings, 'OCR_LANG', DEFAULT_OCR_LANG) or DEFAULT_OCR_LANG
+
+
+def ocr_available() -> bool:
+    return TESSEROCR_AVAILABLE or find_tesseract() is not None
+
+
+def _ocr_ready(image):
+    """`image` in a mode both tesserocr and PNM files take."""
+    return image if image.mode in ('1', 'L', 'RGB') else image.convert('RGB')
+
+
+class ApiEngine:
+    """One TessBaseAPI, model loaded once and reused for every image."""
+
+    def __init__(self, lang, tessdata=None):
+        kwargs = {'lang': lang}
+        if tessdata:
+            kwargs['path'] = tessdata
+        try:
+            self.api = tesserocr.PyTessBaseAPI(**kwargs)
+        except RuntimeError as e:
+            raise OcrError(f"Tesseract could not load '{lang}': {e}")
+
+    def recognize(self, images):
+        texts = []
+        for image in images:
+            self.api.SetImage(_ocr_ready(image))
+            texts.append(self.api.GetUTF8Text())
+        return texts
+
+    def close(self):
+        self.api.End()
+
+
+class CliEngine:
+    """The tesseract binary, run once per batch of images through a list file."""
+
+    def __init__(self, cmd, lang, tessdata=None, timeout=DEFAULT_OCR_TIMEOUT):
+        self.cmd = cmd
+        self.lang = lang
+        self.tessdata = tessdata
+        self.timeout = timeout
+        # Tesseract's own threads only compete with the other workers
+        self.env = dict(os.environ, OMP_THREAD_LIMIT='1')
+
+    def recognize(self, images):
+        # A separator that cannot occur in OCR output, so the pages split cleanly
+        separator = f'<<page-{uuid.uuid4().hex}>>'
+        with tempfile.TemporaryDirectory(prefix='ocr-') as tmp:
+            paths = []
+            for index, image in enumerate(images):
+                path = os.path.join(tmp, f'{index}.pnm')
+                _ocr_ready(image).save(path, 'PPM')
+                paths.append(path)
+            list_path = os.path.join(tmp, 'images.txt')
+            with open(list_path, 'w') as f:
+                f.write('\n'.join(paths) + '\n')
+
+            output = self._run(list_path, ['-c', f'page_separator={separator}'])
+
+        texts = output.split(separator)
+        # Tesseract 4 puts the separator after every page, 5 only between pages
+        if len(texts) == len(images) + 1 and not texts[-1].strip():
+            texts.pop()
+        if len(texts) != len(images):
+            raise OcrError(f"Tesseract returned {len(texts)} pages for {len(images)} images.")
+        return texts
+
+    def _run(self, input_path, extra_args):
+        args = [self.cmd, input_path, 'stdout', '-l', self.lang]
+        if self.tessdata:
+            args += ['--tessdata-dir', self.tessdata]
+        try:
+            proc = subprocess.run(
+                args + extra_args, capture_output=True, timeout=self.timeout, env=self.env,
+            )
+        except subprocess.TimeoutExpired:
+            raise OcrError(f"Tesseract timed out after {self.timeout}s.")
+        except OSError as e:
+            raise OcrError(f"Tesseract could not be started: {e}")
+        if proc.returncode != 0:
+            raise OcrError(proc.stderr.decode('utf-8', 'replace').strip() or f"Tesseract exited with {proc.returncode}.")
+        return proc.stdout.decode('utf-8', 'replace')
+
+    def close(self):
+        pass
+
+
+def make_engine():
+    """The best engine this machine has: tesserocr if installed, else the binary."""
+    lang = ocr_lang()
+    if TESSEROCR_AVAILABLE:
+        return ApiEngine(lang, find_tessdata(lang))
+    cmd = find_tesseract()
+    if cmd is None:
+        raise OcrError("Tesseract is not installed.")
+    timeout = getattr(settings, 'OCR_TIMEOUT', DEFAULT_OCR_TIMEOUT)
+    return CliEngine(cmd, lang, find_tessdata(lang, cmd), timeout)
+
+
+def default_ocr_workers() -> int:
+    """
+    OCR threads per process when OCR_WORKERS is 0. In an extraction pool
+    process the pools already spread files over the cores, so the CPUs are
+    shared out between the processes that OCR (the PDF and image pools):
+    one thread each with the default pool sizes, not cpus/2 each. Anywhere
+    else (extraction in-process), half the CPUs.
+    """
+    cpus = os.cpu_count() or 2
+    if multiprocessing.parent_process() is None:
+        return max(1, cpus // 2)
+    workers = getattr(settings, 'EXTRACTION_WORKERS', None) or {}
+    # Same default as ExtractionEngine for a type without a setting
+    processes = sum(workers.get(source_type, max(1, cpus // 2)) for source_type in ('pdf', 'image'))
+    return max(1, cpus // max(1, processes))
+
+
+class OcrPool:
+    """
+    Worker threads, each with its own engine, reading images from one queue.
+    submit() returns a Future for the text (or with timed=True, for
+    (text, seconds spent reading it)); workers start on first use.
+    """
+
+    def __init__(self, workers=None, batch=None, engine_factory=make_engine):
+        self.workers = workers or getattr(settings, 'OCR_WORKERS', 0) or default_ocr_workers()
+        self.batch = max(1, batch or getattr(settings, 'OCR_BATCH_IMAGES', DEFAULT_OCR_BATCH_IMAGES))
+        self.engine_factory = engine_factory
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, image, timed=False) -> Future:
+        return self.submit_many([image], timed)[0]
+
+    def submit_many(self, images, timed=False):
+        """Queue all of `images` before any worker wakes, so they can share a batch."""
+        futures = []
+        with self._lock:
+            if self._closed:
+                raise OcrError("OCR pool is closed.")
+            for image in images:
+                future = Future()
+                self._queue.put((image, future, timed))
+                futures.append(future)
+            self._start_workers()
+        return futures
+
+    def map(self, images, timeout=None):
+        """Texts of `images`, in order. Raises OcrError if any could not be read."""
+        return [future.result(timeout) for future in self.submit_many(images)]
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f'ocr-{len(self._threads)}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _take_batch(self):
+        jobs = [self._queue.get()]
+        # No more than a fair share of what is queued, so idle workers get some too
+        limit = min(self.batch, -(-(self._queue.qsize() + 1) // self.workers))
+        while jobs[-1] is not None and len(jobs) < limit:
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def _work(self):
+        engine = None
+        try:
+            while True:
+                jobs = self._take_batch()
+                stop = jobs[-1] is None
+                jobs = [job for job in jobs if job is not None and job[1].set_running_or_notify_cancel()]
+                if jobs:
+                    try:
+                        if engine is None:
+                            engine = self.engine_factory()
+                        started = time.perf_counter()
+                        texts = engine.recognize([image for image, _, _ in jobs])
+                        # Images read in one run share its time
+                        seconds = (time.perf_counter() - started) / len(jobs)
+                    except Exception as e:
+                        error = e if isinstance(e, OcrError) else OcrError(str(e))
+                        for _, future, _ in jobs:
+                            future.set_exception(error)
+                    else:
+                        for (_, future, timed), text in zip(jobs, texts):
+                            future.set_result((text, seconds) if timed else text)
+                if stop:
+                    break
+        finally:
+            if engine is not None:
+                engine.close()
+
+    def close(self, wait=True):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for _ in self._threads:
+                self._queue.put(None)
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_pool() -> OcrPool:
+    """This process's pool (a forked child gets its own; threads do not survive fork)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = OcrPool()
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def close_ocr_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None and _pool_pid == os.getpid():
+        pool.close(wait=False)
+
+
+atexit.register(close_ocr_pool)
+
+
+def ocr_images(images):
+    """Text of each of `images` (PIL images), read on the shared pool."""
+    images = list(images)
+    if not images:
+        return []
+    return get_ocr_pool().map(images)
+
+
+def ocr_image(image) -> str:
+    return ocr_images([image])[0]
+
+
+def plan_tiles(width, height, tile_height=None, overlap=None):
+    """
+    (left, top, right, bottom) boxes of full-width strips covering an image
+    from top to bottom, each overlapping the previous one by `overlap` rows.
+    Strips keep every text line whole and in reading order, so their text
+    can be joined without word positions.
+    """
+    tile_height = tile_height or getattr(settings, 'OCR_TILE_HEIGHT', DEFAULT_OCR_TILE_HEIGHT)
+    overlap = getattr(settings, 'OCR_TILE_OVERLAP', DEFAULT_OCR_TILE_OVERLAP) if overlap is None else overlap
+    step = max(1, tile_height - overlap)
+    boxes = []
+    top = 0
+    while True:
+        bottom = min(top + tile_height, height)
+        boxes.append((0, top, width, bottom))
+        if bottom >= height:
+            return boxes
+        top += step
+
+
+def _normalize(line):
+    return ' '.join(line.split()).lower()
+
+
+def _equal_lines(a, b):
+    return _normalize(a) == _normalize(b)
+
+
+def _similar_lines(a, b):
+    a, b = _normalize(a), _normalize(b)
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    return matcher.quick_ratio() >= 0.8 and matcher.ratio() >= 0.8
+
+
+def _overlap(previous, lines, same):
+    """
+    (lines of `previous` to keep, leading `lines` to drop) so the lines both
+    tiles read in their overlap appear once. Either side may also have a
+    line the tile edge cut through, garbled, next to the shared ones.
+    """
+    longest = min(len(previous), len(lines), TILE_OVERLAP_LINES)
+    for count in range(longest, 0, -1):
+        for cut_previous in (0, 1):
+            end = len(previous) - cut_previous
+            shared = previous[end - count:end]
+            if len(shared) < count or (count == 1 and len(_normalize(shared[0])) < 4):
+                continue
+            for cut_lines in (0, 1):
+                candidate = lines[cut_lines:cut_lines + count]
+                if len(candidate) == count and all(map(same, shared, candidate)):
+                    return end, cut_lines + count
+    return None
+
+
+def stitch_tiles(texts):
+    """
+    Join the texts of plan_tiles() strips, top to bottom, without the lines
+    read twice. The same line usually comes out identical in both strips;
+    nearly equal lines are only matched when no exact overlap is found, so
+    look-alike lines (table rows) are not merged by mistake.
+    """
+    lines = []
+    for text in texts:
+        new = [line for line in text.splitlines() if line.strip()]
+        if lines and new:
+            keep, skip = (_overlap(lines, new, _equal_lines)
+                          or _overlap(lines, new, _similar_lines)
+                          or (len(lines), 0))
+            del lines[keep:]
+            new = new[skip:]
+        lines.extend(new)
+    return '\n'.join(lines)
+
+
+def submit_tiled(image):
+    """
+    Queue `image` on the pool: whole up to OCR_TILE_THRESHOLD_PIXELS, else
+    as plan_tiles() strips. Returns (boxes, futures) for collect_tiled();
+    boxes is None when the image was queued whole.
+    """
+    threshold = getattr(settings, 'OCR_TILE_THRESHOLD_PIXELS', DEFAULT_OCR_TILE_THRESHOLD_PIXELS)
+    width, height = image.size
+    if width * height <= threshold:
+        return None, [get_ocr_pool().submit(image, timed=True)]
+
+    # One grayscale copy to crop from, a third of the memory of RGB
+    image = image if image.mode in ('1', 'L') else image.convert('L')
+    boxes = plan_tiles(width, height)
+    return boxes, get_ocr_pool().submit_many((image.crop(box) for box in boxes), timed=True)
+
+
+def collect_tiled(boxes, futures):
+    """(text, tiles) once submit_tiled()'s futures are done; `tiles` lists each strip's box and OCR seconds."""
+    results = [future.result() for future in futures]
+    if boxes is None:
+        return results[0][0], []
+    tiles = [
+        {'box': list(box), 'seconds': round(seconds, 3)}
+        for box, (_, seconds) in zip(boxes, results)
+    ]
+    return stitch_tiles(text for text, _ in results), tiles
+
+
+def ocr_tiled(image):
+    """
+    (text, tiles) for `image`. Images up to OCR_TILE_THRESHOLD_PIXELS are
+    read whole and `tiles` is empty; larger ones are read as plan_tiles()
+    strips in parallel.
+    """
+    return collect_tiled(*submit_tiled(image))
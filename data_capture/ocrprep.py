@@ -0,0 +1,176 @@
+"""
+Image preprocessing in front of OCR.
+
+Tesseract reads text best at about 300 dpi; photos and high-resolution
+scans are often several times that, which only makes OCR slower. Each step
+here can be turned off in settings:
+
+* grayscale (OCR_PREPROCESS_GRAYSCALE): colour carries nothing OCR uses;
+* downscale (OCR_TARGET_DPI, 0 = off): to the target resolution. JPEGs are
+  decoded at reduced scale straight away, so the full-size image never
+  exists in memory;
+* deskew (OCR_DESKEW): straighten text lines, found from the projection
+  profile of the ink pixels;
+* binarize (OCR_BINARIZE): 'sauvola' thresholds each pixel against its
+  neighbourhood, which copes with shadows and uneven lighting in photos;
+  'otsu' uses one threshold for the whole image.
+
+All the pixel work is vectorized NumPy; Pillow does the resampling.
+"""
+import math
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+DEFAULT_OCR_TARGET_DPI = 300
+DEFAULT_OCR_BINARIZE = 'sauvola'
+
+# Scanners record their real resolution; cameras and screenshots write 72 or
+# 96 whatever the content, so below this the metadata is ignored and the
+# image is taken to be one page with ASSUMED_PAGE_INCHES on its long side.
+MIN_TRUSTED_DPI = 150
+ASSUMED_PAGE_INCHES = 11.69  # A4
+
+SAUVOLA_WINDOW_INCHES = 1 / 6
+SAUVOLA_K = 0.2
+SAUVOLA_R = 128
+
+DESKEW_MAX_ANGLE = 5.0  # degrees either way
+DESKEW_STEP = 0.25
+DESKEW_MIN_ANGLE = 0.1  # not worth resampling for less
+DESKEW_SAMPLE = 200_000  # ink pixels the angle is estimated from
+
+
+def source_dpi(image) -> float:
+    """Resolution of `image`: its metadata if it looks like a scanner's, else estimated."""
+    dpi = image.info.get('dpi')
+    try:
+        # PNG stores pixels per metre, so 300 dpi comes back as 299.9994
+        dpi = round(min(float(d) for d in dpi) if isinstance(dpi, tuple) else float(dpi or 0))
+    except (TypeError, ValueError):
+        dpi = 0
+    if dpi >= MIN_TRUSTED_DPI:
+        return dpi
+    return max(image.size) / ASSUMED_PAGE_INCHES
+
+
+def _flatten(image):
+    """`image` without transparency, on white."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, rgba).convert('RGB')
+    if image.mode not in ('1', 'L', 'RGB'):
+        return image.convert('RGB')
+    return image
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """The grey level that best splits `gray` (uint8) into ink and background."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weight = hist.cumsum()
+    mass = (hist * np.arange(256)).cumsum()
+    total = weight[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (mass[-1] * weight / total - mass) ** 2 / (weight * (total - weight))
+    return int(np.nanargmax(between)) if np.isfinite(between).any() else 127
+
+
+def _window_means(values: np.ndarray, window: int) -> np.ndarray:
+    """Mean over the window x window square around each pixel (edges repeated), via an integral image."""
+    radius = window // 2
+    window = 2 * radius + 1
+    padded = np.pad(values, radius, mode='edge')
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1))
+    padded.cumsum(0, out=integral[1:, 1:]).cumsum(1, out=integral[1:, 1:])
+    sums = integral[window:, window:] - integral[:-window, window:] - integral[window:, :-window] + integral[:-window, :-window]
+    return sums / (window * window)
+
+
+def sauvola_ink(gray: np.ndarray, window: int) -> np.ndarray:
+    """True where `gray` is darker than the Sauvola threshold of its neighbourhood."""
+    values = gray.astype(np.float64)
+    mean = _window_means(values, window)
+    variance = np.maximum(_window_means(values * values, window) - mean * mean, 0)
+    threshold = mean * (1 + SAUVOLA_K * (np.sqrt(variance) / SAUVOLA_R - 1))
+    return values < threshold
+
+
+def estimate_skew(ink: np.ndarray) -> float:
+    """
+    Degrees (counter-clockwise) the text lines in `ink` are tilted by: the
+    angle whose row projection of the ink is sharpest, as lines then fall
+    into few rows with empty rows between them.
+    """
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > DESKEW_SAMPLE:
+        picked = np.random.default_rng(0).choice(len(ys), DESKEW_SAMPLE, replace=False)
+        ys, xs = ys[picked], xs[picked]
+    ys = ys.astype(np.float64)
+    xs = xs.astype(np.float64)
+
+    def sharpness(angle):
+        rows = ys - xs * math.tan(math.radians(angle))
+        counts = np.bincount((rows - rows.min()).astype(np.int64))
+        return float(np.dot(counts, counts))
+
+    coarse = np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + DESKEW_STEP / 2, DESKEW_STEP)
+    best = max(coarse, key=sharpness)
+    fine = np.arange(best - DESKEW_STEP, best + DESKEW_STEP, DESKEW_STEP / 10)
+    # Rows run down the image, so a line rising to the right has a negative slope in them
+    return -round(float(max(fine, key=sharpness)), 2)
+
+
+def prepare_for_ocr(image):
+    """
+    `image` ready for OCR, and {'steps', 'size', 'skew'} describing what was
+    done. Call it on a freshly opened image so JPEG downscaling can happen
+    while decoding.
+    """
+    steps = []
+    grayscale = getattr(settings, 'OCR_PREPROCESS_GRAYSCALE', True)
+    target_dpi = getattr(settings, 'OCR_TARGET_DPI', DEFAULT_OCR_TARGET_DPI)
+    deskew = getattr(settings, 'OCR_DESKEW', True)
+    binarize = getattr(settings, 'OCR_BINARIZE', DEFAULT_OCR_BINARIZE)
+
+    dpi = source_dpi(image)
+    width, height = image.size
+    scale = target_dpi / dpi if target_dpi and dpi > target_dpi * 1.05 else 1.0
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if scale < 1 and image.format == 'JPEG':
+        image.draft('L' if grayscale else image.mode, size)
+
+    image = _flatten(image)
+    if grayscale and image.mode != 'L':
+        image = image.convert('L')
+        steps.append('grayscale')
+    if scale < 1:
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        steps.append('downscale')
+        dpi = target_dpi
+
+    skew = 0.0
+    if deskew:
+        gray = np.asarray(image.convert('L'))
+        skew = estimate_skew(gray <= otsu_threshold(gray))
+        if abs(skew) >= DESKEW_MIN_ANGLE:
+            fill = 255 if image.mode in ('1', 'L') else (255, 255, 255)
+            image = image.rotate(-skew, Image.Resampling.BILINEAR, expand=True, fillcolor=fill)
+            steps.append('deskew')
+        else:
+            skew = 0.0
+
+    if binarize:
+        gray = np.asarray(image.convert('L'))
+        if binarize == 'otsu':
+            ink = gray <= otsu_threshold(gray)
+        else:
+            window = max(15, int(dpi * SAUVOLA_WINDOW_INCHES) | 1)
+            ink = sauvola_ink(gray, window)
+        image = Image.fromarray(~ink)
+        steps.append('binarize')
+
+    return image, {'steps': steps, 'size': list(image.size), 'skew': skew}
@@ -0,0 +1,76 @@
+"""
+Per-page storage of extracted PDF text.
+
+``ExtractedData.data`` keeps the whole extraction as JSON (it is what
+duplicate uploads reuse and the APIs return), and each page's text is also
+stored as an ExtractedPage row. The detail view only counts those rows and
+fetches page text in small batches through ``api_source_pages``, so a
+2,000-page document does not have to be parsed or rendered at once.
+
+Fresh extractions and copies made for duplicate uploads get their pages
+when the worker saves them. Rows stored before per-page storage existed
+are split by ``manage.py backfill_extractions`` (``ensure_pages``); until
+then the views read their pages from the JSON (``page_entries``).
+"""
+import json
+
+from django.db import transaction
+
+from .models import ExtractedData, ExtractedPage
+
+INSERT_BATCH_SIZE = 500
+
+
+def build_pages(extracted: ExtractedData, data) -> list:
+    """Unsaved ExtractedPage rows for the {'type': 'pdf', 'content': [...]} `data`."""
+    if not isinstance(data, dict) or data.get('type') != 'pdf':
+        return []
+    return [
+        ExtractedPage(extracted=extracted, page=entry['page'], text=entry.get('text') or '')
+        for entry in data.get('content') or []
+        if isinstance(entry, dict) and 'page' in entry
+    ]
+
+
+def store_pages(extracted: ExtractedData, data):
+    """Save the pages of `data` for `extracted` (a no-op for non-PDF data)."""
+    if not isinstance(data, dict) or data.get('type') != 'pdf':
+        return
+    with transaction.atomic():
+        # Two first views of the same old row may race to split it
+        ExtractedPage.objects.bulk_create(
+            build_pages(extracted, data), batch_size=INSERT_BATCH_SIZE, ignore_conflicts=True,
+        )
+        ExtractedData.objects.filter(pk=extracted.pk).update(paged=True)
+    extracted.paged = True
+
+
+def _load_data(extracted: ExtractedData):
+    raw = ExtractedData.objects.filter(pk=extracted.pk).values_list('data', flat=True).first()
+    try:
+        return json.loads(raw or '')
+    except ValueError:
+        return None
+
+
+def ensure_pages(extracted: ExtractedData):
+    """Split a PDF extraction stored before per-page storage (or reused from one) into pages."""
+    if extracted.paged:
+        return
+    data = _load_data(extracted)
+    if isinstance(data, dict) and data.get('type') == 'pdf':
+        store_pages(extracted, data)
+
+
+def page_entries(extracted: ExtractedData):
+    """
+    {'page', 'text'} of each page of a PDF extraction, in order: its
+    ExtractedPage rows, or the JSON entries of one that has not been split
+    yet. Never writes.
+    """
+    if extracted.paged:
+        return extracted.pages.values('page', 'text')
+    return [
+        {'page': page.page, 'text': page.text}
+        for page in build_pages(extracted, _load_data(extracted))
+    ]
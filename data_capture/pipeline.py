@@ -0,0 +1,632 @@
+"""
+The upload pipeline.
+
+Every upload goes through the same list of stages:
+
+    receive -> validate -> queue                       (request, see views)
+    hash -> dedup -> scan -> sanitize -> extract
+         -> sanitize_output -> persist -> audit        (worker, see jobs)
+
+The async views run both halves in the request (receive .. validate, then
+hash .. persist) and keep a finished job record of the upload. They use
+Pipeline.arun(): `scan` and `extract` await the scanner process and the
+extraction pool, the other stages that do not touch the DB run on their own
+thread, and only the DB stages share the request's thread.
+
+The batch API runs the middle part (scan .. sanitize_output) on threads and
+persists in bulk itself; of those stages only the scan verdict cache
+touches the DB.
+
+Each stage records its wall time, CPU time (of the calling thread, so for
+`extract`, which runs on the engine's process pool, wall >> cpu is time
+spent waiting on the pool; under arun() `scan` and `extract` record 0)
+and the number of bytes it processed; `sanitize`
+also records how far resident memory rose while it ran (peak_rss), the PDF
+page count and, for images, whether the file was rewritten or re-encoded. They are kept in ``ExtractionJob.metrics``;
+``stage_stats()`` aggregates them.
+"""
+import os
+import json
+import time
+import hashlib
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DataSource, ExtractedData, ExtractionJob
+from .engine import run_extraction, arun_extraction, ExtractionError
+from .uploadhandlers import install_streaming_handler
+from .utils import EXTRACTOR_VERSIONS
+from .pages import ensure_pages, store_pages
+from .sheetstore import ensure_sheets, is_stored, store_sheets
+from .storage import remove_file
+from .security import (
+    scan_file_for_malware,
+    ascan_file_for_malware,
+    sanitize_file,
+    sanitize_extracted_data,
+    record_audit_event,
+)
+
+# Accepted file extensions per source type
+VALID_EXTENSIONS = {
+    'pdf': ['pdf'],
+    'excel': ['xlsx', 'xls'],
+    'image': ['png', 'jpg', 'jpeg', 'gif', 'bmp', 'tif', 'tiff'],
+}
+
+
+def reusable_extractions(file_hash: str, source_type: str):
+    """
+    ExtractedData produced by the current extractor for identical bytes that
+    the malware scanner passed, newest first.
+    """
+    return (
+        ExtractedData.objects
+        .filter(
+            source__file_hash=file_hash,
+            source__source_type=source_type,
+            source__scanned_clean=True,
+            extractor_version=EXTRACTOR_VERSIONS.get(source_type, ''),
+        )
+        .exclude(source__stored_name='')
+        .select_related('source')
+        .order_by('-created_at')
+    )
+
+
+class Upload:
+    """One file and everything the stages learn about it."""
+
+    QUEUED = 'queued'
+    PROCESSED = 'processed'
+    DUPLICATE = 'duplicate'
+    REJECTED = 'rejected'
+    BLOCKED = 'blocked'
+    FAILED = 'failed'
+
+    def __init__(self, user, source_type=None, file_name='', file_path=None, file_hash='',
+                 request=None, handler=None, ip_address=None, user_agent=''):
+        self.user = user
+        self.source_type = source_type
+        self.file_name = file_name
+        self.file_path = file_path
+        self.file_hash = file_hash
+        self.request = request
+        self.handler = handler
+        self.ip_address = ip_address
+        self.user_agent = user_agent
+
+        self.uploaded_file = None
+        self.status = None
+        self.detail = ''
+        self.halted = False
+        self.sanitized_ok = True
+        # True once the malware scanner passed the file, None if it could not scan
+        self.scanned_clean = None
+        self.dedup_hit = None
+        self.reused = None          # ExtractedData of an identical earlier upload
+        self.extracted_data = None
+        self.data_json = None
+        self.content_hash = None
+        self.data_source = None
+        self.job = None
+        # (action, message) pairs, written by AuditStage
+        self.audit_events = []
+        self.metrics = []
+        # {stage: {...}} extra figures a stage reports, merged into its metrics entry
+        self.stage_details = {}
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        Start an upload from a request whose body has not been read yet:
+        the streaming handler has to be installed before anything touches
+        request.POST (including the CSRF check).
+        """
+        ip = request.META.get('REMOTE_ADDR') or request.META.get('HTTP_X_FORWARDED_FOR')
+        return cls(
+            request.user,
+            request=request,
+            handler=install_streaming_handler(request),
+            ip_address=ip or None,
+            user_agent=request.META.get('HTTP_USER_AGENT', '')[:255],
+        )
+
+    @classmethod
+    def from_job(cls, job: ExtractionJob):
+        upload = cls(
+            job.user,
+            source_type=job.source_type,
+            file_name=job.file_name,
+            file_path=job.file_path,
+            file_hash=job.file_hash,
+            ip_address=job.ip_address,
+            user_agent=job.user_agent,
+        )
+        upload.job = job
+        return upload
+
+    def audit(self, action: str, message: str):
+        self.audit_events.append((action, message))
+
+    def halt(self, status: str, detail: str):
+        """Stop the pipeline; only stages marked `always` still run."""
+        self.status = status
+        self.detail = detail
+        self.halted = True
+
+    def file_size(self) -> int:
+        try:
+            return os.path.getsize(self.file_path)
+        except (OSError, TypeError):
+            return 0
+
+    @property
+    def timings(self) -> dict:
+        """{stage: wall seconds}"""
+        return {m['stage']: m['wall'] for m in self.metrics}
+
+
+class Stage:
+    """One step of the pipeline. run() returns the number of bytes it processed."""
+
+    name = ''
+    # Run even after an earlier stage halted the upload
+    always = False
+    # Uses the DB, so under arun() it has to stay on the request's thread
+    thread_sensitive = True
+
+    def skip(self, upload: Upload) -> bool:
+        return False
+
+    def run(self, upload: Upload) -> int:
+        raise NotImplementedError
+
+    async def arun(self, upload: Upload):
+        """run() on a thread; returns (bytes processed, CPU seconds of that thread)."""
+        return await sync_to_async(self._timed_run, thread_sensitive=self.thread_sensitive)(upload)
+
+    def _timed_run(self, upload):
+        cpu = time.thread_time()
+        processed = self.run(upload)
+        return processed, time.thread_time() - cpu
+
+
+class Pipeline:
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    def run(self, upload: Upload) -> Upload:
+        """
+        Run the stages in order. If one raises, the upload fails, the
+        remaining `always` stages still run (so collected audit events are
+        written) and the exception is re-raised.
+        """
+        stages = iter(self.stages)
+        try:
+            for stage in stages:
+                if (upload.halted and not stage.always) or stage.skip(upload):
+                    continue
+                self._run_stage(stage, upload)
+        except Exception as e:
+            upload.halt(Upload.FAILED, f"Processing error: {e}")
+            for stage in stages:
+                if stage.always and not stage.skip(upload):
+                    self._run_stage(stage, upload)
+            raise
+        return upload
+
+    async def arun(self, upload: Upload) -> Upload:
+        """run() for async views: each stage runs through Stage.arun()."""
+        stages = iter(self.stages)
+        try:
+            for stage in stages:
+                if (upload.halted and not stage.always) or stage.skip(upload):
+                    continue
+                await self._arun_stage(stage, upload)
+        except Exception as e:
+            upload.halt(Upload.FAILED, f"Processing error: {e}")
+            for stage in stages:
+                if stage.always and not stage.skip(upload):
+                    await self._arun_stage(stage, upload)
+            raise
+        return upload
+
+    def _run_stage(self, stage, upload):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        processed = stage.run(upload)
+        self._record(stage, upload, wall, time.thread_time() - cpu, processed)
+
+    async def _arun_stage(self, stage, upload):
+        wall = time.perf_counter()
+        processed, cpu = await stage.arun(upload)
+        self._record(stage, upload, wall, cpu, processed)
+
+    def _record(self, stage, upload, wall, cpu, processed):
+        upload.metrics.append({
+            'stage': stage.name,
+            'wall': round(time.perf_counter() - wall, 6),
+            'cpu': round(cpu, 6),
+            'bytes': processed or 0,
+            **upload.stage_details.pop(stage.name, {}),
+        })
+
+
+# ---------- Request side ----------
+
+
+class ReceiveStage(Stage):
+    """Stream the request body to disk (hashing and sniffing it on the way)."""
+
+    name = 'receive'
+    thread_sensitive = False
+
+    def run(self, upload):
+        request = upload.request
+        handler = upload.handler
+        upload.uploaded_file = request.FILES.get('file')
+        upload.source_type = request.POST.get('source_type', 'pdf')
+        upload.file_name = upload.uploaded_file.name if upload.uploaded_file else ''
+
+        upload.audit('upload_attempt', f"Attempting to upload file: {upload.file_name or 'None'}")
+
+        if handler.rejection:
+            upload.audit('upload_rejected', handler.rejection)
+            upload.halt(Upload.REJECTED, handler.rejection)
+        elif not upload.uploaded_file:
+            upload.halt(Upload.REJECTED, 'Please select a file to upload.')
+        return upload.uploaded_file.size if upload.uploaded_file else 0
+
+
+class ValidateStage(Stage):
+    """Check extension and magic bytes against the declared type, then keep the file."""
+
+    name = 'validate'
+    thread_sensitive = False
+
+    def run(self, upload):
+        uploaded_file = upload.uploaded_file
+        source_type = upload.source_type
+        filename = upload.file_name
+        file_extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+        if source_type not in VALID_EXTENSIONS or file_extension not in VALID_EXTENSIONS[source_type]:
+            uploaded_file.discard()
+            upload.halt(Upload.REJECTED, f"File format incorrect. Please upload a valid {source_type.upper()} file.")
+            return 0
+
+        if uploaded_file.detected_type != source_type:
+            uploaded_file.discard()
+            upload.audit('upload_rejected', f"{filename}: content does not match type {source_type}.")
+            upload.halt(Upload.REJECTED, f"File content does not look like a valid {source_type.upper()} file.")
+            return 0
+
+        # The bytes are already in the uploads folder; just give them a unique name
+        upload.file_path = uploaded_file.commit()
+        upload.file_hash = uploaded_file.sha256
+        return uploaded_file.size
+
+
+class QueueStage(Stage):
+    """Hand the stored file to the background worker."""
+
+    name = 'queue'
+
+    def run(self, upload):
+        upload.job = ExtractionJob.objects.create(
+            user=upload.user,
+            source_type=upload.source_type,
+            file_name=upload.file_name,
+            file_path=str(upload.file_path),
+            file_hash=upload.file_hash,
+            ip_address=upload.ip_address,
+            user_agent=upload.user_agent,
+            metrics=list(upload.metrics),
+        )
+        upload.audit('upload_queued', f"{upload.file_name} queued for processing (job #{upload.job.id}).")
+        upload.status = Upload.QUEUED
+        upload.detail = 'File uploaded. It is being scanned and processed in the background.'
+        return 0
+
+
+# ---------- Worker side ----------
+
+
+class HashStage(Stage):
+    """SHA-256 of the bytes as received (usually already done by the upload handler)."""
+
+    name = 'hash'
+    thread_sensitive = False
+
+    def skip(self, upload):
+        return bool(upload.file_hash)
+
+    def run(self, upload):
+        sha256 = hashlib.sha256()
+        processed = 0
+        with open(upload.file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+                processed += len(chunk)
+        upload.file_hash = sha256.hexdigest()
+        return processed
+
+
+class DedupStage(Stage):
+    """Reuse the extraction of an identical earlier upload, if there is one."""
+
+    name = 'dedup'
+
+    def run(self, upload):
+        existing = reusable_extractions(upload.file_hash, upload.source_type).first()
+        upload.dedup_hit = existing is not None
+        if existing is not None:
+            upload.reused = existing
+            upload.audit(
+                'extraction_reused',
+                f"{upload.file_name}: identical to source #{existing.source_id}, scan/sanitize/extract skipped.",
+            )
+        return 0
+
+
+class AnalysisStage(Stage):
+    """Base for the stages a reused extraction makes unnecessary."""
+
+    def skip(self, upload):
+        return upload.reused is not None
+
+
+class ScanStage(AnalysisStage):
+    name = 'scan'
+
+    def run(self, upload):
+        processed = upload.file_size()
+        self._verdict(upload, *scan_file_for_malware(upload.file_path, upload.file_hash))
+        return processed
+
+    async def arun(self, upload):
+        # The scan is a child process or a clamd round trip; only the
+        # verdict cache lookup and store take a thread
+        processed = upload.file_size()
+        self._verdict(upload, *await ascan_file_for_malware(upload.file_path, upload.file_hash))
+        return processed, 0.0
+
+    def _verdict(self, upload, scan_status, scan_detail):
+        if scan_status is False:
+            upload.audit('upload_blocked_malware', f"{upload.file_name}: {scan_detail}")
+            try:
+                os.remove(upload.file_path)
+            except OSError:
+                pass
+            upload.halt(Upload.BLOCKED, "Upload blocked: file appears to contain malware.")
+
+        elif scan_status is True:
+            upload.scanned_clean = True
+
+        else:
+            # Scanner missing or error: we still process but log the risk.
+            upload.audit('malware_scanner_unavailable', f"{upload.file_name}: {scan_detail}")
+
+
+class SanitizeStage(AnalysisStage):
+    name = 'sanitize'
+    thread_sensitive = False
+
+    def run(self, upload):
+        processed = upload.file_size()
+        report = {}
+        sanitized_ok, sanitized_path, sanitize_msg = sanitize_file(upload.file_path, upload.source_type, report)
+        if 'peak_rss' in report:
+            upload.stage_details[self.name] = {
+                key: report[key] for key in ('peak_rss', 'pages', 'method') if key in report
+            }
+        upload.file_path = sanitized_path
+        upload.sanitized_ok = sanitized_ok
+        if not sanitized_ok:
+            upload.audit('sanitization_failed', f"{upload.file_name}: {sanitize_msg}")
+        return processed
+
+
+class ExtractStage(AnalysisStage):
+    name = 'extract'
+
+    def run(self, upload):
+        processed = upload.file_size()
+        try:
+            upload.extracted_data = run_extraction(upload.source_type, upload.file_path)
+        except ExtractionError as e:
+            upload.extracted_data = None
+            upload.detail = str(e)
+        self._check(upload)
+        return processed
+
+    async def arun(self, upload):
+        # Awaits the engine's process pool instead of blocking a thread on it
+        processed = upload.file_size()
+        try:
+            upload.extracted_data = await arun_extraction(upload.source_type, upload.file_path)
+        except ExtractionError as e:
+            upload.extracted_data = None
+            upload.detail = str(e)
+        self._check(upload)
+        return processed, 0.0
+
+    def _check(self, upload):
+        if not upload.extracted_data:
+            detail = upload.detail or "Failed to extract data from file."
+            upload.audit('extraction_failed', f"{upload.file_name}: {detail}")
+            upload.halt(Upload.FAILED, detail)
+
+
+class SanitizeOutputStage(AnalysisStage):
+    """Clean the extracted data and serialize it; the last stage of the analysis."""
+
+    name = 'sanitize_output'
+    thread_sensitive = False
+
+    def run(self, upload):
+        extracted_data = upload.extracted_data
+        if not is_stored(extracted_data):
+            # extract_excel_data() sanitizes spreadsheet rows as it stores them
+            extracted_data = sanitize_extracted_data(extracted_data)
+        upload.extracted_data = extracted_data
+        # Spreadsheet rows go to the sheet store; `data` only keeps a summary
+        upload.data_json = json.dumps(store_sheets(extracted_data), default=str)
+        upload.content_hash = hashlib.sha256(upload.data_json.encode('utf-8')).hexdigest()
+
+        upload.status = Upload.PROCESSED
+        upload.detail = "Processed successfully."
+        if not upload.sanitized_ok:
+            upload.detail = "Processed, but sanitization failed. Proceed with caution."
+        upload.audit('upload_success', f"File {upload.file_name} uploaded and processed successfully.")
+        return len(upload.data_json)
+
+
+class PersistStage(Stage):
+    name = 'persist'
+
+    def run(self, upload):
+        if upload.reused is not None:
+            data, content_hash, version = (
+                upload.reused.data, upload.reused.content_hash, upload.reused.extractor_version,
+            )
+            # The raw copy was never scanned or sanitized: share the stored file it duplicates
+            stored_name, scanned_clean = upload.reused.source.stored_name, upload.reused.source.scanned_clean
+        else:
+            data, content_hash, version = (
+                upload.data_json, upload.content_hash, EXTRACTOR_VERSIONS.get(upload.source_type, ''),
+            )
+            stored_name, scanned_clean = os.path.basename(upload.file_path), upload.scanned_clean
+
+        # All rows or none: a failure part way must not leave a source without its data
+        with transaction.atomic():
+            data_source = DataSource.objects.create(
+                user=upload.user,
+                source_type=upload.source_type,
+                file_name=upload.file_name,
+                file_hash=upload.file_hash,
+                stored_name=stored_name,
+                scanned_clean=scanned_clean,
+            )
+            extracted = ExtractedData.objects.create(
+                source=data_source,
+                user=upload.user,
+                data=data,
+                content_hash=content_hash,
+                extractor_version=version,
+            )
+            if upload.reused is None:
+                store_pages(extracted, upload.extracted_data)
+            elif upload.source_type == 'pdf':
+                ensure_pages(extracted)
+            elif upload.source_type == 'excel':
+                # Copied from a row saved before the sheet store: move its rows in now
+                ensure_sheets(extracted)
+        upload.data_source = data_source
+
+        if upload.reused is not None:
+            if upload.file_path and os.path.basename(upload.file_path) != stored_name:
+                remove_file(upload.file_path)
+            upload.status = Upload.DUPLICATE
+            upload.detail = "Processed successfully (duplicate of an earlier upload)."
+        return len(data)
+
+
+class RecordStage(Stage):
+    """
+    Keep a finished ExtractionJob for an upload processed within the request
+    (async views), so its metrics count in stage_stats() like a worker's.
+    """
+
+    name = 'record'
+    always = True
+
+    def skip(self, upload):
+        # Rejected before the file was kept
+        return not upload.file_hash
+
+    def run(self, upload):
+        done = upload.status in (Upload.PROCESSED, Upload.DUPLICATE)
+        finished = timezone.now()
+        upload.job = ExtractionJob.objects.create(
+            user=upload.user,
+            source=upload.data_source,
+            source_type=upload.source_type,
+            file_name=upload.file_name,
+            file_path=str(upload.file_path),
+            file_hash=upload.file_hash,
+            status=ExtractionJob.STATUS_DONE if done else ExtractionJob.STATUS_FAILED,
+            detail=upload.detail,
+            attempts=1,
+            dedup_hit=upload.dedup_hit,
+            metrics=list(upload.metrics),
+            ip_address=upload.ip_address,
+            user_agent=upload.user_agent,
+            started_at=finished - timedelta(seconds=sum(m['wall'] for m in upload.metrics)),
+            finished_at=finished,
+        )
+        return 0
+
+
+class AuditStage(Stage):
+    """Write the audit events collected by the earlier stages."""
+
+    name = 'audit'
+    always = True
+
+    def run(self, upload):
+        for action, message in upload.audit_events:
+            record_audit_event(
+                upload.user,
+                action,
+                message,
+                ip_address=upload.ip_address,
+                user_agent=upload.user_agent,
+            )
+        upload.audit_events = []
+        return 0
+
+
+ANALYSIS_STAGES = [ScanStage(), SanitizeStage(), ExtractStage(), SanitizeOutputStage()]
+
+# Upload views
+upload_pipeline = Pipeline([ReceiveStage(), ValidateStage(), QueueStage(), AuditStage()])
+
+# Background worker
+processing_pipeline = Pipeline([HashStage(), DedupStage(), *ANALYSIS_STAGES, PersistStage(), AuditStage()])
+
+# Async views: receive and process within the request
+inline_pipeline = Pipeline([
+    ReceiveStage(), ValidateStage(), HashStage(), DedupStage(), *ANALYSIS_STAGES,
+    PersistStage(), RecordStage(), AuditStage(),
+])
+
+# Batch API: safe on worker threads (only the scan cache uses the DB)
+analysis_pipeline = Pipeline(ANALYSIS_STAGES)
+
+
+def stage_stats(jobs=None) -> dict:
+    """
+    {stage: {count, wall, cpu, bytes, mb_per_s, peak_rss}} summed over `jobs`
+    (default: every finished job), to see where upload latency goes.
+    peak_rss is the highest one reported (0 for stages that do not report it).
+    """
+    if jobs is None:
+        jobs = ExtractionJob.objects.filter(status=ExtractionJob.STATUS_DONE)
+
+    stats = {}
+    for metrics in jobs.values_list('metrics', flat=True):
+        for m in metrics or []:
+            entry = stats.setdefault(m['stage'], {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'bytes': 0, 'peak_rss': 0})
+            entry['count'] += 1
+            entry['wall'] += m['wall']
+            entry['cpu'] += m['cpu']
+            entry['bytes'] += m['bytes']
+            entry['peak_rss'] = max(entry['peak_rss'], m.get('peak_rss') or 0)
+
+    for entry in stats.values():
+        entry['mb_per_s'] = entry['bytes'] / entry['wall'] / 1e6 if entry['wall'] else 0.0
+    return stats
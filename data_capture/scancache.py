@@ -0,0 +1,149 @@
+"""
+Malware verdict cache.
+
+Scan results are keyed by the file's SHA-256 plus the scanner's signature
+database version, so a signature update invalidates every entry at once
+(old rows are deleted when a new version is first seen). Lookups go through
+a bounded in-memory LRU first, then the ScanVerdict table.
+"""
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+
+from .models import ScanVerdict
+from .clamd import get_clamd_client, ClamdError
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_VERSION_TTL = 300  # seconds between signature version checks
+
+_lock = threading.Lock()
+_memory = OrderedDict()     # (file_hash, version) -> (is_clean, detail)
+_stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+_version = {'value': None, 'checked_at': 0.0}
+
+
+def _query_signature_version():
+    """'ClamAV 1.0.0/27000' (engine/daily db), or None if no scanner answers."""
+    client = get_clamd_client()
+    raw = None
+    if client is not None:
+        try:
+            raw = client.version()
+        except (ClamdError, OSError):
+            raw = None
+    if raw is None:
+        try:
+            result = subprocess.run(['clamscan', '--version'], capture_output=True, text=True, timeout=30)
+        except Exception:
+            return None
+        if result.returncode != 0:
+            return None
+        raw = result.stdout
+
+    raw = raw.strip()
+    if not raw:
+        return None
+    # Drop the build date: "ClamAV 1.0.0/27000/Mon Oct 12 08:17:01 2026"
+    return '/'.join(raw.split('/')[:2])[:100]
+
+
+def signature_version():
+    """Current signature version, re-checked every SCAN_VERSION_TTL seconds."""
+    ttl = getattr(settings, 'SCAN_VERSION_TTL', DEFAULT_VERSION_TTL)
+    with _lock:
+        # A missing scanner (None) is remembered too, so it is not probed per file
+        if _version['checked_at'] and time.monotonic() - _version['checked_at'] < ttl:
+            return _version['value']
+
+    version = _query_signature_version()
+
+    with _lock:
+        previous = _version['value']
+        _version['value'] = version
+        _version['checked_at'] = time.monotonic()
+        if version is not None and previous is not None and version != previous:
+            _memory.clear()
+
+    if version is not None and version != previous:
+        # Verdicts from older signatures can never match again
+        ScanVerdict.objects.exclude(signature_version=version).delete()
+    return version
+
+
+def _remember(key, verdict):
+    max_size = getattr(settings, 'SCAN_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+    with _lock:
+        _memory[key] = verdict
+        _memory.move_to_end(key)
+        while len(_memory) > max_size:
+            _memory.popitem(last=False)
+
+
+def lookup(file_hash: str, version: str):
+    """Cached (status, detail) for these bytes under `version`, or None."""
+    key = (file_hash, version)
+    with _lock:
+        verdict = _memory.get(key)
+        if verdict is not None:
+            _memory.move_to_end(key)
+            _stats['memory_hits'] += 1
+            return verdict
+
+    row = (
+        ScanVerdict.objects
+        .filter(file_hash=file_hash, signature_version=version)
+        .values_list('pk', 'is_clean', 'detail')
+        .first()
+    )
+    if row is None:
+        with _lock:
+            _stats['misses'] += 1
+        return None
+
+    pk, is_clean, detail = row
+    ScanVerdict.objects.filter(pk=pk).update(hits=F('hits') + 1)
+    verdict = (is_clean, detail)
+    _remember(key, verdict)
+    with _lock:
+        _stats['db_hits'] += 1
+    return verdict
+
+
+def store(file_hash: str, version: str, status, detail: str):
+    """Cache a definite verdict (True/False); scanner errors (None) are not cached."""
+    if status is None:
+        return
+    try:
+        ScanVerdict.objects.get_or_create(
+            file_hash=file_hash,
+            signature_version=version,
+            defaults={'is_clean': status, 'detail': detail},
+        )
+    except IntegrityError:
+        pass  # another worker stored it first
+    _remember((file_hash, version), (status, detail))
+
+
+def scan_cache_stats() -> dict:
+    """Hit/miss counters of this process, plus the size of the persistent cache."""
+    with _lock:
+        counts = dict(_stats)
+        counts['memory_entries'] = len(_memory)
+    hits = counts['memory_hits'] + counts['db_hits']
+    total = hits + counts['misses']
+    counts['hit_rate'] = hits / total if total else 0.0
+    counts['stored_verdicts'] = ScanVerdict.objects.count()
+    return counts
+
+
+def clear():
+    """Forget the in-memory layer, the counters and the known version (tests)."""
+    with _lock:
+        _memory.clear()
+        _stats.update(memory_hits=0, db_hits=0, misses=0)
+        _version.update(value=None, checked_at=0.0)
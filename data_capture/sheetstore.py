@@ -0,0 +1,578 @@
+"""
+Columnar storage for extracted spreadsheets.
+
+As JSON, an Excel extraction is one big list of lists: every read parses
+every cell and every number is stored as text. Instead, the rows are
+written to a ``.sheets`` file under SHEET_STORE_DIR and ``ExtractedData.data``
+only keeps a summary that points at it:
+
+    {'type': 'excel', 'storage': 'sheets', 'file': '<sha256>.sheets',
+     'sheets': {name: {'columns': [...], 'dtypes': [...], 'row_count': N}}}
+
+Each sheet is cut into blocks of SHEET_STORE_BLOCK_ROWS rows, and each
+column of a block is stored as a typed array (int64, float64, bool,
+datetime64[us], or UTF-8 text with offsets) and zlib-compressed on its own.
+Repetitive text (categories, names) is dictionary-encoded first. Files are
+memory-mapped for reading, and only the blocks of the requested columns and
+rows are decompressed.
+
+Files are named after their SHA-256, so identical extractions (and the
+copies made for duplicate uploads) share one file, which never changes
+once written. A file is deleted with the last row that points at it
+(``release_sheet_files``); the worker also removes orphans on start
+(``collect_garbage``). Rows stored as JSON before the sheet store existed are moved
+into it by ``manage.py backfill_extractions`` (``ensure_sheets``); until
+then the views read them from the JSON (``read_summary``).
+
+Layout: MAGIC, the column blocks, the footer (JSON: sheets, their columns
+and where each block is), then the footer's length and MAGIC again.
+"""
+import datetime
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .models import ExtractedData
+
+MAGIC = b'SHEETS1\n'
+TRAILER = struct.Struct('<Q8s')  # footer length, MAGIC
+COMPRESS_LEVEL = 1  # most of the size win at a fraction of the CPU of the default
+
+DEFAULT_BLOCK_ROWS = 8192
+
+# Files younger than this are never garbage collected
+DEFAULT_GC_MIN_AGE = datetime.timedelta(hours=1)
+
+# Integers floats can hold exactly; a column mixing floats with larger ones is stored as JSON
+MAX_EXACT_FLOAT_INT = 2 ** 53
+
+ARRAY_DTYPES = {
+    'int': '<i8',
+    'float': '<f8',
+    'bool': 'u1',
+    'datetime': '<i8',
+}
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+NAT = np.iinfo(np.int64).min  # numpy's "not a time", read back as None
+
+
+def store_dir() -> Path:
+    return Path(getattr(settings, 'SHEET_STORE_DIR', settings.BASE_DIR / 'sheet_store'))
+
+
+def is_stored(data) -> bool:
+    """Whether `data` is a summary written by store_sheets()."""
+    return isinstance(data, dict) and data.get('storage') == 'sheets'
+
+
+def _kind_of(value_type) -> str:
+    # bool before int: True is an int too
+    for base, kind in ((bool, 'bool'), (int, 'int'), (float, 'float'), (str, 'str'), (datetime.datetime, 'datetime')):
+        if issubclass(value_type, base):
+            return kind
+    return 'json'
+
+
+def _column_kind(values, types):
+    """The kind to store a block's column as, and whether it mixes ints into floats."""
+    kinds = {_kind_of(t) for t in types if t is not type(None)}
+    if not kinds:
+        return 'null', False
+    if len(kinds) > 1:
+        if kinds == {'int', 'float'} and all(
+            abs(v) <= MAX_EXACT_FLOAT_INT for v in values if isinstance(v, int)
+        ):
+            # Excel numbers come back as int when they are whole: keep which were
+            return 'float', True
+        return 'json', False
+
+    kind = kinds.pop()
+    if kind == 'int' and not all(-2 ** 63 <= v < 2 ** 63 for v in values if v is not None):
+        return 'json', False
+    if kind == 'datetime' and any(v.tzinfo is not None for v in values if v is not None):
+        return 'json', False
+    return kind, False
+
+
+def _pack_texts(texts) -> bytes:
+    offsets = np.zeros(len(texts) + 1, dtype='<i8')
+    np.cumsum([len(t) for t in texts], out=offsets[1:])
+    return offsets.tobytes() + ''.join(texts).encode('utf-8')
+
+
+def _unpack_texts(data: bytes, n: int, pos: int) -> list:
+    """The n texts _pack_texts() wrote at `pos` (always the end of a payload)."""
+    offsets = np.frombuffer(data, '<i8', n + 1, pos).tolist()
+    text = data[pos + 8 * (n + 1):].decode('utf-8')
+    return [text[a:b] for a, b in zip(offsets, offsets[1:])]
+
+
+def _encode_column(values):
+    """({'kind', 'nulls', 'ints'[, 'words']}, uncompressed payload) for one column of a block."""
+    types = set(map(type, values))
+    kind, mixed_ints = _column_kind(values, types)
+    has_nulls = type(None) in types
+    entry = {'kind': kind, 'nulls': has_nulls, 'ints': mixed_ints}
+
+    parts = []
+    if has_nulls:
+        parts.append(np.packbits([v is None for v in values]).tobytes())
+    if mixed_ints:
+        parts.append(np.packbits([isinstance(v, int) for v in values]).tobytes())
+
+    if kind == 'bool':
+        parts.append(np.array([bool(v) for v in values], dtype='u1').tobytes())
+    elif kind in ('int', 'float'):
+        if has_nulls:
+            values = [0 if v is None else v for v in values]
+        parts.append(np.array(values, dtype=ARRAY_DTYPES[kind]).tobytes())
+    elif kind == 'datetime':
+        # Much faster than letting numpy convert datetime objects
+        micros = [NAT if v is None else (v - EPOCH) // MICROSECOND for v in values]
+        parts.append(np.array(micros, dtype='<i8').tobytes())
+    elif kind == 'str':
+        texts = ['' if v is None else v for v in values] if has_nulls else values
+        words = dict.fromkeys(texts)
+        if len(words) <= len(texts) // 2:
+            # Repetitive text (categories, names): each distinct value once, then codes
+            for code, word in enumerate(words):
+                words[word] = code
+            parts.append(np.array([words[t] for t in texts], dtype='<i4').tobytes())
+            parts.append(_pack_texts(list(words)))
+            entry['words'] = len(words)
+        else:
+            parts.append(_pack_texts(texts))
+    elif kind == 'json':
+        parts.append(_pack_texts(['' if v is None else json.dumps(v, default=str) for v in values]))
+
+    return entry, b''.join(parts)
+
+
+def _decode_column(entry, data: bytes, n: int) -> list:
+    kind = entry['kind']
+    if kind == 'null':
+        return [None] * n
+
+    pos = 0
+    mask_size = (n + 7) // 8
+    nulls = ints = None
+    if entry['nulls']:
+        nulls = np.unpackbits(np.frombuffer(data, 'u1', mask_size, pos), count=n)
+        pos += mask_size
+    if entry['ints']:
+        ints = np.unpackbits(np.frombuffer(data, 'u1', mask_size, pos), count=n)
+        pos += mask_size
+
+    if kind == 'bool':
+        values = np.frombuffer(data, 'u1', n, pos).astype(bool).tolist()
+    elif kind == 'datetime':
+        values = np.frombuffer(data, '<i8', n, pos).view('datetime64[us]').tolist()
+    elif kind in ARRAY_DTYPES:
+        values = np.frombuffer(data, ARRAY_DTYPES[kind], n, pos).tolist()
+    elif 'words' in entry:
+        codes = np.frombuffer(data, '<i4', n, pos)
+        words = np.array(_unpack_texts(data, entry['words'], pos + 4 * n), dtype=object)
+        values = words[codes].tolist()
+    else:
+        values = _unpack_texts(data, n, pos)
+        if kind == 'json':
+            values = [json.loads(v) if v else None for v in values]
+
+    if ints is not None:
+        for i in np.flatnonzero(ints).tolist():
+            values[i] = int(values[i])
+    if nulls is not None:
+        for i in np.flatnonzero(nulls).tolist():
+            values[i] = None
+    return values
+
+
+def _sheet_dtypes(sheet) -> list:
+    """One dtype per column: the kind its blocks agree on, 'mixed' if they don't."""
+    dtypes = []
+    for i in range(len(sheet['columns'])):
+        kinds = {
+            block['columns'][i]['kind'] for block in sheet['blocks']
+            if i < len(block['columns'])
+        } - {'null'}
+        dtypes.append(kinds.pop() if len(kinds) == 1 else ('null' if not kinds else 'mixed'))
+    return dtypes
+
+
+class SheetWriter:
+    """
+    Write (sheet_name, columns, rows) chunks, sheet by sheet (as yielded by
+    utils.iter_excel_rows), to a new .sheets file; close() returns its name.
+    At most one block of rows is held at a time.
+    """
+
+    def __init__(self, directory=None, block_rows=None):
+        self.directory = Path(directory or store_dir())
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.block_rows = max(1, block_rows or getattr(settings, 'SHEET_STORE_BLOCK_ROWS', DEFAULT_BLOCK_ROWS))
+        self.sheets = []
+        self._sheet = None
+        self._pending = []
+        self._sha256 = hashlib.sha256()
+        self._offset = 0
+        fd, self._tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        self._file = os.fdopen(fd, 'wb')
+        self._write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._sha256.update(data)
+        self._offset += len(data)
+
+    def add(self, sheet_name, columns, rows):
+        if self._sheet is None or self._sheet['name'] != sheet_name:
+            self._flush()
+            self._sheet = {'name': sheet_name, 'columns': [], 'row_count': 0, 'blocks': []}
+            self.sheets.append(self._sheet)
+        # iter_excel_rows() may widen the columns as the sheet goes
+        self._sheet['columns'] = list(columns)
+
+        pending = self._pending
+        pending.extend(rows)
+        start = 0
+        while len(pending) - start >= self.block_rows:
+            self._write_block(pending[start:start + self.block_rows])
+            start += self.block_rows
+        self._pending = pending[start:]
+
+    def _flush(self):
+        if self._pending:
+            self._write_block(self._pending)
+            self._pending = []
+
+    def _write_block(self, rows):
+        block = {'start': self._sheet['row_count'], 'rows': len(rows), 'columns': []}
+        for values in itertools.zip_longest(*rows):
+            entry, payload = _encode_column(values)
+            compressed = zlib.compress(payload, COMPRESS_LEVEL)
+            entry.update(offset=self._offset, length=len(compressed))
+            self._write(compressed)
+            block['columns'].append(entry)
+        self._sheet['blocks'].append(block)
+        self._sheet['row_count'] += len(rows)
+
+    def close(self) -> str:
+        """Finish the file and move it into place; returns its name in the directory."""
+        self._flush()
+        for sheet in self.sheets:
+            sheet['dtypes'] = _sheet_dtypes(sheet)
+        footer = json.dumps({'sheets': self.sheets}, default=str).encode('utf-8')
+        self._write(footer)
+        self._write(TRAILER.pack(len(footer), MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        name = f'{self._sha256.hexdigest()}.sheets'
+        os.replace(self._tmp_path, self.directory / name)
+        return name
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+class SheetFile:
+    """Memory-mapped read access to a .sheets file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            end = len(self._mm) - TRAILER.size
+            footer_size, magic = TRAILER.unpack_from(self._mm, end)
+            if self._mm[:len(MAGIC)] != MAGIC or magic != MAGIC:
+                raise ValueError(f"{path} is not a sheets file")
+            footer = json.loads(self._mm[end - footer_size:end])
+        except Exception:
+            self._mm.close()
+            raise
+        self.sheets = {sheet['name']: sheet for sheet in footer['sheets']}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._mm.close()
+
+    def columns(self, sheet_name) -> list:
+        return self.sheets[sheet_name]['columns']
+
+    def row_count(self, sheet_name) -> int:
+        return self.sheets[sheet_name]['row_count']
+
+    def _blocks(self, sheet, start, stop):
+        for block in sheet['blocks']:
+            first = block['start']
+            if first + block['rows'] <= start:
+                continue
+            if first >= stop:
+                break
+            yield block, max(start - first, 0), min(stop - first, block['rows'])
+
+    def _column_slice(self, block, index, lo, hi) -> list:
+        if index >= len(block['columns']):
+            return [None] * (hi - lo)  # the sheet grew wider after this block
+        entry = block['columns'][index]
+        data = zlib.decompress(self._mm[entry['offset']:entry['offset'] + entry['length']])
+        return _decode_column(entry, data, block['rows'])[lo:hi]
+
+    def _range(self, sheet_name, start, stop):
+        sheet = self.sheets[sheet_name]
+        stop = sheet['row_count'] if stop is None else min(stop, sheet['row_count'])
+        return sheet, max(start, 0), stop
+
+    def read_column(self, sheet_name, column, start=0, stop=None) -> list:
+        """Values of one column (index or name) for rows start..stop-1."""
+        sheet, start, stop = self._range(sheet_name, start, stop)
+        index = sheet['columns'].index(column) if isinstance(column, str) else column
+        values = []
+        for block, lo, hi in self._blocks(sheet, start, stop):
+            values.extend(self._column_slice(block, index, lo, hi))
+        return values
+
+    def read_rows(self, sheet_name, start=0, stop=None) -> list:
+        """Rows start..stop-1 of a sheet as lists, like load_sheets()."""
+        sheet, start, stop = self._range(sheet_name, start, stop)
+        width = len(sheet['columns'])
+        rows = []
+        for block, lo, hi in self._blocks(sheet, start, stop):
+            if not width:
+                rows.extend([] for _ in range(hi - lo))
+                continue
+            columns = [self._column_slice(block, i, lo, hi) for i in range(width)]
+            rows.extend(map(list, zip(*columns)))
+        return rows
+
+
+class JsonSheets:
+    """SheetFile's read methods over rows still stored as JSON (see read_summary)."""
+
+    def __init__(self, data):
+        self.sheets = data['sheets']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def close(self):
+        pass
+
+    def columns(self, sheet_name) -> list:
+        return self.sheets[sheet_name]['columns']
+
+    def row_count(self, sheet_name) -> int:
+        return self.sheets[sheet_name]['row_count']
+
+    def read_rows(self, sheet_name, start=0, stop=None) -> list:
+        return self.sheets[sheet_name]['rows'][max(start, 0):stop]
+
+
+def open_sheets(data):
+    """The SheetFile a store_sheets() summary points at (JsonSheets for a read_summary() of JSON rows)."""
+    if data.get('storage') == 'json':
+        return JsonSheets(data)
+    return SheetFile(store_dir() / data['file'])
+
+
+def store_sheets(data):
+    """
+    Write the rows of a spreadsheet extraction held in memory (from before
+    the sheet store, or built by hand) to the store and return the summary to
+    keep in ExtractedData.data. Anything else (summaries, other types, failed
+    extractions) is returned unchanged.
+    """
+    if is_stored(data):
+        return data
+    if not isinstance(data, dict) or data.get('type') != 'excel' or not isinstance(data.get('sheets'), dict):
+        return data
+    return write_sheets(
+        (sheet_name, sheet.get('columns', []), sheet.get('rows', []))
+        for sheet_name, sheet in data['sheets'].items()
+    )
+
+
+def write_sheets(chunks):
+    """
+    Write (sheet_name, columns, rows) chunks, as yielded by
+    utils.iter_excel_rows, to the store and return the summary to keep in
+    ExtractedData.data. Only one chunk is held at a time.
+    """
+    with SheetWriter() as writer:
+        for sheet_name, columns, rows in chunks:
+            writer.add(sheet_name, columns, rows)
+        name = writer.close()
+
+    return {
+        'type': 'excel',
+        'storage': 'sheets',
+        'file': name,
+        'sheets': {
+            sheet['name']: {
+                'columns': sheet['columns'],
+                'dtypes': sheet['dtypes'],
+                'row_count': sheet['row_count'],
+            }
+            for sheet in writer.sheets
+        },
+    }
+
+
+def load_sheets(data):
+    """
+    store_sheets() undone: the summary `data` with every sheet's rows read
+    back in, for callers that return whole extractions. Anything else is
+    returned unchanged.
+    """
+    if not is_stored(data):
+        return data
+    with open_sheets(data) as sheets:
+        return {
+            'type': 'excel',
+            'sheets': {
+                name: {
+                    'columns': sheets.columns(name),
+                    'rows': sheets.read_rows(name),
+                    'row_count': sheets.row_count(name),
+                }
+                for name in data['sheets']
+            },
+        }
+
+
+def sheet_files(extracted_rows) -> set:
+    """Names of the .sheets files the ExtractedData queryset `extracted_rows` point at."""
+    names = set()
+    for raw in extracted_rows.filter(data__contains='"storage": "sheets"').values_list('data', flat=True):
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            continue
+        if is_stored(data):
+            names.add(data['file'])
+    return names
+
+
+def release_sheet_files(names):
+    """
+    Delete each of the .sheets files `names` that no ExtractedData points at
+    any more. Call after deleting the rows that used them: identical
+    extractions share one file.
+    """
+    for name in names:
+        if not ExtractedData.objects.filter(data__contains=name).exists():
+            try:
+                os.remove(store_dir() / name)
+            except OSError:
+                pass
+
+
+def collect_garbage(min_age=DEFAULT_GC_MIN_AGE) -> int:
+    """
+    Delete .sheets files no ExtractedData points at and writers' leftover temp
+    files, if older than `min_age` (a file just written may not have its row
+    yet). Returns the number of files removed.
+    """
+    directory = store_dir()
+    if not directory.is_dir():
+        return 0
+    referenced = sheet_files(ExtractedData.objects.all())
+    cutoff = time.time() - min_age.total_seconds()
+    removed = 0
+    for path in directory.iterdir():
+        if path.suffix not in ('.sheets', '.tmp') or path.name in referenced:
+            continue
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def read_summary(extracted: ExtractedData):
+    """
+    The store_sheets() summary of a spreadsheet extraction, without writing
+    anything. Rows still stored as JSON (until ``manage.py
+    backfill_extractions`` moves them) get a summary with 'storage': 'json'
+    that carries them, which open_sheets() reads the same way. None if
+    `extracted` is not a spreadsheet.
+    """
+    raw = ExtractedData.objects.filter(pk=extracted.pk).values_list('data', flat=True).first()
+    try:
+        data = json.loads(raw or '')
+    except ValueError:
+        return None
+    if is_stored(data):
+        return data
+    if not isinstance(data, dict) or data.get('type') != 'excel' or not isinstance(data.get('sheets'), dict):
+        return None
+
+    sheets = {}
+    for name, sheet in data['sheets'].items():
+        rows = sheet.get('rows') or []
+        sheets[name] = {
+            'columns': sheet.get('columns', []),
+            'dtypes': [],
+            'row_count': len(rows),
+            'rows': rows,
+        }
+    return {'type': 'excel', 'storage': 'json', 'sheets': sheets}
+
+
+def ensure_sheets(extracted: ExtractedData):
+    """
+    The store_sheets() summary of a spreadsheet extraction, after moving rows
+    still stored as JSON (from before the sheet store, or copied from such a
+    row) into the store. None if `extracted` is not a spreadsheet.
+    """
+    raw = ExtractedData.objects.filter(pk=extracted.pk).values_list('data', flat=True).first()
+    try:
+        data = json.loads(raw or '')
+    except ValueError:
+        return None
+    if is_stored(data):
+        return data
+
+    summary = store_sheets(data)
+    if summary is data:
+        return None
+    data_json = json.dumps(summary, default=str)
+    ExtractedData.objects.filter(pk=extracted.pk).update(
+        data=data_json,
+        content_hash=hashlib.sha256(data_json.encode('utf-8')).hexdigest(),
+    )
+    return summary
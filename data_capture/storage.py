@@ -0,0 +1,61 @@
+"""
+Where uploaded files are kept.
+
+Uploads are stored in MEDIA_ROOT/uploads under a unique name (a random
+prefix in front of the client's file name), recorded in
+DataSource.stored_name. A duplicate upload shares the stored file of the
+earlier, already scanned and sanitized upload instead of keeping its own raw
+copy, so a stored file is only deleted together with its last source.
+"""
+import os
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils.text import get_valid_filename
+
+from .models import DataSource
+
+MAX_NAME_LENGTH = 200
+
+
+def upload_dir():
+    return settings.MEDIA_ROOT / 'uploads'
+
+
+def new_stored_path(file_name: str):
+    """A fresh path in the uploads folder for a file the client called `file_name`."""
+    try:
+        name = get_valid_filename(os.path.basename(file_name or ''))
+    except SuspiciousFileOperation:
+        # Names that end up empty, '.' or '..'
+        name = 'upload'
+    stem, ext = os.path.splitext(name)
+    name = stem[:MAX_NAME_LENGTH - len(ext)] + ext
+    return upload_dir() / f"{uuid.uuid4().hex}_{name}"
+
+
+def stored_path(stored_name: str):
+    return upload_dir() / stored_name if stored_name else None
+
+
+def stored_url(stored_name: str) -> str:
+    return settings.MEDIA_URL + 'uploads/' + quote(stored_name)
+
+
+def remove_file(path):
+    """Delete `path`, ignoring a file that is already gone."""
+    try:
+        os.remove(path)
+    except (OSError, TypeError):
+        pass
+
+
+def release_stored_file(source: DataSource):
+    """Delete `source`'s stored file unless another source shares it. Call before deleting the source."""
+    if not source.stored_name:
+        return
+    shared = DataSource.objects.filter(stored_name=source.stored_name).exclude(pk=source.pk).exists()
+    if not shared:
+        remove_file(stored_path(source.stored_name))
@@ -0,0 +1,126 @@
+"""
+A tiny stand-in for clamd, enough of the protocol for the client tests:
+PING, VERSION, IDSESSION/END and INSTREAM, over TCP or a Unix socket.
+
+Anything containing SIGNATURE is reported as infected.
+"""
+import os
+import socketserver
+import struct
+import threading
+
+SIGNATURE = b'EICAR-STANDARD-ANTIVIRUS-TEST-FILE'
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        data = b''
+        while True:
+            byte = self.rfile.read(1)
+            if not byte:
+                return None
+            if byte in (b'\0', b'\n'):
+                return data
+            data += byte
+
+    def _read_stream(self, limit):
+        total = 0
+        data = b''
+        while True:
+            header = self.rfile.read(4)
+            if len(header) < 4:
+                return None
+            (length,) = struct.unpack('!L', header)
+            if length == 0:
+                return data
+            total += length
+            if total > limit:
+                return False
+            data += self.rfile.read(length)
+
+    def handle(self):
+        fake = self.server.fake
+        with fake.lock:
+            fake.connections += 1
+
+        session = False
+        request_id = 1
+        while True:
+            command = self._read_command()
+            if command is None:
+                return
+            name = command.lstrip(b'zn')
+
+            if name == b'IDSESSION':
+                session = True
+                continue
+            if name == b'END':
+                return
+
+            close = not session
+            if name == b'PING':
+                reply = 'PONG'
+            elif name == b'VERSION':
+                reply = 'ClamAV 1.0.0/fake'
+            elif name == b'INSTREAM':
+                data = self._read_stream(fake.stream_max_length)
+                if data is None:
+                    return
+                if data is False:
+                    reply, close = 'INSTREAM size limit exceeded. ERROR', True
+                else:
+                    with fake.lock:
+                        fake.scanned.append(data)
+                    reply = 'stream: Eicar-Test-Signature FOUND' if SIGNATURE in data else 'stream: OK'
+            else:
+                reply, close = 'UNKNOWN COMMAND', True
+
+            prefix = f"{request_id}: " if session else ''
+            request_id += 1
+            self.wfile.write((prefix + reply).encode() + b'\0')
+            self.wfile.flush()
+            if close or fake.close_after_reply:
+                return
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class FakeClamd:
+    """
+    Run with ``with FakeClamd() as fake:``; then use fake.host/fake.port
+    (or fake.socket_path when created with a socket_path).
+    """
+
+    def __init__(self, socket_path=None, stream_max_length=25 * 1024 * 1024, close_after_reply=False):
+        self.socket_path = socket_path
+        self.stream_max_length = stream_max_length
+        # Simulates clamd's IdleTimeout dropping pooled sessions
+        self.close_after_reply = close_after_reply
+        self.connections = 0
+        self.scanned = []
+        self.lock = threading.Lock()
+
+        if socket_path:
+            self.server = _UnixServer(socket_path, _Handler)
+        else:
+            self.server = _TCPServer(('127.0.0.1', 0), _Handler)
+            self.host, self.port = self.server.server_address
+        self.server.fake = self
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
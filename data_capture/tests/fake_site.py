@@ -0,0 +1,117 @@
+"""
+A small local web site for the website capture tests.
+
+Pages are registered with fake.add(path, body, ...). ETag and Last-Modified
+are honoured for conditional GETs, and pages can redirect, be slow, or
+trickle their body out a few bytes at a time.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse can be counted
+
+    def setup(self):
+        super().setup()
+        with self.server.fake.lock:
+            self.server.fake.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        fake = self.server.fake
+        with fake.lock:
+            fake.requests.append((self.path, dict(self.headers)))
+        page = fake.pages.get(self.path)
+        if page is None:
+            self._respond(404, b'Not found', {'Content-Type': 'text/plain'})
+            return
+
+        if page['delay']:
+            time.sleep(page['delay'])
+        if page['location']:
+            self._respond(302, b'', {'Location': page['location']})
+            return
+
+        headers = {'Content-Type': page['content_type']}
+        if page['etag']:
+            headers['ETag'] = page['etag']
+        if page['last_modified']:
+            headers['Last-Modified'] = page['last_modified']
+        if ((page['etag'] and self.headers.get('If-None-Match') == page['etag'])
+                or (page['last_modified'] and self.headers.get('If-Modified-Since') == page['last_modified'])):
+            self._respond(304, b'', headers, length=False)
+            return
+
+        if page['trickle']:
+            # No Content-Length: the body ends when the connection closes
+            headers['Connection'] = 'close'
+            self._respond(200, b'', headers, length=False)
+            for offset in range(0, len(page['body']), 8):
+                self.wfile.write(page['body'][offset:offset + 8])
+                self.wfile.flush()
+                time.sleep(page['trickle'])
+            self.close_connection = True
+            return
+
+        self._respond(200, page['body'], headers, length=page['send_length'])
+        if not page['send_length']:
+            self.close_connection = True
+
+    def _respond(self, status, body, headers, length=True):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if length:
+            self.send_header('Content-Length', str(len(body)))
+        elif status == 200 and 'Connection' not in headers:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeSite:
+    """Run with ``with FakeSite() as fake:``; fake.url(path) is the page's address."""
+
+    def __init__(self):
+        self.pages = {}
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.fake = self
+        self.host, self.port = self.server.server_address
+
+    def add(self, path, body=b'', content_type='text/html; charset=utf-8', etag='', last_modified='',
+            location='', delay=0.0, trickle=0.0, send_length=True):
+        self.pages[path] = {
+            'body': body.encode('utf-8') if isinstance(body, str) else body,
+            'content_type': content_type,
+            'etag': etag,
+            'last_modified': last_modified,
+            'location': location,
+            'delay': delay,
+            'trickle': trickle,
+            'send_length': send_length,
+        }
+
+    def url(self, path):
+        return f"http://{self.host}:{self.port}{path}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,194 @@
+import asyncio
+import shutil
+import tempfile
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest.mock import AsyncMock, patch
+
+from data_capture.models import DataSource, ExtractedData, ExtractionJob, AuditLog
+
+
+User = get_user_model()
+
+TMP_MEDIA = Path(tempfile.mkdtemp(prefix="async_media_"))
+
+
+def _pdf(name="doc.pdf", body=b"%PDF-1.4\n%dummy"):
+    return SimpleUploadedFile(name, body, content_type="application/pdf")
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA)
+class AsyncViewTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TMP_MEDIA, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="asyncuser",
+            email="async@example.com",
+            password="asyncpass123",
+        )
+        self.async_client.force_login(self.user)
+
+        patches = [
+            patch("data_capture.pipeline.ascan_file_for_malware", new_callable=AsyncMock,
+                  return_value=(True, "clean")),
+            patch("data_capture.pipeline.sanitize_file",
+                  side_effect=lambda path, source_type, *_: (True, path, "ok")),
+            patch("data_capture.pipeline.arun_extraction", new_callable=AsyncMock,
+                  return_value={"pages": [{"page": 1, "text": "hello"}]}),
+        ]
+        self.mock_scan, self.mock_sanitize, self.mock_extract = [p.start() for p in patches]
+        for p in patches:
+            self.addCleanup(p.stop)
+
+    async def test_home_lists_only_user_sources(self):
+        await DataSource.objects.acreate(user=self.user, source_type="pdf", file_name="a.pdf")
+        other = await User.objects.acreate(username="other", email="other@example.com")
+        await DataSource.objects.acreate(user=other, source_type="pdf", file_name="b.pdf")
+
+        response = await self.async_client.get(reverse("async_home"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s.file_name for s in response.context["sources"]], ["a.pdf"])
+        self.assertContains(response, reverse("async_upload_file"))
+
+    async def test_requires_login(self):
+        anonymous = AsyncClient()
+
+        response = await anonymous.get(reverse("async_home"))
+        self.assertEqual(response.status_code, 302)
+
+        response = await anonymous.post(reverse("async_api_upload_file"), {"file": _pdf()})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_api_upload_processes_inline(self):
+        response = await self.async_client.post(
+            reverse("async_api_upload_file"), {"file": _pdf(), "source_type": "pdf"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["status"], "processed")
+        self.assertEqual(body["data"]["pages"][0]["text"], "hello")
+
+        source = await DataSource.objects.aget(pk=body["source_id"])
+        self.assertEqual(len(source.file_hash), 64)
+        self.assertTrue(await ExtractedData.objects.filter(source=source).aexists())
+        self.assertTrue(await AuditLog.objects.filter(action="upload_success").aexists())
+        self.mock_extract.assert_called_once()
+
+        # Stage metrics are kept like a worker's
+        job = await ExtractionJob.objects.aget(pk=body["job_id"])
+        self.assertEqual(job.status, ExtractionJob.STATUS_DONE)
+        self.assertEqual(job.source_id, source.id)
+        self.assertEqual(
+            [m["stage"] for m in job.metrics],
+            ["receive", "validate", "dedup", "scan", "sanitize", "extract", "sanitize_output", "persist"],
+        )
+
+    async def test_concurrent_uploads_are_scanned_at_the_same_time(self):
+        # Each scan waits for the other one to start: uploads that ran one
+        # after the other would time out here
+        arrived, both = [], asyncio.Event()
+
+        async def scan(file_path, file_hash=None):
+            arrived.append(file_path)
+            if len(arrived) == 2:
+                both.set()
+            await asyncio.wait_for(both.wait(), timeout=5)
+            return True, "clean"
+
+        self.mock_scan.side_effect = scan
+        url = reverse("async_api_upload_file")
+
+        responses = await asyncio.gather(
+            self.async_client.post(url, {"file": _pdf(body=b"%PDF-1.4\none"), "source_type": "pdf"}),
+            self.async_client.post(url, {"file": _pdf(body=b"%PDF-1.4\ntwo"), "source_type": "pdf"}),
+        )
+
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(len(arrived), 2)
+
+    async def test_api_upload_reuses_identical_file(self):
+        url = reverse("async_api_upload_file")
+        await self.async_client.post(url, {"file": _pdf("one.pdf"), "source_type": "pdf"})
+        response = await self.async_client.post(url, {"file": _pdf("two.pdf"), "source_type": "pdf"})
+
+        self.assertEqual(response.json()["status"], "duplicate")
+        self.assertEqual(self.mock_extract.call_count, 1)
+        self.assertEqual(await ExtractedData.objects.acount(), 2)
+
+    async def test_api_upload_blocked_by_scanner(self):
+        self.mock_scan.return_value = (False, "Eicar-Test-Signature FOUND")
+
+        response = await self.async_client.post(
+            reverse("async_api_upload_file"), {"file": _pdf(), "source_type": "pdf"}
+        )
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(await DataSource.objects.aexists())
+        self.mock_extract.assert_not_called()
+
+    async def test_html_upload_rejects_mismatched_content(self):
+        response = await self.async_client.post(
+            reverse("async_upload_file"),
+            {"file": _pdf(body=b"not a pdf"), "source_type": "pdf"},
+        )
+
+        self.assertRedirects(response, reverse("async_home"), fetch_redirect_response=False)
+        self.assertFalse(await DataSource.objects.aexists())
+        self.assertTrue(await AuditLog.objects.filter(action="upload_rejected").aexists())
+
+    async def test_html_upload_refused_by_csrf_keeps_no_file(self):
+        uploads = TMP_MEDIA / "uploads"
+        before = set(uploads.iterdir()) if uploads.exists() else set()
+        client = AsyncClient(enforce_csrf_checks=True)
+        await sync_to_async(client.force_login)(self.user)
+
+        response = await client.post(reverse("async_upload_file"), {"file": _pdf(), "source_type": "pdf"})
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(set(uploads.iterdir()) - before, set())
+        self.assertFalse(await ExtractionJob.objects.aexists())
+
+    async def test_api_upload_reports_mismatched_content(self):
+        response = await self.async_client.post(
+            reverse("async_api_upload_file"), {"file": _pdf(body=b"not a pdf"), "source_type": "pdf"}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "File content does not look like a valid PDF file.")
+        self.assertFalse(await ExtractionJob.objects.aexists())
+
+    async def test_uploads_with_the_same_name_are_stored_separately(self):
+        url = reverse("async_api_upload_file")
+        await self.async_client.post(url, {"file": _pdf(body=b"%PDF-1.4\nfirst"), "source_type": "pdf"})
+        await self.async_client.post(url, {"file": _pdf(body=b"%PDF-1.4\nsecond"), "source_type": "pdf"})
+
+        names = [name async for name in DataSource.objects.values_list("stored_name", flat=True)]
+        self.assertEqual(len(set(names)), 2)
+        contents = {(TMP_MEDIA / "uploads" / name).read_bytes() for name in names}
+        self.assertEqual(contents, {b"%PDF-1.4\nfirst", b"%PDF-1.4\nsecond"})
+
+    async def test_source_detail_is_scoped_to_owner(self):
+        other = await User.objects.acreate(username="other", email="other@example.com")
+        foreign = await DataSource.objects.acreate(user=other, source_type="pdf", file_name="x.pdf")
+        own = await DataSource.objects.acreate(user=self.user, source_type="pdf", file_name="y.pdf")
+        await ExtractedData.objects.acreate(
+            source=own, user=self.user, data='{"type": "pdf", "pages": 1, "content": [{"page": 1, "text": "hi"}]}'
+        )
+
+        response = await self.async_client.get(reverse("async_source_detail", args=[foreign.pk]))
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.get(reverse("async_source_detail", args=[own.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["extracted_type"], "pdf")
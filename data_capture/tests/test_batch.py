@@ -0,0 +1,161 @@
+import hashlib
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest.mock import patch
+
+from data_capture import sheetstore
+from data_capture.models import DataSource, ExtractedData, AuditLog
+from data_capture.utils import EXTRACTOR_VERSIONS
+
+
+User = get_user_model()
+
+TMP_MEDIA = Path(tempfile.mkdtemp(prefix="batch_media_"))
+
+
+def _fake_extract(source_type, path):
+    return {"type": source_type, "path": Path(path).name}
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA)
+@patch("data_capture.pipeline.run_extraction", side_effect=_fake_extract)
+@patch("data_capture.pipeline.sanitize_file", side_effect=lambda path, source_type, *_: (True, path, "ok"))
+@patch("data_capture.pipeline.scan_file_for_malware", return_value=(True, "clean"))
+class BatchUploadApiTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TMP_MEDIA, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="batchuser",
+            email="batch@example.com",
+            password="batchpass123",
+        )
+        self.client.force_login(self.user)
+
+    def _pdf(self, name, body=b""):
+        return SimpleUploadedFile(name, b"%PDF-1.4\n" + name.encode() + body, content_type="application/pdf")
+
+    def _post(self, files, **data):
+        return self.client.post(reverse("api_upload_batch"), {"files": files, **data})
+
+    def test_processes_files_and_bulk_inserts(self, mock_scan, mock_sanitize, mock_extract):
+        files = [
+            self._pdf("a.pdf"),
+            self._pdf("b.pdf"),
+            SimpleUploadedFile("c.png", b"\x89PNG\r\n\x1a\n" + b"0" * 20, content_type="image/png"),
+        ]
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._post(files)
+
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertEqual([r["file_name"] for r in body["results"]], ["a.pdf", "b.pdf", "c.png"])
+        self.assertEqual([r["source_type"] for r in body["results"]], ["pdf", "pdf", "image"])
+        self.assertTrue(all(r["status"] == "processed" for r in body["results"]))
+        self.assertIn("extract", body["results"][0]["timings"])
+        self.assertEqual(body["summary"]["processed"], 3)
+
+        self.assertEqual(DataSource.objects.count(), 3)
+        self.assertEqual(ExtractedData.objects.count(), 3)
+        ids = {r["source_id"] for r in body["results"]}
+        self.assertEqual(ids, set(DataSource.objects.values_list("id", flat=True)))
+
+        inserts = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        for table in ("data_capture_datasource", "data_capture_extracteddata", "data_capture_auditlog"):
+            self.assertEqual(sum(table in sql for sql in inserts), 1, table)
+
+    def test_duplicates_and_rejections(self, mock_scan, mock_sanitize, mock_extract):
+        same = b"%PDF-1.4\nidentical"
+        files = [
+            SimpleUploadedFile("one.pdf", same),
+            SimpleUploadedFile("two.pdf", same),
+            SimpleUploadedFile("evil.pdf", b"MZ\x90\x00 not a pdf"),
+            SimpleUploadedFile("tool.exe", b"%PDF-1.4\n"),
+        ]
+
+        body = json.loads(self._post(files, source_type="pdf").content)
+        statuses = {r["file_name"]: r["status"] for r in body["results"]}
+
+        self.assertEqual(statuses, {
+            "one.pdf": "processed",
+            "two.pdf": "duplicate",
+            "evil.pdf": "rejected",
+            "tool.exe": "rejected",
+        })
+        # Identical files are only analyzed once
+        self.assertEqual(mock_extract.call_count, 1)
+        self.assertEqual(DataSource.objects.count(), 2)
+        self.assertEqual(list((TMP_MEDIA / "uploads").glob("*evil.pdf")), [])
+
+    @override_settings(SHEET_STORE_DIR=TMP_MEDIA / "sheets")
+    def test_duplicate_of_a_legacy_spreadsheet_uses_the_sheet_store(self, mock_scan, mock_sanitize, mock_extract):
+        xlsx = b"PK\x03\x04 workbook"
+        rows = [[1, "a"], [2, "b"]]
+        legacy_json = json.dumps({"type": "excel", "sheets": {"Data": {"columns": ["n", "l"], "rows": rows, "row_count": 2}}})
+        earlier = DataSource.objects.create(
+            user=self.user, source_type="excel", file_name="old.xlsx", stored_name="old.xlsx",
+            file_hash=hashlib.sha256(xlsx).hexdigest(), scanned_clean=True,
+        )
+        ExtractedData.objects.create(source=earlier, user=self.user, data=legacy_json,
+                                     extractor_version=EXTRACTOR_VERSIONS["excel"])
+
+        body = json.loads(self._post([SimpleUploadedFile("new.xlsx", xlsx)], source_type="excel").content)
+
+        self.assertEqual(body["results"][0]["status"], "duplicate")
+        mock_extract.assert_not_called()
+        for extracted in ExtractedData.objects.all():
+            data = json.loads(extracted.data)
+            self.assertTrue(sheetstore.is_stored(data))
+            self.assertEqual(sheetstore.load_sheets(data)["sheets"]["Data"]["rows"], rows)
+
+    def test_files_with_the_same_name_are_stored_separately(self, mock_scan, mock_sanitize, mock_extract):
+        files = [self._pdf("scan.pdf", b"first"), self._pdf("scan.pdf", b"second")]
+
+        body = json.loads(self._post(files).content)
+
+        self.assertEqual([r["status"] for r in body["results"]], ["processed", "processed"])
+        names = set(DataSource.objects.values_list("stored_name", flat=True))
+        self.assertEqual(len(names), 2)
+        contents = {(TMP_MEDIA / "uploads" / name).read_bytes() for name in names}
+        self.assertEqual(contents, {b"%PDF-1.4\nscan.pdffirst", b"%PDF-1.4\nscan.pdfsecond"})
+
+    def test_rejected_request_leaves_no_files_behind(self, mock_scan, mock_sanitize, mock_extract):
+        uploads = TMP_MEDIA / "uploads"
+        uploads.mkdir(parents=True, exist_ok=True)
+        before = set(uploads.iterdir())
+        files = [
+            self._pdf("a.pdf"),
+            SimpleUploadedFile("c.png", b"\x89PNG\r\n\x1a\n" + b"0" * 20, content_type="image/png"),
+        ]
+
+        response = self.client.post(reverse("api_upload_batch") + "?source_type=pdf", {"files": files})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(uploads.iterdir()), before)
+        self.assertEqual(DataSource.objects.count(), 0)
+
+    def test_infected_file_is_reported_not_stored(self, mock_scan, mock_sanitize, mock_extract):
+        mock_scan.side_effect = lambda path, *_: (False, "EICAR") if path.endswith("bad.pdf") else (True, "clean")
+
+        body = json.loads(self._post([self._pdf("ok.pdf"), self._pdf("bad.pdf")]).content)
+
+        statuses = {r["file_name"]: r["status"] for r in body["results"]}
+        self.assertEqual(statuses, {"ok.pdf": "processed", "bad.pdf": "blocked"})
+        self.assertEqual(DataSource.objects.count(), 1)
+        self.assertTrue(AuditLog.objects.filter(action="upload_blocked_malware").exists())
+
+    def test_requires_files(self, mock_scan, mock_sanitize, mock_extract):
+        self.assertEqual(self._post([]).status_code, 400)
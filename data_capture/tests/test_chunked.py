@@ -0,0 +1,180 @@
+import hashlib
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from data_capture import chunked
+from data_capture.models import UploadSession, ExtractionJob
+
+
+User = get_user_model()
+
+TMP_MEDIA = Path(tempfile.mkdtemp(prefix="chunked_media_"))
+
+PDF_BYTES = b"%PDF-1.4\n" + bytes(range(256)) * 40  # ~10 KB
+
+
+@override_settings(MEDIA_ROOT=TMP_MEDIA, UPLOAD_CHUNK_MAX_SIZE=4096)
+class ResumableUploadApiTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TMP_MEDIA, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="chunkuser",
+            email="chunk@example.com",
+            password="chunkpass123",
+        )
+        self.client.force_login(self.user)
+        # A fresh process-local hash cache for every test
+        chunked._hashers.clear()
+
+    def _create(self, name="big.pdf", source_type="pdf", total_size=len(PDF_BYTES)):
+        response = self.client.post(
+            reverse("api_upload_sessions"),
+            data=json.dumps({"file_name": name, "source_type": source_type, "total_size": total_size}),
+            content_type="application/json",
+        )
+        return response, json.loads(response.content)
+
+    def _put(self, url, data, start, total=len(PDF_BYTES)):
+        return self.client.put(
+            url,
+            data=data,
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes {start}-{start + len(data) - 1}/{total}",
+        )
+
+    def _upload_all(self, session, chunk=4096):
+        for start in range(0, len(PDF_BYTES), chunk):
+            response = self._put(session["upload_url"], PDF_BYTES[start:start + chunk], start)
+            self.assertEqual(response.status_code, 200, response.content)
+
+    def test_full_protocol_creates_job_with_hash(self):
+        response, session = self._create()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(session["offset"], 0)
+
+        self._upload_all(session)
+
+        status = json.loads(self.client.get(session["upload_url"]).content)
+        self.assertEqual(status["offset"], len(PDF_BYTES))
+
+        response = self.client.post(session["finalize_url"])
+        self.assertEqual(response.status_code, 202)
+        job = ExtractionJob.objects.get(pk=json.loads(response.content)["job_id"])
+        self.assertEqual(job.file_hash, hashlib.sha256(PDF_BYTES).hexdigest())
+        self.assertEqual(Path(job.file_path).read_bytes(), PDF_BYTES)
+        self.assertEqual(UploadSession.objects.get().status, UploadSession.STATUS_COMPLETE)
+
+    def test_sessions_with_the_same_file_name_do_not_overwrite_each_other(self):
+        paths = []
+        for _ in range(2):
+            _, session = self._create(name="same.pdf")
+            self._upload_all(session)
+            response = self.client.post(session["finalize_url"])
+            paths.append(ExtractionJob.objects.get(pk=json.loads(response.content)["job_id"]).file_path)
+
+        self.assertNotEqual(paths[0], paths[1])
+        for path in paths:
+            self.assertTrue(path.endswith("_same.pdf"))
+            self.assertEqual(Path(path).read_bytes(), PDF_BYTES)
+
+    def test_resume_after_lost_hash_state(self):
+        _, session = self._create()
+        self._put(session["upload_url"], PDF_BYTES[:4096], 0)
+
+        # Simulate the next chunk landing on another process / after a restart
+        chunked._hashers.clear()
+        self._put(session["upload_url"], PDF_BYTES[4096:8192], 4096)
+        self._put(session["upload_url"], PDF_BYTES[8192:], 8192)
+
+        response = self.client.post(session["finalize_url"])
+        job = ExtractionJob.objects.get(pk=json.loads(response.content)["job_id"])
+        self.assertEqual(job.file_hash, hashlib.sha256(PDF_BYTES).hexdigest())
+
+    def test_wrong_offset_returns_409_with_current_offset(self):
+        _, session = self._create()
+        self._put(session["upload_url"], PDF_BYTES[:4096], 0)
+
+        # Retrying the first chunk (e.g. the response was lost) is refused without damage
+        response = self._put(session["upload_url"], PDF_BYTES[:4096], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content)["offset"], 4096)
+
+    def test_oversized_chunk_rejected(self):
+        _, session = self._create()
+        response = self._put(session["upload_url"], PDF_BYTES[:5000], 0)
+        self.assertEqual(response.status_code, 413)
+
+    def test_finalize_incomplete_or_wrong_content(self):
+        _, session = self._create()
+        self._put(session["upload_url"], PDF_BYTES[:4096], 0)
+        self.assertEqual(self.client.post(session["finalize_url"]).status_code, 409)
+
+        png = b"\x89PNG\r\n\x1a\n" + b"0" * 100
+        _, session = self._create(total_size=len(png))
+        self._put(session["upload_url"], png, 0, total=len(png))
+        self.assertEqual(self.client.post(session["finalize_url"]).status_code, 400)
+        self.assertEqual(ExtractionJob.objects.count(), 0)
+
+    def test_concurrent_finalize_is_refused_once_claimed(self):
+        _, session = self._create()
+        self._upload_all(session)
+        stale = UploadSession.objects.get()
+
+        self.assertEqual(self.client.post(session["finalize_url"]).status_code, 202)
+
+        # A second request that loaded the session before the first one
+        # claimed it: whether or not the staging file is still there
+        enqueue = MagicMock()
+        with self.assertRaisesMessage(chunked.ChunkError, "already finalized"):
+            chunked.complete_session(stale, enqueue)
+        Path(stale.staging_path).write_bytes(PDF_BYTES)
+        with self.assertRaisesMessage(chunked.ChunkError, "already finalized"):
+            chunked.complete_session(stale, enqueue)
+        enqueue.assert_not_called()
+        self.assertEqual(ExtractionJob.objects.count(), 1)
+
+    def test_failed_move_leaves_the_session_active(self):
+        _, session = self._create()
+        self._upload_all(session)
+
+        with patch("data_capture.chunked.os.replace", side_effect=OSError("disk full")):
+            response = self.client.post(session["finalize_url"])
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(ExtractionJob.objects.count(), 0)
+        self.assertEqual(UploadSession.objects.get().status, UploadSession.STATUS_ACTIVE)
+        # The client can simply finalize again
+        self.assertEqual(self.client.post(session["finalize_url"]).status_code, 202)
+
+    def test_other_users_cannot_touch_session(self):
+        _, session = self._create()
+        other = User.objects.create_user(username="o", email="o@example.com", password="pass1234")
+        self.client.force_login(other)
+
+        self.assertEqual(self.client.get(session["upload_url"]).status_code, 404)
+
+    def test_invalid_extension_on_create(self):
+        response, _ = self._create(name="tool.exe")
+        self.assertEqual(response.status_code, 400)
+
+    def test_stale_sessions_are_purged(self):
+        _, session = self._create()
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=3))
+
+        self.assertEqual(chunked.purge_stale_sessions(timedelta(days=2)), 1)
+        s = UploadSession.objects.get()
+        self.assertEqual(s.status, UploadSession.STATUS_ABORTED)
+        self.assertFalse(Path(s.staging_path).exists())
@@ -0,0 +1,116 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+from unittest.mock import patch, MagicMock
+
+from data_capture import security
+from data_capture.clamd import ClamdClient, ClamdError, get_clamd_client
+from data_capture.tests.fake_clamd import FakeClamd, SIGNATURE
+
+
+class ClamdClientTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def _file(self, content, name="upload.bin"):
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def _client(self, fake, **kwargs):
+        client = ClamdClient(host=fake.host, port=fake.port, timeout=5, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_clean_and_infected_files(self):
+        with FakeClamd() as fake:
+            client = self._client(fake)
+
+            self.assertTrue(client.ping())
+            self.assertEqual(client.scan_file(self._file(b"%PDF-1.4 hello")), (True, "File is clean (clamd)."))
+
+            status, detail = client.scan_file(self._file(b"junk " + SIGNATURE + b" junk"))
+            self.assertFalse(status)
+            self.assertIn("FOUND", detail)
+
+    def test_large_file_is_streamed_in_chunks(self):
+        content = os.urandom(300 * 1024)
+        with FakeClamd() as fake:
+            self._client(fake).scan_file(self._file(content))
+
+        self.assertEqual(fake.scanned, [content])
+
+    def test_session_connection_is_reused(self):
+        with FakeClamd() as fake:
+            client = self._client(fake)
+            path = self._file(b"clean")
+            for _ in range(5):
+                self.assertTrue(client.scan_file(path)[0])
+
+        self.assertEqual(fake.connections, 1)
+
+    def test_dropped_idle_session_is_retried_on_a_new_connection(self):
+        with FakeClamd(close_after_reply=True) as fake:
+            client = self._client(fake)
+            path = self._file(b"clean")
+            for _ in range(3):
+                self.assertTrue(client.scan_file(path)[0])
+
+        self.assertEqual(len(fake.scanned), 3)
+
+    def test_stream_limit_is_a_scanner_error(self):
+        with FakeClamd(stream_max_length=1024) as fake:
+            status, detail = self._client(fake).scan_file(self._file(b"x" * 200_000))
+
+        self.assertIsNone(status)
+        self.assertIn("size limit", detail)
+
+    def test_unix_socket(self):
+        socket_path = os.path.join(self.tmp, "clamd.sock")
+        with FakeClamd(socket_path=socket_path):
+            client = ClamdClient(socket_path=socket_path, timeout=5)
+            self.addCleanup(client.close)
+            self.assertTrue(client.scan_file(self._file(b"clean"))[0])
+
+    def test_unreachable_daemon_raises(self):
+        with FakeClamd() as fake:
+            host, port = fake.host, fake.port
+
+        with self.assertRaises(ClamdError):
+            ClamdClient(host=host, port=port, timeout=1).scan_file(self._file(b"clean"))
+
+
+class ScanFileUsesClamdTests(SimpleTestCase):
+    @patch("data_capture.security.subprocess.run")
+    def test_clamd_is_used_when_configured(self, mock_run):
+        with tempfile.NamedTemporaryFile() as f, FakeClamd() as fake:
+            f.write(SIGNATURE)
+            f.flush()
+            client = ClamdClient(host=fake.host, port=fake.port, timeout=5)
+            with patch("data_capture.security.get_clamd_client", return_value=client):
+                status, _ = security.scan_file_for_malware(f.name)
+            client.close()
+
+        self.assertFalse(status)
+        mock_run.assert_not_called()
+
+    @patch("data_capture.security.subprocess.run")
+    def test_falls_back_to_clamscan_when_clamd_is_down(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0, stdout="OK", stderr="")
+        client = MagicMock()
+        client.scan_file.side_effect = ClamdError("Cannot connect to clamd")
+
+        with patch("data_capture.security.get_clamd_client", return_value=client):
+            status, detail = security.scan_file_for_malware("dummy/path/file.pdf")
+
+        self.assertTrue(status)
+        self.assertIn("ClamAV", detail)
+        mock_run.assert_called_once()
+
+    @override_settings(CLAMD_SOCKET="", CLAMD_HOST="")
+    def test_no_client_without_configuration(self):
+        self.assertIsNone(get_clamd_client())
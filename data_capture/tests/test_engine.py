@@ -0,0 +1,338 @@
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.test import SimpleTestCase, override_settings
+from unittest.mock import patch
+from pdfplumber.page import Page
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from data_capture.engine import ExtractionEngine, ExtractionTimeout, ExtractionCrashed, ExtractionError
+from data_capture.utils import (
+    extract_pdf_data, extract_pdf_pages, plan_pdf_shards, plan_pdf_ocr, iter_pdf_pages,
+)
+
+
+# Module-level so the worker processes can import them
+
+def _echo(path):
+    return {'type': 'test', 'path': path, 'pid': os.getpid()}
+
+
+def _crash(path):
+    os._exit(1)
+
+
+def _hang(path):
+    time.sleep(60)
+
+
+def _plan_three(path):
+    return [(1, 2), (3, 4), (5, 5)]
+
+
+def _shard(path, first, last):
+    if path == 'crash.pdf' and first == 3:
+        os._exit(1)
+    if first == 1:
+        time.sleep(0.2)  # finishes last, still merged first
+    return [(first, last, os.getpid())]
+
+
+def _merge(shards):
+    return [entry for shard in shards for entry in shard]
+
+
+def _plan_pages(path, result):
+    return [((n,),) for n in result['todo']]
+
+
+def _read_pages(path, pages):
+    return [(n, os.getpid()) for n in pages]
+
+
+def _merge_pages(result, outputs):
+    return dict(result, done=[entry for batch in outputs for entry in batch])
+
+
+def _text_pdf(path, pages, lines=1):
+    """A PDF whose page i says "Page i" (on each of `lines` lines)."""
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    }))
+    for i in range(1, pages + 1):
+        writer.add_blank_page(width=600, height=800)
+        page = writer.pages[-1]
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font}),
+        })
+        content = DecodedStreamObject()
+        text = " ".join(f"(Page {i} line {j} lorem ipsum dolor sit amet) '" for j in range(lines))
+        content.set_data(f"BT /F1 10 Tf 20 780 Td 12 TL {text} ET".encode())
+        page[NameObject('/Contents')] = writer._add_object(content)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+class ExtractionEngineTests(SimpleTestCase):
+    def _engine(self, **kwargs):
+        engine = ExtractionEngine(
+            extractors={'ok': _echo, 'crash': _crash, 'hang': _hang},
+            max_workers={'ok': 1, 'crash': 1, 'hang': 1, 'inline': 0},
+            **kwargs,
+        )
+        self.addCleanup(engine.shutdown, wait=False)
+        return engine
+
+    def test_runs_extractor_in_worker_process(self):
+        result = self._engine().extract('ok', 'a.pdf')
+
+        self.assertEqual(result['path'], 'a.pdf')
+        self.assertNotEqual(result['pid'], os.getpid())
+
+    def test_zero_workers_runs_inline(self):
+        engine = ExtractionEngine(extractors={'inline': _echo}, max_workers={'inline': 0})
+
+        self.assertEqual(engine.extract('inline', 'b.pdf')['pid'], os.getpid())
+
+    def test_crash_is_reported_and_pool_recovers(self):
+        engine = self._engine()
+
+        with self.assertRaises(ExtractionCrashed):
+            engine.extract('crash', 'bad.pdf')
+        # Other types are untouched and keep working
+        self.assertEqual(engine.extract('ok', 'good.pdf')['path'], 'good.pdf')
+
+    def test_timeout_kills_hung_worker(self):
+        engine = self._engine(timeout=0.5)
+
+        with self.assertRaises(ExtractionTimeout):
+            engine.extract('hang', 'slow.pdf')
+        self.assertNotIn('hang', engine._pools)
+
+    def test_unknown_type(self):
+        with self.assertRaises(ExtractionError):
+            self._engine().extract('nope', 'x')
+
+
+class ShardedExtractionTests(SimpleTestCase):
+    def _engine(self, **kwargs):
+        engine = ExtractionEngine(
+            extractors={'doc': _echo},
+            max_workers={'doc': 2},
+            sharded={'doc': (_plan_three, _shard, _merge)},
+            **kwargs,
+        )
+        self.addCleanup(engine.shutdown, wait=False)
+        return engine
+
+    def test_shards_run_in_parallel_and_merge_in_order(self):
+        result = self._engine().extract('doc', 'big.pdf')
+
+        self.assertEqual([(first, last) for first, last, _ in result], [(1, 2), (3, 4), (5, 5)])
+        self.assertEqual(len({pid for _, _, pid in result}), 2)
+
+    def test_shard_workers_limits_one_file(self):
+        result = self._engine(shard_workers={'doc': 1}).extract('doc', 'big.pdf')
+
+        self.assertEqual(len({pid for _, _, pid in result}), 1)
+
+    def test_async_uses_shards_too(self):
+        result = asyncio.run(self._engine().extract_async('doc', 'big.pdf'))
+
+        self.assertEqual(len(result), 3)
+
+    def test_crashing_shard(self):
+        with self.assertRaises(ExtractionCrashed):
+            self._engine().extract('doc', 'crash.pdf')
+
+
+class FollowupTests(SimpleTestCase):
+    def _engine(self, workers):
+        engine = ExtractionEngine(
+            extractors={'doc': lambda path: {'todo': [1, 2, 3, 4]}},
+            max_workers={'doc': 0, 'pages': workers},
+            followups={'doc': ('pages', _plan_pages, _read_pages, _merge_pages)},
+        )
+        self.addCleanup(engine.shutdown, wait=False)
+        return engine
+
+    def test_followup_runs_on_its_pool_and_merges_in_order(self):
+        result = self._engine(2).extract('doc', 'a.pdf')
+
+        self.assertEqual([n for n, _ in result['done']], [1, 2, 3, 4])
+        self.assertNotIn(os.getpid(), {pid for _, pid in result['done']})
+
+    def test_followup_inline_and_async(self):
+        result = asyncio.run(self._engine(0).extract_async('doc', 'a.pdf'))
+
+        self.assertEqual(result['done'], [(n, os.getpid()) for n in [1, 2, 3, 4]])
+
+
+@override_settings(PDF_PARALLEL_MIN_PAGES=4, PDF_SHARD_PAGES=3)
+class PdfShardingTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'report.pdf')
+
+    def test_plan(self):
+        _text_pdf(self.path, 7)
+        self.assertEqual(plan_pdf_shards(self.path), [(1, 3), (4, 6), (7, 7)])
+
+        _text_pdf(self.path, 3)
+        self.assertIsNone(plan_pdf_shards(self.path))
+        self.assertIsNone(plan_pdf_shards(os.path.join(os.path.dirname(self.path), 'missing.pdf')))
+
+    def test_sharded_result_matches_serial(self):
+        _text_pdf(self.path, 7)
+        engine = ExtractionEngine(max_workers={'pdf': 2})
+        self.addCleanup(engine.shutdown, wait=False)
+
+        result = engine.extract('pdf', self.path)
+
+        self.assertEqual(result, extract_pdf_data(self.path))
+        self.assertEqual([entry['page'] for entry in result['content']], list(range(1, 8)))
+        self.assertIn('Page 5', result['content'][4]['text'])
+
+    def test_page_range_and_per_shard_fallback(self):
+        _text_pdf(self.path, 5)
+
+        self.assertEqual([e['page'] for e in extract_pdf_pages(self.path, 2, 3)], [2, 3])
+        self.assertEqual([e['page'] for e in extract_pdf_pages(self.path, 4)], [4, 5])
+
+        with patch('data_capture.utils.pdfplumber.open', side_effect=Exception('boom')):
+            fallback = extract_pdf_pages(self.path, 2, 3)
+        self.assertEqual([e['page'] for e in fallback], [2, 3])
+        self.assertIn('Page 3', fallback[1]['text'])
+
+
+@override_settings(PDF_OCR_BATCH_PAGES=2, PDF_OCR_DPI=144)
+class ScannedPdfTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.path = os.path.join(tmp.name, 'mixed.pdf')
+        # Tesseract itself is never run here: OCR calls are mocked
+        available = patch('data_capture.utils.ocr_available', return_value=True)
+        available.start()
+        self.addCleanup(available.stop)
+
+    def _mixed_pdf(self, layout):
+        """Pages in `layout` order: 't' has a text layer, 's' is a scan, 'b' is blank."""
+        text_path = os.path.join(self.dir, 'text.pdf')
+        scan_path = os.path.join(self.dir, 'scan.pdf')
+        _text_pdf(text_path, layout.count('t'))
+        Image.new('L', (300, 200), 255).save(scan_path, 'PDF')
+        text_pages = iter(PdfReader(text_path).pages)
+        scan_page = PdfReader(scan_path).pages[0]
+
+        writer = PdfWriter()
+        for kind in layout:
+            if kind == 't':
+                writer.add_page(next(text_pages))
+            elif kind == 's':
+                writer.add_page(scan_page)
+            else:
+                writer.add_blank_page(width=300, height=200)
+        with open(self.path, 'wb') as f:
+            writer.write(f)
+
+    def test_pages_without_text_layer_are_flagged(self):
+        self._mixed_pdf('tsbs')
+
+        self.assertEqual(extract_pdf_pages(self.path), [
+            {'page': 1, 'text': 'Page 1 line 0 lorem ipsum dolor sit amet'},
+            {'page': 2, 'text': '', 'scanned': True},
+            {'page': 4, 'text': '', 'scanned': True},
+        ])
+        # Only callers that can OCR them ask for placeholders
+        self.assertEqual([e['page'] for e in iter_pdf_pages(self.path)], [1])
+
+    def test_only_scanned_pages_are_ocred(self):
+        self._mixed_pdf('tssst')
+
+        with patch('data_capture.utils.ocr_images',
+                   side_effect=[['scanned two', '   '], ['scanned four']]) as mock_ocr:
+            result = extract_pdf_data(self.path)
+
+        # One call per batch of PDF_OCR_BATCH_PAGES pages
+        self.assertEqual(mock_ocr.call_count, 2)
+        # Rendered at PDF_OCR_DPI: a 300pt-wide page at 144 dpi
+        self.assertEqual(mock_ocr.call_args.args[0][0].size, (600, 400))
+        self.assertEqual([(e['page'], e.get('ocr', False)) for e in result['content']],
+                         [(1, False), (2, True), (4, True), (5, False)])
+        self.assertEqual(result['content'][1]['text'], 'scanned two')
+        self.assertEqual(result['pages'], 4)
+
+    def test_ocr_is_batched_and_skipped_without_tesseract(self):
+        self._mixed_pdf('sssts')
+        data = {'content': extract_pdf_pages(self.path)}
+
+        self.assertEqual(plan_pdf_ocr(self.path, data), [([1, 2],), ([3, 5],)])
+        with patch('data_capture.utils.ocr_available', return_value=False):
+            self.assertEqual(plan_pdf_ocr(self.path, data), [])
+            self.assertEqual([e['page'] for e in extract_pdf_data(self.path)['content']], [4])
+
+    def test_engine_routes_scanned_pages_to_ocr(self):
+        self._mixed_pdf('ts')
+        engine = ExtractionEngine(max_workers={'pdf': 1, 'image': 0})
+        self.addCleanup(engine.shutdown, wait=False)
+
+        with patch('data_capture.utils.ocr_images', return_value=['scanned']) as mock_ocr:
+            result = engine.extract('pdf', self.path)
+
+        mock_ocr.assert_called_once()
+        self.assertEqual([e['text'] for e in result['content']],
+                         ['Page 1 line 0 lorem ipsum dolor sit amet', 'scanned'])
+
+
+class PdfStreamingTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def _pdf(self, pages, lines=1):
+        path = os.path.join(self.dir, f'{pages}x{lines}.pdf')
+        _text_pdf(path, pages, lines)
+        return path
+
+    def test_pages_are_yielded_in_order(self):
+        pages = iter_pdf_pages(self._pdf(4))
+
+        self.assertEqual(next(pages)['page'], 1)
+        self.assertEqual([entry['page'] for entry in pages], [2, 3, 4])
+
+    def test_shard_skips_earlier_pages_without_building_them(self):
+        path = self._pdf(6)
+
+        with patch('data_capture.utils.Page', wraps=Page) as built:
+            shard = list(iter_pdf_pages(path, first=4, last=5))
+
+        self.assertEqual(built.call_count, 2)
+        self.assertEqual(shard, [entry for entry in iter_pdf_pages(path) if entry['page'] in (4, 5)])
+
+    def _peak_memory(self, path):
+        tracemalloc.start()
+        try:
+            for _ in iter_pdf_pages(path):
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_peak_memory_does_not_grow_with_page_count(self):
+        short = self._peak_memory(self._pdf(4, lines=15))
+        long = self._peak_memory(self._pdf(32, lines=15))
+
+        # Caching every page would make this ~8x
+        self.assertLess(long, short * 1.5)
@@ -0,0 +1,132 @@
+import datetime
+import json
+import os
+import tempfile
+import tracemalloc
+
+import openpyxl
+import pandas as pd
+from django.test import SimpleTestCase, override_settings
+from unittest.mock import patch
+
+from data_capture.pipeline import SanitizeOutputStage, Upload
+from data_capture.sheetstore import is_stored, load_sheets
+from data_capture.utils import extract_excel_data, iter_excel_rows
+
+
+class ExcelExtractionTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        settings = override_settings(SHEET_STORE_DIR=os.path.join(tmp.name, 'sheets'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def _workbook(self, name, sheets):
+        """Save {sheet title: [row, ...]} as an .xlsx and return its path."""
+        path = os.path.join(self.dir, name)
+        wb = openpyxl.Workbook(write_only=True)
+        for title, rows in sheets.items():
+            ws = wb.create_sheet(title)
+            for row in rows:
+                ws.append(row)
+        wb.save(path)
+        return path
+
+    def test_matches_pandas_layout(self):
+        path = self._workbook('mixed.xlsx', {
+            'Orders': [
+                ['name', 'qty', None, 'name', 'when'],
+                ['x', 1, None, 'y', datetime.datetime(2024, 1, 2)],
+                [],
+                ['z', 2.5, None, None, None, None, 'extra'],
+                [],
+                [],
+            ],
+            'Empty': [],
+        })
+
+        summary = extract_excel_data(path)
+        data = load_sheets(summary)
+
+        self.assertTrue(is_stored(summary))
+        self.assertNotIn('rows', summary['sheets']['Orders'])
+        orders = data['sheets']['Orders']
+        expected = pd.read_excel(path, sheet_name='Orders')
+        self.assertEqual(orders['columns'], expected.columns.tolist())
+        self.assertEqual(orders['row_count'], len(expected))
+        self.assertEqual(orders['rows'][0], ['x', 1, None, 'y', datetime.datetime(2024, 1, 2), None, None])
+        self.assertEqual(orders['rows'][1], [None] * 7)
+        self.assertEqual(data['sheets']['Empty'], {'columns': [], 'rows': [], 'row_count': 0})
+
+    @override_settings(EXCEL_CHUNK_ROWS=2)
+    def test_rows_are_streamed_in_chunks_from_one_open(self):
+        path = self._workbook('many.xlsx', {
+            f'S{i}': [['n']] + [[n] for n in range(5)] for i in range(3)
+        })
+
+        with patch('data_capture.utils.openpyxl.load_workbook', wraps=openpyxl.load_workbook) as mock_load, \
+                patch('data_capture.utils.pd.read_excel') as mock_pandas:
+            chunks = [(name, rows) for name, _, rows in iter_excel_rows(path)]
+
+        mock_load.assert_called_once()
+        mock_pandas.assert_not_called()
+        self.assertEqual([name for name, _ in chunks], ['S0'] * 3 + ['S1'] * 3 + ['S2'] * 3)
+        self.assertEqual([rows for name, rows in chunks if name == 'S1'], [[[0], [1]], [[2], [3]], [[4]]])
+
+    def test_legacy_xls_goes_through_pandas(self):
+        path = os.path.join(self.dir, 'old.xls')
+        with open(path, 'wb') as f:
+            f.write(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1')
+        frame = pd.DataFrame({'a': [1.0, None]})
+
+        with patch('data_capture.utils.pd.ExcelFile') as mock_file:
+            book = mock_file.return_value.__enter__.return_value
+            book.sheet_names = ['Sheet1']
+            book.parse.return_value = frame
+            data = load_sheets(extract_excel_data(path))
+
+        self.assertEqual(data['sheets']['Sheet1'], {'columns': ['a'], 'rows': [[1.0], [None]], 'row_count': 2})
+
+    def _peak_memory(self, func, path):
+        tracemalloc.start()
+        try:
+            func(path)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    @override_settings(EXCEL_CHUNK_ROWS=100, SHEET_STORE_BLOCK_ROWS=100)
+    def test_streaming_memory_does_not_grow_with_the_data(self):
+        def stream(path):
+            for _ in iter_excel_rows(path):
+                pass
+
+        def materialize(path):
+            return [rows for _, _, rows in iter_excel_rows(path)]
+
+        row = ['some text', 12345, 3.25, 'more text', None, 'x' * 20] * 2
+        short = self._workbook('short.xlsx', {'S': [row] * 500})
+        long = self._workbook('long.xlsx', {'S': [row] * 2000})
+        streamed = self._peak_memory(stream, long) - self._peak_memory(stream, short)
+        extracted = self._peak_memory(extract_excel_data, long) - self._peak_memory(extract_excel_data, short)
+        materialized = self._peak_memory(materialize, long) - self._peak_memory(materialize, short)
+
+        # openpyxl keeps a few dozen bytes per parsed row element, but no cells;
+        # extraction writes each chunk to the sheet store instead of keeping it
+        self.assertLess(streamed, materialized / 3)
+        self.assertLess(extracted, materialized / 3)
+
+    def test_cells_are_sanitized_once_as_they_are_stored(self):
+        path = self._workbook('markup.xlsx', {'S': [['<b>name</b>'], ['<script>x()</script>ok'], ['a & b']]})
+
+        summary = extract_excel_data(path)
+        upload = Upload(user=None, source_type='excel', file_name='markup.xlsx')
+        upload.extracted_data = summary
+        SanitizeOutputStage().run(upload)
+
+        self.assertEqual(json.loads(upload.data_json), summary)
+        sheet = load_sheets(summary)['sheets']['S']
+        self.assertEqual(sheet['columns'], ['name'])
+        self.assertEqual(sheet['rows'], [['ok'], ['a &amp; b']])
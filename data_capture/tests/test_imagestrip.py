@@ -0,0 +1,96 @@
+import io
+import tempfile
+
+from django.test import SimpleTestCase
+from PIL import Image, PngImagePlugin
+
+from data_capture.imagestrip import strip_png, strip_jpeg
+
+
+def _png(mode="RGB", text=None):
+    img = Image.new(mode, (32, 16), color=1 if mode == "P" else (10, 200, 30))
+    info = PngImagePlugin.PngInfo()
+    for key, value in (text or {}).items():
+        info.add_text(key, value)
+    out = io.BytesIO()
+    img.save(out, format="PNG", pnginfo=info)
+    return out.getvalue()
+
+
+def _jpeg():
+    img = Image.new("RGB", (64, 32), color=(200, 10, 10))
+    exif = Image.Exif()
+    exif[0x010F] = "SpyCam Inc."  # Make
+    out = io.BytesIO()
+    img.save(out, format="JPEG", exif=exif, comment=b"secret comment", progressive=True)
+    return out.getvalue()
+
+
+class StripPngTests(SimpleTestCase):
+    def _strip(self, stripper, data):
+        out = io.BytesIO()
+        return stripper(io.BytesIO(data), out), out.getvalue()
+
+    def test_drops_text_and_trailing_bytes_keeps_pixels(self):
+        original = _png(text={"Author": "someone", "Comment": "<script>"})
+        ok, stripped = self._strip(strip_png, original + b"TRAILING PAYLOAD")
+
+        self.assertTrue(ok)
+        self.assertNotIn(b"someone", stripped)
+        self.assertFalse(stripped.endswith(b"TRAILING PAYLOAD"))
+        self.assertEqual(
+            Image.open(io.BytesIO(stripped)).tobytes(),
+            Image.open(io.BytesIO(original)).tobytes(),
+        )
+
+    def test_palette_image_is_not_inflated(self):
+        original = _png(mode="P")
+        ok, stripped = self._strip(strip_png, original)
+
+        self.assertTrue(ok)
+        self.assertEqual(Image.open(io.BytesIO(stripped)).mode, "P")
+        self.assertLessEqual(len(stripped), len(original))
+
+    def test_bad_crc_is_not_rewritten(self):
+        data = bytearray(_png())
+        data[-20] ^= 0xFF  # inside the IDAT payload
+        ok, _ = self._strip(strip_png, bytes(data))
+        self.assertFalse(ok)
+
+    def test_truncated_or_foreign_files(self):
+        self.assertFalse(self._strip(strip_png, _png()[:40])[0])
+        self.assertFalse(self._strip(strip_png, b"GIF89a....")[0])
+
+
+class StripJpegTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def _strip(self, data):
+        # strip_jpeg maps the input, so it needs a real file
+        path = f"{self.dir}/in.jpg"
+        with open(path, "wb") as f:
+            f.write(data)
+        out = io.BytesIO()
+        with open(path, "rb") as f_in:
+            return strip_jpeg(f_in, out), out.getvalue()
+
+    def test_drops_exif_comment_and_trailing_bytes_keeps_pixels(self):
+        original = _jpeg()
+        ok, stripped = self._strip(original + b"PK\x03\x04 hidden zip")
+
+        self.assertTrue(ok)
+        self.assertNotIn(b"SpyCam", stripped)
+        self.assertNotIn(b"secret comment", stripped)
+        self.assertTrue(stripped.endswith(b"\xff\xd9"))
+        self.assertEqual(
+            Image.open(io.BytesIO(stripped)).tobytes(),
+            Image.open(io.BytesIO(original)).tobytes(),
+        )
+
+    def test_truncated_or_foreign_files(self):
+        self.assertFalse(self._strip(_jpeg()[:-200])[0])
+        self.assertFalse(self._strip(_png())[0])
+        self.assertFalse(self._strip(b"")[0])
@@ -0,0 +1,229 @@
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from unittest.mock import patch
+
+from data_capture.models import ExtractionJob, DataSource, ExtractedData
+from data_capture.jobs import (
+    claim_next_job,
+    requeue_stale_jobs,
+    run_next_job,
+    run_pending_jobs,
+    dedup_stats,
+    Heartbeat,
+    MAX_JOB_ATTEMPTS,
+)
+from data_capture.utils import EXTRACTOR_VERSIONS
+
+
+User = get_user_model()
+
+
+class ExtractionJobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="jobuser",
+            email="job@example.com",
+            password="jobpass123",
+        )
+
+    def _job(self, **kwargs):
+        defaults = dict(user=self.user, source_type="pdf", file_name="a.pdf", file_path="/nonexistent/a.pdf")
+        defaults.update(kwargs)
+        return ExtractionJob.objects.create(**defaults)
+
+    def test_claim_takes_oldest_pending_job_once(self):
+        first = self._job(file_name="first.pdf")
+        self._job(file_name="second.pdf")
+
+        claimed = claim_next_job()
+
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual(claimed.status, ExtractionJob.STATUS_RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNotNone(claimed.started_at)
+        # The next claim skips the running job
+        self.assertEqual(claim_next_job().file_name, "second.pdf")
+        self.assertIsNone(claim_next_job())
+
+    def test_stale_running_jobs_are_requeued_or_failed(self):
+        old = timezone.now() - timedelta(hours=1)
+        retry = self._job(status=ExtractionJob.STATUS_RUNNING, started_at=old, attempts=1)
+        give_up = self._job(status=ExtractionJob.STATUS_RUNNING, started_at=old, attempts=MAX_JOB_ATTEMPTS)
+        fresh = self._job(status=ExtractionJob.STATUS_RUNNING, started_at=timezone.now(), attempts=1)
+
+        self.assertEqual(requeue_stale_jobs(), 2)
+
+        retry.refresh_from_db()
+        give_up.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(retry.status, ExtractionJob.STATUS_PENDING)
+        self.assertEqual(give_up.status, ExtractionJob.STATUS_FAILED)
+        self.assertEqual(fresh.status, ExtractionJob.STATUS_RUNNING)
+
+    def test_long_job_with_a_recent_heartbeat_is_not_requeued(self):
+        old = timezone.now() - timedelta(hours=1)
+        alive = self._job(status=ExtractionJob.STATUS_RUNNING, started_at=old, heartbeat_at=timezone.now(), attempts=1)
+        dead = self._job(status=ExtractionJob.STATUS_RUNNING, started_at=old, heartbeat_at=old, attempts=1)
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+
+        alive.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual(alive.status, ExtractionJob.STATUS_RUNNING)
+        self.assertEqual(dead.status, ExtractionJob.STATUS_PENDING)
+
+    @patch("data_capture.jobs.record_audit_event")
+    @patch("data_capture.jobs.process_job", side_effect=RuntimeError("boom"))
+    def test_unexpected_error_marks_job_failed(self, mock_process, mock_record):
+        job = self._job()
+
+        run_next_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExtractionJob.STATUS_FAILED)
+        self.assertIn("boom", job.detail)
+        self.assertEqual(DataSource.objects.count(), 0)
+
+    @patch("data_capture.jobs.process_job")
+    def test_management_command_once_drains_queue(self, mock_process):
+        self._job()
+        self._job()
+
+        out = StringIO()
+        call_command("process_extraction_jobs", "--once", stdout=out)
+
+        self.assertEqual(mock_process.call_count, 2)
+        self.assertFalse(ExtractionJob.objects.filter(status=ExtractionJob.STATUS_PENDING).exists())
+
+    @patch("data_capture.ocr.TESSEROCR_AVAILABLE", False)
+    def test_management_command_warns_without_tesserocr(self):
+        err = StringIO()
+        call_command("process_extraction_jobs", "--once", stdout=StringIO(), stderr=err)
+
+        self.assertIn("tesserocr is not installed", err.getvalue())
+
+    @override_settings(OCR_REQUIRE_TESSEROCR=True)
+    @patch("data_capture.jobs.process_job")
+    @patch("data_capture.ocr.TESSEROCR_AVAILABLE", False)
+    def test_management_command_refuses_to_start_when_tesserocr_is_required(self, mock_process):
+        self._job()
+
+        with self.assertRaises(CommandError):
+            call_command("process_extraction_jobs", "--once", stdout=StringIO())
+
+        mock_process.assert_not_called()
+
+
+class HeartbeatTests(TransactionTestCase):
+    def test_heartbeat_is_touched_while_the_job_runs(self):
+        user = User.objects.create_user(username="hb", email="hb@example.com", password="pw")
+        old = timezone.now() - timedelta(hours=1)
+        job = ExtractionJob.objects.create(
+            user=user, source_type="pdf", file_name="a.pdf", file_path="/nonexistent/a.pdf",
+            status=ExtractionJob.STATUS_RUNNING, started_at=old, heartbeat_at=old,
+        )
+
+        with Heartbeat(job, interval=0.05):
+            time.sleep(0.3)
+
+        job.refresh_from_db()
+        self.assertGreater(job.heartbeat_at, timezone.now() - timedelta(seconds=5))
+        self.assertEqual(requeue_stale_jobs(), 0)
+
+
+@patch("data_capture.pipeline.record_audit_event")
+@patch("data_capture.pipeline.sanitize_file", side_effect=lambda path, source_type, *_: (True, path, "ok"))
+@patch("data_capture.pipeline.scan_file_for_malware", return_value=(True, "clean"))
+@patch("data_capture.pipeline.run_extraction", return_value={"type": "pdf", "pages": 1, "content": [{"page": 1, "text": "Hi"}]})
+class DuplicateUploadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="dupuser",
+            email="dup@example.com",
+            password="duppass123",
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+
+    def _queue(self, name, content=b"%PDF-1.4 same bytes", source_type="pdf"):
+        path = self.tmp / name
+        path.write_bytes(content)
+        return ExtractionJob.objects.create(
+            user=self.user, source_type=source_type, file_name=name, file_path=str(path),
+        )
+
+    def test_second_identical_upload_reuses_extraction(self, mock_extract, mock_scan, mock_sanitize, mock_record):
+        first = self._queue("one.pdf")
+        second = self._queue("two.pdf")
+
+        run_pending_jobs()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertFalse(first.dedup_hit)
+        self.assertTrue(second.dedup_hit)
+        self.assertEqual(second.status, ExtractionJob.STATUS_DONE)
+        # Only the first upload was scanned / sanitized / extracted
+        self.assertEqual(mock_extract.call_count, 1)
+        self.assertEqual(mock_scan.call_count, 1)
+        self.assertEqual(mock_sanitize.call_count, 1)
+
+        self.assertEqual(second.source.file_hash, first.source.file_hash)
+        copy = ExtractedData.objects.get(source=second.source)
+        original = ExtractedData.objects.get(source=first.source)
+        self.assertEqual(copy.data, original.data)
+        self.assertEqual(copy.extractor_version, EXTRACTOR_VERSIONS["pdf"])
+        # The copy is split into pages by the worker, not on first view
+        self.assertTrue(copy.paged)
+        self.assertEqual(list(copy.pages.values_list("page", "text")), [(1, "Hi")])
+        self.assertEqual(dedup_stats(), {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+    def test_duplicate_shares_the_scanned_file_and_drops_its_raw_copy(self, mock_extract, mock_scan, mock_sanitize, mock_record):
+        first = self._queue("one.pdf")
+        second = self._queue("two.pdf")
+
+        run_pending_jobs()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.source.stored_name, "one.pdf")
+        self.assertTrue(first.source.scanned_clean)
+        self.assertEqual(second.source.stored_name, "one.pdf")
+        self.assertTrue((self.tmp / "one.pdf").exists())
+        self.assertFalse((self.tmp / "two.pdf").exists())
+
+    def test_unscanned_upload_is_never_reused(self, mock_extract, mock_scan, mock_sanitize, mock_record):
+        mock_scan.return_value = (None, "scanner unavailable")
+        self._queue("one.pdf")
+        run_pending_jobs()
+
+        mock_scan.return_value = (True, "clean")
+        second = self._queue("two.pdf")
+        run_pending_jobs()
+
+        second.refresh_from_db()
+        self.assertFalse(second.dedup_hit)
+        self.assertEqual(mock_scan.call_count, 2)
+        self.assertEqual(mock_extract.call_count, 2)
+
+    def test_different_type_or_extractor_version_is_a_miss(self, mock_extract, mock_scan, mock_sanitize, mock_record):
+        self._queue("one.pdf")
+        run_pending_jobs()
+        ExtractedData.objects.update(extractor_version="0")
+
+        self._queue("two.pdf")
+        self._queue("three.png", source_type="image")
+        run_pending_jobs()
+
+        self.assertEqual(mock_extract.call_count, 3)
+        self.assertEqual(ExtractionJob.objects.filter(dedup_hit=True).count(), 0)
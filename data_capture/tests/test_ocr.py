@@ -0,0 +1,359 @@
+import itertools
+import os
+import stat
+import sys
+import tempfile
+import threading
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from data_capture import ocr
+from data_capture.ocr import (
+    CliEngine, OcrError, OcrPool, find_tessdata, find_tesseract, ocr_tiled, plan_tiles, stitch_tiles,
+)
+from data_capture.utils import extract_image_data
+
+# Stands in for tesseract: "reads" each image in the list file as its size,
+# and logs its arguments so tests can count runs.
+FAKE_TESSERACT = f'''#!{sys.executable}
+import os, sys
+args = sys.argv[1:]
+with open(os.environ['FAKE_TESSERACT_LOG'], 'a') as log:
+    log.write(' '.join(args) + '\\n')
+if os.environ.get('FAKE_TESSERACT_FAIL'):
+    sys.stderr.write('Error opening data file eng.traineddata')
+    sys.exit(1)
+separator = next(a.split('=', 1)[1] for a in args if a.startswith('page_separator='))
+texts = []
+for path in open(args[0]).read().split():
+    with open(path, 'rb') as image:
+        magic, width, height = image.read(32).split()[:3]
+    texts.append(width.decode() + 'x' + height.decode())
+trailing = separator if os.environ.get('FAKE_TESSERACT_TRAILING') else ''
+sys.stdout.write(separator.join(texts) + trailing)
+'''
+
+
+def images(*widths, mode='L'):
+    return [Image.new(mode, (width, 10), 255) for width in widths]
+
+
+class FakeEngine:
+    created = 0
+
+    def __init__(self):
+        type(self).created += 1
+
+    def recognize(self, batch):
+        if any(image.width == 13 for image in batch):
+            raise OcrError('unlucky')
+        return [f'{image.width}x{image.height}' for image in batch]
+
+    def close(self):
+        pass
+
+
+class TesseractDiscoveryTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.prefix = tmp.name
+        os.makedirs(os.path.join(tmp.name, 'bin'))
+        self.cmd = os.path.join(tmp.name, 'bin', 'tesseract')
+        with open(self.cmd, 'w') as f:
+            f.write(FAKE_TESSERACT)
+        os.chmod(self.cmd, os.stat(self.cmd).st_mode | stat.S_IEXEC)
+        self.tessdata = os.path.join(tmp.name, 'share', 'tessdata')
+        os.makedirs(self.tessdata)
+        open(os.path.join(self.tessdata, 'eng.traineddata'), 'w').close()
+
+        env = patch.dict(os.environ, {'PATH': os.path.join(tmp.name, 'bin')})
+        env.start()
+        self.addCleanup(env.stop)
+        os.environ.pop('TESSDATA_PREFIX', None)
+
+    @override_settings(TESSERACT_CMD='', TESSDATA_PREFIX='')
+    def test_binary_and_tessdata_are_found(self):
+        self.assertEqual(find_tesseract(), self.cmd)
+        self.assertEqual(find_tessdata('eng'), self.tessdata)
+        self.assertEqual(find_tessdata('eng+deu'), self.tessdata)
+        self.assertIsNone(find_tessdata('deu'))
+
+    @override_settings(TESSERACT_CMD='/opt/tesseract/bin/tesseract', TESSDATA_PREFIX='/opt/tessdata')
+    def test_settings_win(self):
+        with patch('data_capture.ocr.os.path.isfile', return_value=True):
+            self.assertEqual(find_tesseract(), '/opt/tesseract/bin/tesseract')
+        self.assertEqual(find_tessdata(), '/opt/tessdata')
+
+    @override_settings(TESSERACT_CMD='', TESSDATA_PREFIX='', OCR_LANG='eng')
+    def test_engine_prefers_tesserocr(self):
+        class FakeApi:
+            loads = 0
+
+            def __init__(self, lang, path=None):
+                FakeApi.loads += 1
+                self.args = (lang, path)
+
+            def SetImage(self, image):
+                self.image = image
+
+            def GetUTF8Text(self):
+                return f'{self.image.mode} {self.image.width}'
+
+            def End(self):
+                pass
+
+        fake_module = type(sys)('tesserocr')
+        fake_module.PyTessBaseAPI = FakeApi
+        with patch('data_capture.ocr.tesserocr', fake_module, create=True), \
+                patch('data_capture.ocr.TESSEROCR_AVAILABLE', True):
+            engine = ocr.make_engine()
+            texts = engine.recognize(images(20, 30, mode='RGBA'))
+
+        self.assertEqual(texts, ['RGB 20', 'RGB 30'])
+        self.assertEqual(FakeApi.loads, 1)
+        self.assertEqual(engine.api.args, ('eng', self.tessdata))
+
+    @override_settings(TESSERACT_CMD='', TESSDATA_PREFIX='')
+    def test_queued_images_share_one_tesseract_run(self):
+        log = os.path.join(self.prefix, 'runs.log')
+        with patch.dict(os.environ, {'FAKE_TESSERACT_LOG': log}), \
+                patch('data_capture.ocr.TESSEROCR_AVAILABLE', False):
+            pool = OcrPool(workers=1, batch=8)
+            self.addCleanup(pool.close)
+            self.assertEqual(pool.map(images(10, 20, 30, 40, 50)), ['10x10', '20x10', '30x10', '40x10', '50x10'])
+
+            # Tesseract 4 also puts the separator after the last page
+            with patch.dict(os.environ, {'FAKE_TESSERACT_TRAILING': '1'}):
+                engine = ocr.make_engine()
+            self.assertEqual(engine.recognize(images(60, 70)), ['60x10', '70x10'])
+
+        with open(log) as f:
+            runs = f.read().splitlines()
+        self.assertEqual(len(runs), 2)
+        self.assertIn(f'-l eng --tessdata-dir {self.tessdata}', runs[0])
+
+    def test_tesseract_errors_are_raised(self):
+        with patch.dict(os.environ, {'FAKE_TESSERACT_LOG': os.devnull, 'FAKE_TESSERACT_FAIL': '1'}):
+            engine = CliEngine(self.cmd, 'eng')
+        with self.assertRaisesMessage(OcrError, 'eng.traineddata'):
+            engine.recognize(images(10))
+        with self.assertRaises(OcrError):
+            CliEngine(os.path.join(self.prefix, 'missing'), 'eng').recognize(images(10))
+
+
+class OcrPoolTests(SimpleTestCase):
+    def setUp(self):
+        FakeEngine.created = 0
+
+    def test_workers_keep_their_engine(self):
+        pool = OcrPool(workers=2, batch=3, engine_factory=FakeEngine)
+        self.addCleanup(pool.close)
+
+        results = {}
+        threads = [
+            threading.Thread(target=lambda n=n: results.update({n: pool.map(images(*range(n, n + 10)))}))
+            for n in range(100, 140, 10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for n, texts in results.items():
+            self.assertEqual(texts, [f'{width}x10' for width in range(n, n + 10)])
+        self.assertEqual(len(results), 4)
+        self.assertLessEqual(FakeEngine.created, 2)
+
+    def test_a_failed_batch_does_not_break_the_pool(self):
+        pool = OcrPool(workers=1, batch=1, engine_factory=FakeEngine)
+        self.addCleanup(pool.close)
+
+        futures = pool.submit_many(images(12, 13, 14))
+
+        self.assertEqual(futures[0].result(), '12x10')
+        with self.assertRaisesMessage(OcrError, 'unlucky'):
+            futures[1].result()
+        self.assertEqual(futures[2].result(), '14x10')
+        self.assertEqual(pool.submit(images(15)[0]).result(), '15x10')
+
+    def test_closed_pool_refuses_work(self):
+        pool = OcrPool(workers=2, engine_factory=FakeEngine)
+        self.assertEqual(pool.map(images(10)), ['10x10'])
+        pool.close()
+
+        with self.assertRaises(OcrError):
+            pool.submit(images(10)[0])
+
+    @override_settings(OCR_WORKERS=0, EXTRACTION_WORKERS={'pdf': 4, 'image': 4})
+    def test_pool_processes_share_the_cpus(self):
+        with patch('data_capture.ocr.os.cpu_count', return_value=8):
+            with patch('data_capture.ocr.multiprocessing.parent_process', return_value=object()):
+                # 8 OCR-capable pool processes on 8 CPUs: one engine each, not 4
+                self.assertEqual(OcrPool().workers, 1)
+                with override_settings(EXTRACTION_WORKERS={'pdf': 1, 'image': 1}):
+                    self.assertEqual(OcrPool().workers, 4)
+            with patch('data_capture.ocr.multiprocessing.parent_process', return_value=None):
+                self.assertEqual(OcrPool().workers, 4)
+
+    def test_missing_tesseract_fails_each_image(self):
+        with patch('data_capture.ocr.TESSEROCR_AVAILABLE', False), \
+                patch('data_capture.ocr.find_tesseract', return_value=None):
+            pool = OcrPool(workers=1)
+            self.addCleanup(pool.close)
+            with self.assertRaisesMessage(OcrError, 'not installed'):
+                pool.map(images(10))
+
+
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliett',
+         'kilo', 'lima', 'mike', 'november', 'oscar', 'papa', 'quebec', 'romeo', 'sierra', 'tango']
+
+
+class BandEngine:
+    """Reads 50-row bands of grey level 10 * n as the line WORDS[n]; a band cut by the tile edge comes out garbled."""
+
+    def recognize(self, batch):
+        texts = []
+        for image in batch:
+            column = [image.getpixel((0, y)) for y in range(image.height)]
+            lines = []
+            for value, rows in itertools.groupby(column):
+                word = WORDS[value // 10]
+                lines.append(f'{word} line {value // 10}' if len(list(rows)) == 50 else word[:3] + '~')
+            texts.append('\n'.join(lines))
+        return texts
+
+    def close(self):
+        pass
+
+
+def banded_image(lines):
+    image = Image.new('L', (40, 50 * lines))
+    for n in range(lines):
+        image.paste(10 * n, (0, 50 * n, 40, 50 * (n + 1)))
+    return image
+
+
+@override_settings(OCR_TILE_THRESHOLD_PIXELS=10_000, OCR_TILE_HEIGHT=310, OCR_TILE_OVERLAP=120)
+class TiledOcrTests(SimpleTestCase):
+    def setUp(self):
+        pool = OcrPool(workers=3, engine_factory=BandEngine)
+        self.addCleanup(pool.close)
+        patcher = patch('data_capture.ocr.get_ocr_pool', return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tiles_overlap_and_cover_the_image(self):
+        self.assertEqual(plan_tiles(40, 1000), [
+            (0, 0, 40, 310), (0, 190, 40, 500), (0, 380, 40, 690), (0, 570, 40, 880), (0, 760, 40, 1000),
+        ])
+        self.assertEqual(plan_tiles(40, 200), [(0, 0, 40, 200)])
+
+    def test_tiles_are_stitched_in_reading_order(self):
+        text, tiles = ocr_tiled(banded_image(20))
+
+        self.assertEqual(text.splitlines(), [f'{word} line {n}' for n, word in enumerate(WORDS)])
+        self.assertEqual([tile['box'] for tile in tiles], [list(box) for box in plan_tiles(40, 1000)])
+        self.assertTrue(all(tile['seconds'] >= 0 for tile in tiles))
+
+    def test_small_images_are_read_whole(self):
+        text, tiles = ocr_tiled(banded_image(4))
+
+        self.assertEqual(tiles, [])
+        self.assertEqual(text.splitlines(), [f'{word} line {n}' for n, word in enumerate(WORDS[:4])])
+
+    def test_near_matches_are_only_used_without_an_exact_one(self):
+        self.assertEqual(
+            stitch_tiles(['a\nthe quick brown fox\njumps ov', 'the qu1ck brown fox\njumps over the lazy dog\nend']),
+            'a\nthe quick brown fox\njumps over the lazy dog\nend',
+        )
+        # Look-alike rows are kept when the strips share an exact line
+        self.assertEqual(
+            stitch_tiles(['Total 100\nTotal 200\nTotal 300', 'Total 300\nTotal 400']),
+            'Total 100\nTotal 200\nTotal 300\nTotal 400',
+        )
+
+    @override_settings(OCR_TARGET_DPI=0, OCR_DESKEW=False, OCR_BINARIZE='')
+    @patch('data_capture.utils.ocr_available', return_value=True)
+    def test_image_extraction_reports_tiles(self, _available):
+        with tempfile.NamedTemporaryFile(suffix='.png') as f:
+            banded_image(20).save(f.name)
+            result = extract_image_data(f.name)
+
+        self.assertEqual(len(result['tiles']), 5)
+        self.assertTrue(result['text'].startswith('alpha line 0\nbravo line 1'))
+
+
+class ShadeEngine:
+    """Reads an image as its grey level; three of them must be in progress at once to get through."""
+    barrier = None
+
+    def recognize(self, batch):
+        if self.barrier is not None:
+            self.barrier.wait()
+        return [f'shade {image.convert("L").getpixel((0, 0))}' for image in batch]
+
+    def close(self):
+        pass
+
+
+@override_settings(OCR_TARGET_DPI=0, OCR_DESKEW=False, OCR_BINARIZE='')
+class MultiFrameImageTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        available = patch('data_capture.utils.ocr_available', return_value=True)
+        available.start()
+        self.addCleanup(available.stop)
+
+    def use_pool(self, workers, barrier=None):
+        ShadeEngine.barrier = barrier
+        self.addCleanup(setattr, ShadeEngine, 'barrier', None)
+        pool = OcrPool(workers=workers, batch=1, engine_factory=ShadeEngine)
+        self.addCleanup(pool.close)
+        patcher = patch('data_capture.ocr.get_ocr_pool', return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tiff(self, shades):
+        path = os.path.join(self.dir, 'scan.tiff')
+        pages = [Image.new('L', (60, 40), shade) for shade in shades]
+        pages[0].save(path, format='TIFF', save_all=True, append_images=pages[1:])
+        return path
+
+    def test_frames_are_read_in_parallel_as_pages(self):
+        self.use_pool(workers=3, barrier=threading.Barrier(3, timeout=5))
+
+        result = extract_image_data(self.tiff([10, 20, 30]))
+
+        self.assertEqual(result['frames'], 3)
+        self.assertEqual([(e['page'], e['text']) for e in result['content']],
+                         [(1, 'shade 10'), (2, 'shade 20'), (3, 'shade 30')])
+        self.assertEqual(result['text'], 'shade 10\n\nshade 20\n\nshade 30')
+        self.assertNotIn('truncated', result)
+
+    def test_repeated_frames_are_read_once(self):
+        self.use_pool(workers=1)
+        path = os.path.join(self.dir, 'anim.gif')
+        frames = [Image.new('L', (60, 40), shade) for shade in (10, 200, 10)]
+        frames[0].save(path, format='GIF', save_all=True, append_images=frames[1:])
+
+        with patch.object(ShadeEngine, 'recognize', autospec=True, side_effect=ShadeEngine.recognize) as mock_read:
+            result = extract_image_data(path)
+
+        self.assertEqual(mock_read.call_count, 2)
+        self.assertEqual(result['content'][2], {'page': 3, 'same_as': 1})
+        self.assertEqual(result['text'], 'shade 10\n\nshade 200')
+
+    @override_settings(IMAGE_OCR_MAX_FRAMES=2)
+    def test_frames_past_the_limit_are_not_read(self):
+        self.use_pool(workers=2)
+
+        result = extract_image_data(self.tiff([10, 20, 30, 40]))
+
+        self.assertEqual(result['frames'], 4)
+        self.assertEqual([e['page'] for e in result['content']], [1, 2])
+        self.assertTrue(result['truncated'])
@@ -0,0 +1,84 @@
+import io
+
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+from PIL import Image, ImageDraw
+
+from data_capture.ocrprep import estimate_skew, otsu_threshold, prepare_for_ocr, sauvola_ink, source_dpi
+
+
+def text_page(size=(1200, 900), scale=4):
+    """Dark text lines on white, drawn small and scaled up so strokes are several pixels wide."""
+    small = Image.new('L', (size[0] // scale, size[1] // scale), 255)
+    draw = ImageDraw.Draw(small)
+    for row in range(8, small.height - 16, 16):
+        draw.text((8, row), 'The quick brown fox jumps over the lazy dog 0123456789', fill=0)
+    return small.resize(size, Image.Resampling.NEAREST)
+
+
+def reopened(image, **save_args):
+    buffer = io.BytesIO()
+    image.save(buffer, **save_args)
+    buffer.seek(0)
+    return Image.open(buffer)
+
+
+@override_settings(OCR_PREPROCESS_GRAYSCALE=True, OCR_TARGET_DPI=300, OCR_DESKEW=True, OCR_BINARIZE='sauvola')
+class PrepareForOcrTests(SimpleTestCase):
+    def test_resolution_comes_from_scanners_not_cameras(self):
+        self.assertEqual(source_dpi(reopened(text_page(), format='PNG', dpi=(600, 600))), 600)
+        # 72 dpi is a camera default: taken as an A4 page 1200 px tall
+        self.assertAlmostEqual(source_dpi(reopened(text_page(), format='JPEG', dpi=(72, 72))), 1200 / 11.69)
+
+    def test_high_resolution_jpeg_is_downscaled_while_decoding(self):
+        image = reopened(text_page().convert('RGB'), format='JPEG', dpi=(600, 600))
+
+        prepared, info = prepare_for_ocr(image)
+
+        self.assertEqual(info['steps'], ['downscale', 'binarize'])  # decoded as grayscale already
+        self.assertEqual(prepared.size, (600, 450))
+        self.assertEqual(prepared.mode, '1')
+        self.assertEqual(info['size'], [600, 450])
+
+    def test_skewed_text_is_straightened(self):
+        skewed = text_page().rotate(3, Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+
+        prepared, info = prepare_for_ocr(reopened(skewed.convert('RGB'), format='PNG'))
+
+        self.assertIn('deskew', info['steps'])
+        self.assertAlmostEqual(info['skew'], 3, delta=0.1)
+        gray = np.asarray(prepared.convert('L'))
+        self.assertAlmostEqual(estimate_skew(gray <= otsu_threshold(gray)), 0, delta=0.1)
+
+    def test_sauvola_copes_with_uneven_lighting(self):
+        text = np.asarray(text_page()) < 128
+        # Lighting falls from white on the left to dark grey on the right; ink is always 60 levels darker
+        background = np.linspace(255, 90, text.shape[1])[None, :].repeat(text.shape[0], 0)
+        gray = np.where(text, background - 60, background).astype(np.uint8)
+
+        ink = sauvola_ink(gray, 51)
+
+        self.assertGreater(ink[text].mean(), 0.9)
+        self.assertLess(ink[~text].mean(), 0.01)
+        # One global threshold loses the dark side
+        self.assertGreater((gray <= otsu_threshold(gray))[~text].mean(), 0.2)
+
+    @override_settings(OCR_PREPROCESS_GRAYSCALE=False, OCR_TARGET_DPI=0, OCR_DESKEW=False, OCR_BINARIZE='')
+    def test_steps_can_be_turned_off(self):
+        image = reopened(text_page().convert('RGB'), format='PNG', dpi=(600, 600))
+
+        prepared, info = prepare_for_ocr(image)
+
+        self.assertEqual((prepared.mode, prepared.size), ('RGB', (1200, 900)))
+        self.assertEqual(info, {'steps': [], 'size': [1200, 900], 'skew': 0.0})
+
+    @override_settings(OCR_DESKEW=False, OCR_BINARIZE='otsu')
+    def test_transparent_images_are_flattened_on_white(self):
+        image = Image.new('RGBA', (200, 100), (0, 0, 0, 0))
+        ImageDraw.Draw(image).rectangle((50, 25, 150, 75), fill=(0, 0, 0, 255))
+
+        prepared, info = prepare_for_ocr(image)
+
+        ink = ~np.asarray(prepared)
+        self.assertEqual(info['steps'], ['grayscale', 'binarize'])
+        self.assertEqual(int(ink.sum()), 101 * 51)
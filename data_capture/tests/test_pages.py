@@ -0,0 +1,143 @@
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from data_capture.models import DataSource, ExtractedData, ExtractedPage
+from data_capture.pages import ensure_pages, store_pages
+
+User = get_user_model()
+
+
+def pdf_payload(pages):
+    return {
+        "type": "pdf",
+        "pages": pages,
+        "content": [{"page": n, "text": f"Text of page {n}"} for n in range(1, pages + 1)],
+    }
+
+
+class PageStorageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="u", email="u@example.com", password="pw")
+        self.source = DataSource.objects.create(user=self.user, source_type="pdf", file_name="a.pdf")
+
+    def _extracted(self, payload, **kwargs):
+        return ExtractedData.objects.create(
+            source=self.source, user=self.user, data=json.dumps(payload), **kwargs,
+        )
+
+    def test_store_pages_writes_one_row_per_page(self):
+        payload = pdf_payload(3)
+        extracted = self._extracted(payload)
+
+        store_pages(extracted, payload)
+
+        extracted.refresh_from_db()
+        self.assertTrue(extracted.paged)
+        self.assertEqual(
+            list(extracted.pages.values_list("page", "text")),
+            [(1, "Text of page 1"), (2, "Text of page 2"), (3, "Text of page 3")],
+        )
+
+    def test_non_pdf_data_is_left_alone(self):
+        payload = {"type": "excel", "sheets": {}}
+        extracted = self._extracted(payload)
+
+        store_pages(extracted, payload)
+        ensure_pages(extracted)
+
+        extracted.refresh_from_db()
+        self.assertFalse(extracted.paged)
+        self.assertFalse(ExtractedPage.objects.exists())
+
+    def test_backfill_command_splits_legacy_rows(self):
+        extracted = self._extracted(pdf_payload(2))
+
+        call_command("backfill_extractions", stdout=io.StringIO())
+
+        self.assertTrue(ExtractedData.objects.get(pk=extracted.pk).paged)
+        self.assertEqual(extracted.pages.count(), 2)
+
+    def test_ensure_pages_splits_legacy_rows_once(self):
+        extracted = self._extracted(pdf_payload(2))
+
+        ensure_pages(extracted)
+        ensure_pages(ExtractedData.objects.get(pk=extracted.pk))
+
+        self.assertTrue(ExtractedData.objects.get(pk=extracted.pk).paged)
+        self.assertEqual(extracted.pages.count(), 2)
+
+
+class SourcePagesViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="u", email="u@example.com", password="pw")
+        self.client.force_login(self.user)
+        self.source = DataSource.objects.create(user=self.user, source_type="pdf", file_name="big.pdf")
+        payload = pdf_payload(45)
+        extracted = ExtractedData.objects.create(source=self.source, user=self.user, data=json.dumps(payload))
+        store_pages(extracted, payload)
+
+    def _url(self, source=None):
+        return reverse("api_source_pages", args=[(source or self.source).pk])
+
+    @override_settings(PDF_PAGES_PER_REQUEST=20)
+    def test_detail_renders_only_the_first_batch(self):
+        response = self.client.get(reverse("source_detail", args=[self.source.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["extracted_type"], "pdf")
+        self.assertEqual(response.context["pdf_page_count"], 45)
+        self.assertEqual([p["page"] for p in response.context["pdf_pages"]], list(range(1, 21)))
+        self.assertContains(response, "Text of page 20")
+        self.assertNotContains(response, "Text of page 21")
+        self.assertContains(response, 'id="loadMorePages"')
+        # The full JSON blob is never loaded for paged PDFs
+        self.assertIn("data", response.context["extracted_obj"].get_deferred_fields())
+
+    @override_settings(PDF_PAGES_PER_REQUEST=20)
+    def test_api_pages_through_the_document(self):
+        first = self.client.get(self._url()).json()
+        last = self.client.get(self._url(), {"page": 3}).json()
+
+        self.assertEqual((first["count"], first["num_pages"], first["has_next"]), (45, 3, True))
+        self.assertEqual(first["pages"][0], {"page": 1, "text": "Text of page 1"})
+        self.assertEqual([p["page"] for p in last["pages"]], list(range(41, 46)))
+        self.assertFalse(last["has_next"])
+
+    @override_settings(PDF_PAGES_PER_REQUEST_MAX=10)
+    def test_per_page_is_capped(self):
+        data = self.client.get(self._url(), {"per_page": 1000}).json()
+
+        self.assertEqual(len(data["pages"]), 10)
+        self.assertEqual(data["num_pages"], 5)
+
+    def test_requires_login(self):
+        self.client.logout()
+
+        self.assertEqual(self.client.get(self._url()).status_code, 401)
+
+    @override_settings(PDF_PAGES_PER_REQUEST=20)
+    def test_unsplit_rows_are_served_from_json_without_writing(self):
+        legacy_source = DataSource.objects.create(user=self.user, source_type="pdf", file_name="old.pdf")
+        legacy = ExtractedData.objects.create(source=legacy_source, user=self.user, data=json.dumps(pdf_payload(25)))
+
+        response = self.client.get(reverse("source_detail", args=[legacy_source.pk]))
+        self.assertEqual(response.context["pdf_page_count"], 25)
+        self.assertEqual(len(response.context["pdf_pages"]), 20)
+
+        data = self.client.get(self._url(legacy_source), {"page": 2}).json()
+        self.assertEqual([p["page"] for p in data["pages"]], list(range(21, 26)))
+
+        self.assertFalse(ExtractedData.objects.get(pk=legacy.pk).paged)
+        self.assertFalse(legacy.pages.exists())
+
+    def test_other_users_sources_are_not_found(self):
+        other = User.objects.create_user(username="other", email="other@example.com", password="pw")
+        theirs = DataSource.objects.create(user=other, source_type="pdf", file_name="theirs.pdf")
+        ExtractedData.objects.create(source=theirs, user=other, data=json.dumps(pdf_payload(1)))
+
+        self.assertEqual(self.client.get(self._url(theirs)).status_code, 404)
@@ -0,0 +1,116 @@
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from data_capture.models import AuditLog, DataSource, ExtractedData, ExtractionJob
+from data_capture.pipeline import AuditStage, Pipeline, PersistStage, Stage, Upload, stage_stats
+
+
+User = get_user_model()
+
+
+class _Record(Stage):
+    def __init__(self, name, halt=False, always=False, processed=0, error=None):
+        self.name = name
+        self.halt = halt
+        self.always = always
+        self.processed = processed
+        self.error = error
+
+    def run(self, upload):
+        upload.audit('ran', self.name)
+        if self.error is not None:
+            raise self.error
+        if self.halt:
+            upload.halt(Upload.FAILED, f"{self.name} failed")
+        return self.processed
+
+
+class PipelineTests(TestCase):
+    def test_halt_skips_remaining_stages_except_always(self):
+        upload = Upload(user=None, source_type="pdf", file_name="a.pdf")
+        Pipeline([
+            _Record("first", processed=10),
+            _Record("second", halt=True),
+            _Record("third"),
+            _Record("last", always=True),
+        ]).run(upload)
+
+        self.assertEqual([m for _, m in upload.audit_events], ["first", "second", "last"])
+        self.assertEqual(upload.status, Upload.FAILED)
+        self.assertEqual(upload.detail, "second failed")
+        self.assertEqual([m["stage"] for m in upload.metrics], ["first", "second", "last"])
+        self.assertEqual(upload.metrics[0]["bytes"], 10)
+        self.assertEqual(set(upload.timings), {"first", "second", "last"})
+
+    def test_error_still_runs_always_stages_then_raises(self):
+        upload = Upload(user=None, source_type="pdf", file_name="a.pdf")
+        pipeline = Pipeline([
+            _Record("first"),
+            _Record("broken", error=RuntimeError("boom")),
+            _Record("third"),
+            _Record("last", always=True),
+        ])
+
+        with self.assertRaisesMessage(RuntimeError, "boom"):
+            pipeline.run(upload)
+
+        self.assertEqual([m for _, m in upload.audit_events], ["first", "broken", "last"])
+        self.assertEqual(upload.status, Upload.FAILED)
+        self.assertEqual(upload.detail, "Processing error: boom")
+        self.assertEqual([m["stage"] for m in upload.metrics], ["first", "last"])
+
+    def test_arun_matches_run_including_the_error_path(self):
+        upload = Upload(user=None, source_type="pdf", file_name="a.pdf")
+        pipeline = Pipeline([
+            _Record("first", processed=10),
+            _Record("broken", error=RuntimeError("boom")),
+            _Record("third"),
+            _Record("last", always=True),
+        ])
+
+        with self.assertRaisesMessage(RuntimeError, "boom"):
+            async_to_sync(pipeline.arun)(upload)
+
+        self.assertEqual([m for _, m in upload.audit_events], ["first", "broken", "last"])
+        self.assertEqual(upload.detail, "Processing error: boom")
+        self.assertEqual([m["stage"] for m in upload.metrics], ["first", "last"])
+        self.assertEqual(upload.metrics[0]["bytes"], 10)
+
+    def test_failed_persist_writes_no_rows_but_keeps_the_audit_events(self):
+        user = User.objects.create_user(username="persist", password="persistpass123")
+        upload = Upload(user=user, source_type="pdf", file_name="a.pdf", file_path="/tmp/a.pdf", file_hash="ab" * 32)
+        upload.extracted_data = {"type": "pdf", "pages": 1, "content": [{"page": 1, "text": "hi"}]}
+        upload.data_json = '{"type": "pdf"}'
+        upload.content_hash = "cd" * 32
+        upload.audit("upload_success", "a.pdf processed")
+
+        with patch("data_capture.pipeline.store_pages", side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                Pipeline([PersistStage(), AuditStage()]).run(upload)
+
+        self.assertFalse(DataSource.objects.exists())
+        self.assertFalse(ExtractedData.objects.exists())
+        self.assertTrue(AuditLog.objects.filter(action="upload_success").exists())
+
+    def test_stage_stats_sums_metrics_of_finished_jobs(self):
+        user = User.objects.create_user(username="stats", password="statspass123")
+        for wall in (1.0, 3.0):
+            ExtractionJob.objects.create(
+                user=user, source_type="pdf", file_name="a.pdf", file_path="/tmp/a.pdf",
+                status=ExtractionJob.STATUS_DONE,
+                metrics=[{"stage": "extract", "wall": wall, "cpu": 0.5, "bytes": 2_000_000}],
+            )
+        ExtractionJob.objects.create(
+            user=user, source_type="pdf", file_name="b.pdf", file_path="/tmp/b.pdf",
+            metrics=[{"stage": "extract", "wall": 100.0, "cpu": 0.0, "bytes": 0}],
+        )
+
+        stats = stage_stats()
+
+        self.assertEqual(stats["extract"]["count"], 2)
+        self.assertEqual(stats["extract"]["wall"], 4.0)
+        self.assertEqual(stats["extract"]["cpu"], 1.0)
+        self.assertAlmostEqual(stats["extract"]["mb_per_s"], 1.0)
@@ -0,0 +1,111 @@
+from django.test import TestCase, override_settings
+from unittest.mock import patch
+
+from data_capture import security, scancache
+from data_capture.models import ScanVerdict
+from data_capture.tests.fake_clamd import FakeClamd
+from data_capture.clamd import ClamdClient
+
+
+HASH = "a" * 64
+
+
+class ScanVerdictCacheTests(TestCase):
+    def setUp(self):
+        scancache.clear()
+        self.addCleanup(scancache.clear)
+        version = patch("data_capture.scancache._query_signature_version", return_value="ClamAV 1.0.0/27000")
+        self.mock_version = version.start()
+        self.addCleanup(version.stop)
+
+    @patch("data_capture.security._scan", return_value=(True, "File is clean (clamd)."))
+    def test_known_clean_file_skips_the_scanner(self, mock_scan):
+        for _ in range(3):
+            self.assertEqual(security.scan_file_for_malware("a.pdf", HASH), (True, "File is clean (clamd)."))
+
+        mock_scan.assert_called_once()
+        stats = scancache.scan_cache_stats()
+        self.assertEqual((stats["misses"], stats["memory_hits"]), (1, 2))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+        self.assertEqual(stats["stored_verdicts"], 1)
+
+    @patch("data_capture.security._scan", return_value=(False, "Eicar-Test-Signature FOUND"))
+    def test_infected_verdict_survives_a_restart(self, mock_scan):
+        security.scan_file_for_malware("bad.pdf", HASH)
+        # A fresh process: empty memory layer, same table
+        scancache.clear()
+
+        status, detail = security.scan_file_for_malware("bad.pdf", HASH)
+
+        self.assertFalse(status)
+        self.assertIn("FOUND", detail)
+        mock_scan.assert_called_once()
+        self.assertEqual(scancache.scan_cache_stats()["db_hits"], 1)
+        self.assertEqual(ScanVerdict.objects.get().hits, 1)
+
+    @patch("data_capture.security._scan", return_value=(None, "Malware scanner not installed on server."))
+    def test_scanner_errors_are_not_cached(self, mock_scan):
+        security.scan_file_for_malware("a.pdf", HASH)
+        security.scan_file_for_malware("a.pdf", HASH)
+
+        self.assertEqual(mock_scan.call_count, 2)
+        self.assertFalse(ScanVerdict.objects.exists())
+
+    @override_settings(SCAN_VERSION_TTL=0)
+    @patch("data_capture.security._scan", return_value=(True, "clean"))
+    def test_signature_update_invalidates_verdicts(self, mock_scan):
+        security.scan_file_for_malware("a.pdf", HASH)
+        self.mock_version.return_value = "ClamAV 1.0.0/27001"
+
+        security.scan_file_for_malware("a.pdf", HASH)
+
+        self.assertEqual(mock_scan.call_count, 2)
+        self.assertEqual(
+            list(ScanVerdict.objects.values_list("signature_version", flat=True)),
+            ["ClamAV 1.0.0/27001"],
+        )
+
+    @override_settings(SCAN_CACHE_SIZE=2)
+    def test_memory_layer_is_lru_bounded(self):
+        for name in ("one", "two", "three"):
+            scancache.store(name, "v1", True, "clean")
+        scancache.lookup("two", "v1")
+
+        self.assertEqual(scancache.scan_cache_stats()["memory_entries"], 2)
+        # "one" was evicted from memory but is still in the table
+        scancache.lookup("one", "v1")
+        stats = scancache.scan_cache_stats()
+        self.assertEqual((stats["memory_hits"], stats["db_hits"]), (1, 1))
+
+    @patch("data_capture.security._scan", return_value=(True, "clean"))
+    def test_no_hash_or_no_scanner_bypasses_cache(self, mock_scan):
+        security.scan_file_for_malware("a.pdf")
+        self.mock_version.return_value = None
+        scancache.clear()
+        security.scan_file_for_malware("a.pdf", HASH)
+
+        self.assertEqual(mock_scan.call_count, 2)
+        self.assertFalse(ScanVerdict.objects.exists())
+
+
+class SignatureVersionTests(TestCase):
+    def setUp(self):
+        scancache.clear()
+        self.addCleanup(scancache.clear)
+
+    def test_version_comes_from_clamd_without_build_date(self):
+        with FakeClamd() as fake:
+            client = ClamdClient(host=fake.host, port=fake.port, timeout=5)
+            self.addCleanup(client.close)
+            with patch("data_capture.scancache.get_clamd_client", return_value=client):
+                self.assertEqual(scancache.signature_version(), "ClamAV 1.0.0/fake")
+
+    @patch("data_capture.scancache.subprocess.run")
+    @patch("data_capture.scancache.get_clamd_client", return_value=None)
+    def test_version_is_checked_once_per_ttl(self, _client, mock_run):
+        mock_run.return_value.returncode = 0
+        mock_run.return_value.stdout = "ClamAV 1.0.0/27000/Mon Oct 12 08:17:01 2026\n"
+
+        self.assertEqual(scancache.signature_version(), "ClamAV 1.0.0/27000")
+        self.assertEqual(scancache.signature_version(), "ClamAV 1.0.0/27000")
+        mock_run.assert_called_once()
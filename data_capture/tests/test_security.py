@@ -1,8 +1,15 @@
-from django.test import SimpleTestCase, TestCase
+import os
+import tempfile
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from unittest import skipUnless
 from unittest.mock import patch, MagicMock, mock_open
 from types import SimpleNamespace
 from pathlib import Path
 
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+
 # relative import, works even if app name changes
 from data_capture import security
 
@@ -82,10 +89,11 @@ class SanitizeFileTests(SimpleTestCase):
     Tests for sanitize_file()
     """
 
+    @patch("data_capture.security._atomic_replace")
     @patch("builtins.open", new_callable=mock_open)
     @patch("data_capture.security.PdfWriter")
     @patch("data_capture.security.PdfReader")
-    def test_sanitize_pdf_success(self, mock_reader, mock_writer, mock_file_open):
+    def test_sanitize_pdf_success(self, mock_reader, mock_writer, mock_file_open, mock_replace):
         # Simulate a PDF with two pages
         mock_reader.return_value.pages = [MagicMock(), MagicMock()]
         mock_writer_instance = MagicMock()
@@ -102,6 +110,7 @@ class SanitizeFileTests(SimpleTestCase):
         mock_writer_instance.add_page.assert_called()
         mock_writer_instance.write.assert_called_once()
         mock_file_open.assert_called_once()
+        mock_replace.assert_called_once_with(Path("/tmp/test.pdf"))
 
     @patch("builtins.open", new_callable=mock_open)
     @patch("data_capture.security.PdfWriter")
@@ -117,10 +126,13 @@ class SanitizeFileTests(SimpleTestCase):
         self.assertEqual(sanitized_path, expected_path)
         self.assertIn("failed", msg.lower())
 
+    @patch("data_capture.security._atomic_replace")
     @patch("data_capture.security.Image.open")
-    def test_sanitize_image_success(self, mock_open_img):
+    def test_sanitize_image_success(self, mock_open_img, mock_replace):
         mock_img = MagicMock()
         mock_img.mode = "RGB"
+        mock_img.width, mock_img.height = 640, 480
+        mock_img.n_frames = 1
         mock_open_img.return_value = mock_img
 
         ok, sanitized_path, msg = security.sanitize_file("/tmp/test.png", "image")
@@ -201,3 +213,262 @@ class LogAuditEventTests(TestCase):
         self.assertEqual(kwargs["action"], "upload")
         self.assertEqual(kwargs["message"], "")
         self.assertLessEqual(len(kwargs["user_agent"]), 255)
+
+
+class DetectFileTypeTests(SimpleTestCase):
+    """
+    Tests for detect_file_type()
+    """
+
+    def test_known_signatures(self):
+        self.assertEqual(security.detect_file_type(b"%PDF-1.7\n"), "pdf")
+        self.assertEqual(security.detect_file_type(b"\x89PNG\r\n\x1a\n...."), "image")
+        self.assertEqual(security.detect_file_type(b"\xff\xd8\xff\xe0"), "image")
+        self.assertEqual(security.detect_file_type(b"II*\x00\x08\x00"), "image")
+        self.assertEqual(security.detect_file_type(b"MM\x00*\x00\x00"), "image")
+        self.assertEqual(security.detect_file_type(b"PK\x03\x04rest"), "excel")
+        self.assertEqual(security.detect_file_type(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"), "excel")
+
+    def test_pdf_header_after_junk(self):
+        self.assertEqual(security.detect_file_type(b"\x00" * 100 + b"%PDF-1.4"), "pdf")
+
+    def test_unknown(self):
+        self.assertIsNone(security.detect_file_type(b"MZ\x90\x00"))
+        self.assertIsNone(security.detect_file_type(b""))
+
+
+class SanitizeExtractedDataTests(SimpleTestCase):
+    """
+    Tests for sanitize_text() / sanitize_extracted_data()
+    """
+
+    def test_sanitize_text(self):
+        self.assertEqual(security.sanitize_text("<script>alert(1)</script><b>Tom</b> & Jerry"), "Tom &amp; Jerry")
+        self.assertEqual(security.sanitize_text("x; DROP TABLE users"), "x; [REMOVED] users")
+        self.assertEqual(security.sanitize_text("it's"), "it&#x27;s")
+        plain = "plain words 123"
+        self.assertIs(security.sanitize_text(plain), plain)
+
+    def test_sanitizes_nested_data_in_place(self):
+        rows = [["ok", 1, 2.5, None, True, "<i>a</i> & b"], ["fine", "x > y"]]
+        data = {"type": "excel", "sheets": {"S": {"columns": ["<b>Name</b>", "Age"], "rows": rows}}}
+
+        result = security.sanitize_extracted_data(data)
+
+        self.assertIs(result, data)
+        self.assertIs(data["sheets"]["S"]["rows"], rows)
+        self.assertEqual(rows, [["ok", 1, 2.5, None, True, "a &amp; b"], ["fine", "x &gt; y"]])
+        self.assertEqual(data["sheets"]["S"]["columns"], ["Name", "Age"])
+
+    def test_shared_containers_are_escaped_once(self):
+        shared = ["a & b"]
+        data = {"first": shared, "second": shared}
+
+        security.sanitize_extracted_data(data)
+
+        self.assertEqual(shared, ["a &amp; b"])
+
+    def test_deep_nesting_and_scalars(self):
+        data = leaf = []
+        for _ in range(5000):
+            leaf.append([])
+            leaf = leaf[0]
+        leaf.append("<x>")
+
+        security.sanitize_extracted_data(data)
+
+        self.assertEqual(leaf, [""])
+        self.assertEqual(security.sanitize_extracted_data(42), 42)
+        self.assertEqual(security.sanitize_extracted_data("a<b>c"), "ac")
+
+
+class SanitizePdfOnDiskTests(SimpleTestCase):
+    """
+    sanitize_file() on real PDFs: atomic replace, limits and the run report.
+    """
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+    def _pdf(self, pages=3):
+        writer = PdfWriter()
+        for _ in range(pages):
+            writer.add_blank_page(width=200, height=200)
+        path = self.dir / "doc.pdf"
+        with open(path, "wb") as f:
+            writer.write(f)
+        return path
+
+    def test_rewrites_in_place_and_reports(self):
+        path = self._pdf(pages=3)
+        report = {}
+
+        ok, sanitized_path, _ = security.sanitize_file(str(path), "pdf", report)
+
+        self.assertTrue(ok)
+        self.assertEqual(sanitized_path, str(path))
+        self.assertEqual(len(PdfReader(str(path)).pages), 3)
+        self.assertEqual(report["pages"], 3)
+        self.assertGreater(report["bytes"], 0)
+        self.assertGreaterEqual(report["peak_rss"], 0)
+        self.assertIn("mb_per_s", report)
+        # No temp files left behind
+        self.assertEqual(os.listdir(self.dir), ["doc.pdf"])
+
+    @skipUnless(security._reset_peak_rss(), "needs a resettable RSS high-water mark (Linux)")
+    def test_peak_rss_is_measured_per_file(self):
+        path = self._pdf()
+
+        def hungry(p, report):
+            # Touch every page so it becomes resident, then free it
+            bytearray(64 * 1024 * 1024)
+
+        big, small = {}, {}
+        with patch.object(security, "_sanitize_pdf", side_effect=hungry):
+            security.sanitize_file(str(path), "pdf", big)
+        security.sanitize_file(str(path), "pdf", small)
+
+        self.assertGreater(big["peak_rss"], 48 * 1024 * 1024)
+        # Not the process's lifetime high-water mark
+        self.assertLess(small["peak_rss"], 48 * 1024 * 1024)
+
+    def test_crash_while_writing_keeps_original(self):
+        path = self._pdf()
+        original = path.read_bytes()
+
+        with patch.object(PdfWriter, "write", side_effect=OSError("disk full")):
+            ok, _, msg = security.sanitize_file(str(path), "pdf")
+
+        self.assertFalse(ok)
+        self.assertIn("disk full", msg)
+        self.assertEqual(path.read_bytes(), original)
+        self.assertEqual(os.listdir(self.dir), ["doc.pdf"])
+
+    @override_settings(PDF_SANITIZE_MAX_PAGES=2)
+    def test_page_limit(self):
+        path = self._pdf(pages=3)
+        original = path.read_bytes()
+
+        ok, _, msg = security.sanitize_file(str(path), "pdf")
+
+        self.assertFalse(ok)
+        self.assertIn("3 pages (limit 2)", msg)
+        self.assertEqual(path.read_bytes(), original)
+
+    @override_settings(PDF_SANITIZE_MAX_OBJECTS=5)
+    def test_object_limit(self):
+        ok, _, msg = security.sanitize_file(str(self._pdf()), "pdf")
+
+        self.assertFalse(ok)
+        self.assertIn("objects (limit 5)", msg)
+
+
+class SanitizeImageOnDiskTests(SimpleTestCase):
+    """
+    sanitize_file() on real images: container rewrite vs re-encode, limits, optimize pass.
+    """
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+    def _image(self, name, fmt, mode="RGB", **save_args):
+        path = self.dir / name
+        Image.new(mode, (40, 30), color=3 if mode == "P" else (1, 2, 3)).save(path, format=fmt, **save_args)
+        return path
+
+    def test_png_is_rewritten_not_reencoded(self):
+        path = self._image("a.png", "PNG")
+        with open(path, "ab") as f:
+            f.write(b"trailing junk")
+        report = {}
+
+        with patch("data_capture.security._reencode_image") as mock_reencode:
+            ok, _, msg = security.sanitize_file(str(path), "image", report)
+
+        self.assertTrue(ok, msg)
+        mock_reencode.assert_not_called()
+        self.assertEqual(report["method"], "rewrite")
+        self.assertFalse(path.read_bytes().endswith(b"trailing junk"))
+        self.assertEqual(os.listdir(self.dir), ["a.png"])
+
+    def test_other_formats_are_reencoded_in_their_own_mode(self):
+        path = self._image("a.gif", "GIF", mode="P", comment=b"hello")
+        report = {}
+
+        ok, _, _ = security.sanitize_file(str(path), "image", report)
+
+        self.assertTrue(ok)
+        self.assertEqual(report["method"], "reencode")
+        with Image.open(path) as img:
+            self.assertEqual(img.mode, "P")
+            self.assertNotIn("comment", img.info)
+
+    def test_unrewritable_png_falls_back_to_reencode(self):
+        path = self._image("a.png", "PNG")
+        report = {}
+
+        with patch("data_capture.security.STRIPPERS", {"PNG": lambda f_in, f_out: False}):
+            ok, _, _ = security.sanitize_file(str(path), "image", report)
+
+        self.assertTrue(ok)
+        self.assertEqual(report["method"], "reencode")
+        self.assertEqual(Image.open(path).size, (40, 30))
+
+    @override_settings(IMAGE_SANITIZE_MAX_PIXELS=1000)
+    def test_pixel_limit_is_checked_before_decoding(self):
+        path = self._image("a.png", "PNG")
+        original = path.read_bytes()
+
+        with patch("data_capture.security._reencode_image") as mock_reencode:
+            ok, _, msg = security.sanitize_file(str(path), "image")
+
+        self.assertFalse(ok)
+        self.assertIn("1200 pixels (limit 1000)", msg)
+        mock_reencode.assert_not_called()
+        self.assertEqual(path.read_bytes(), original)
+
+    def test_tiff_keeps_every_page_but_no_metadata_tags(self):
+        path = self.dir / "fax.tif"
+        pages = [Image.new("1", (40, 30), color=n % 2) for n in range(3)]
+        xmp = b"<x:xmpmeta>secret</x:xmpmeta>"
+        pages[0].save(path, format="TIFF", save_all=True, append_images=pages[1:], compression="group4",
+                      dpi=(204, 196), tiffinfo={700: xmp})
+        report = {}
+
+        ok, _, msg = security.sanitize_file(str(path), "image", report)
+
+        self.assertTrue(ok, msg)
+        self.assertEqual((report["method"], report["frames"]), ("reencode", 3))
+        self.assertNotIn(b"secret", path.read_bytes())
+        with Image.open(path) as img:
+            self.assertEqual(img.n_frames, 3)
+            self.assertEqual(img.info["compression"], "group4")
+            self.assertEqual(tuple(round(d) for d in img.info["dpi"]), (204, 196))
+            img.seek(1)
+            self.assertEqual(img.getpixel((0, 0)), 255)
+
+    @override_settings(IMAGE_MAX_FRAMES=2)
+    def test_frame_limit(self):
+        path = self.dir / "anim.gif"
+        frames = [Image.new("P", (40, 30), color=n) for n in range(3)]
+        frames[0].save(path, format="GIF", save_all=True, append_images=frames[1:])
+
+        ok, _, msg = security.sanitize_file(str(path), "image")
+
+        self.assertFalse(ok)
+        self.assertIn("3 frames (limit 2)", msg)
+
+    @override_settings(IMAGE_SANITIZE_OPTIMIZE="inline")
+    def test_inline_optimize_pass(self):
+        path = self._image("a.png", "PNG")
+
+        with patch("data_capture.security.optimize_image") as mock_optimize:
+            security.sanitize_file(str(path), "image")
+
+        mock_optimize.assert_called_once_with(str(path))
+        self.assertTrue(security.optimize_image(str(path)))
+        self.assertFalse(security.optimize_image(str(self._image("a.jpg", "JPEG"))))
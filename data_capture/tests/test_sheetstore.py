@@ -0,0 +1,286 @@
+import datetime
+import io
+import json
+import os
+import tempfile
+import time
+import zlib
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import patch
+
+from data_capture import sheetstore
+from data_capture.models import DataSource, ExtractedData
+from data_capture.sheetstore import SheetFile, load_sheets, open_sheets, store_sheets
+
+User = get_user_model()
+
+
+def excel_payload(rows, columns=None):
+    columns = columns or [f'c{i}' for i in range(len(rows[0]))]
+    return {'type': 'excel', 'sheets': {'Data': {'columns': columns, 'rows': rows, 'row_count': len(rows)}}}
+
+
+class SheetStoreTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        settings = override_settings(SHEET_STORE_DIR=tmp.name, SHEET_STORE_BLOCK_ROWS=4)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_round_trip_keeps_types(self):
+        when = datetime.datetime(2026, 10, 16, 9, 30, 15, 250)
+        rows = [
+            [1, 2.5, 3, True, when, 'Dublin', 'x', 2 ** 70],
+            [None, None, 4.0, False, None, 'Corcaigh – €', 7, None],
+            [-7, 1e300, None, None, when, None, None, 1],
+        ] * 3
+        data = excel_payload(rows)
+
+        summary = store_sheets(data)
+        restored = load_sheets(summary)
+
+        self.assertEqual(restored, data)
+        for a, b in zip(restored['sheets']['Data']['rows'], rows):
+            self.assertEqual([type(v) for v in a], [type(v) for v in b])
+        # The last column's final block only holds small ints, the others need JSON
+        self.assertEqual(summary['sheets']['Data']['dtypes'],
+                         ['int', 'float', 'float', 'bool', 'datetime', 'str', 'json', 'mixed'])
+        self.assertEqual(summary['sheets']['Data']['row_count'], 9)
+        self.assertNotIn('rows', summary['sheets']['Data'])
+
+    def test_ranges_only_decode_what_they_need(self):
+        rows = [[n, f'row {n}', n / 2] for n in range(20)]
+        summary = store_sheets(excel_payload(rows, ['n', 'label', 'half']))
+
+        with open_sheets(summary) as sheets, \
+                patch('data_capture.sheetstore.zlib.decompress', wraps=zlib.decompress) as mock_decompress:
+            self.assertEqual(sheets.read_rows('Data', 9, 12), rows[9:12])
+            # Rows 9-11 live in one block of 4: one decompression per column
+            self.assertEqual(mock_decompress.call_count, 3)
+
+            mock_decompress.reset_mock()
+            self.assertEqual(sheets.read_column('Data', 'label', 3, 9), [f'row {n}' for n in range(3, 9)])
+            self.assertEqual(mock_decompress.call_count, 3)
+
+            self.assertEqual(sheets.read_rows('Data', 18, 100), rows[18:])
+
+    def test_columns_added_by_later_rows(self):
+        writer = sheetstore.SheetWriter(self.dir, block_rows=2)
+        columns = ['a']
+        writer.add('S', columns, [[1], [2]])
+        columns.append('Unnamed: 1')
+        writer.add('S', columns, [[3, 'late']])
+        name = writer.close()
+
+        with SheetFile(os.path.join(self.dir, name)) as sheets:
+            self.assertEqual(sheets.columns('S'), ['a', 'Unnamed: 1'])
+            self.assertEqual(sheets.read_rows('S'), [[1, None], [2, None], [3, 'late']])
+
+    def test_identical_data_shares_one_file(self):
+        data = excel_payload([[1, 'a']] * 10)
+
+        self.assertEqual(store_sheets(data)['file'], store_sheets(data)['file'])
+        self.assertEqual([f for f in os.listdir(self.dir)], [store_sheets(data)['file']])
+
+    def test_other_data_is_left_alone(self):
+        for data in ({'type': 'pdf', 'content': []}, {'type': 'excel', 'error': 'bad file'}):
+            self.assertIs(store_sheets(data), data)
+            self.assertIs(load_sheets(data), data)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_numbers_take_less_room_than_json(self):
+        rows = [[n, n * 1.25, n % 2 == 0] for n in range(5000)]
+        data = excel_payload(rows)
+
+        with override_settings(SHEET_STORE_BLOCK_ROWS=1000):
+            summary = store_sheets(data)
+
+        stored = os.path.getsize(os.path.join(self.dir, summary['file'])) + len(json.dumps(summary))
+        self.assertLess(stored * 4, len(json.dumps(data)))
+
+
+class StoredSheetViewTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(SHEET_STORE_DIR=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(username="u", email="u@example.com", password="pw")
+        self.client.force_login(self.user)
+
+    def test_detail_reads_rows_from_the_store(self):
+        source = DataSource.objects.create(user=self.user, source_type="excel", file_name="book.xlsx")
+        summary = store_sheets(excel_payload([["Ada", 36], ["Grace", 85]], ["name", "age"]))
+        ExtractedData.objects.create(source=source, user=self.user, data=json.dumps(summary))
+
+        response = self.client.get(reverse("source_detail", args=[source.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["excel_sheets"][0]["rows"], [["Ada", 36], ["Grace", 85]])
+        self.assertContains(response, "Grace")
+
+    def test_detail_reports_a_missing_store_file(self):
+        source = DataSource.objects.create(user=self.user, source_type="excel", file_name="book.xlsx")
+        summary = store_sheets(excel_payload([["Ada", 36]], ["name", "age"]))
+        ExtractedData.objects.create(source=source, user=self.user, data=json.dumps(summary))
+        os.remove(os.path.join(sheetstore.store_dir(), summary["file"]))
+
+        with self.assertLogs("data_capture.views", level="ERROR"):
+            response = self.client.get(reverse("source_detail", args=[source.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["excel_sheets"][0]["rows"], [])
+        self.assertContains(response, "The stored rows of this sheet could not be read.")
+
+
+@override_settings(SHEET_ROWS_PER_PAGE=10, SHEET_ROWS_PER_REQUEST_MAX=25)
+class SheetPaginationTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(SHEET_STORE_DIR=tmp.name, SHEET_STORE_BLOCK_ROWS=16)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(username="u", email="u@example.com", password="pw")
+        self.client.force_login(self.user)
+        self.rows = [[n, f"row {n}"] for n in range(45)]
+        payload = excel_payload(self.rows, ["n", "label"])
+        payload["sheets"]["Other"] = {"columns": ["x"], "rows": [[1], [2]], "row_count": 2}
+        self.source = DataSource.objects.create(user=self.user, source_type="excel", file_name="book.xlsx")
+        self.extracted = ExtractedData.objects.create(
+            source=self.source, user=self.user, data=json.dumps(store_sheets(payload)),
+        )
+
+    def rows_url(self):
+        return reverse("api_source_sheet_rows", args=[self.source.pk])
+
+    def test_detail_renders_the_first_page_and_the_row_count(self):
+        response = self.client.get(reverse("source_detail", args=[self.source.pk]))
+
+        data, other = response.context["excel_sheets"]
+        self.assertEqual(data["rows"], self.rows[:10])
+        self.assertEqual((data["row_count"], data["prev_url"]), (45, None))
+        self.assertEqual(other["rows"], [[1], [2]])
+        self.assertIsNone(other["next_url"])
+        self.assertContains(response, "Showing rows 1&ndash;10 of 45.")
+        self.assertNotContains(response, "row 10<")
+
+    def test_next_links_move_only_the_selected_sheet(self):
+        response = self.client.get(reverse("source_detail", args=[self.source.pk]))
+        next_url = response.context["excel_sheets"][0]["next_url"]
+
+        response = self.client.get(reverse("source_detail", args=[self.source.pk]) + next_url.split("#")[0])
+
+        data, other = response.context["excel_sheets"]
+        self.assertEqual(data["rows"], self.rows[10:20])
+        self.assertEqual(data["prev_url"], "?sheet=Data&start=0#sheet-0")
+        self.assertEqual(other["rows"], [[1], [2]])
+
+        # Past the end lands on the last row rather than an empty page
+        response = self.client.get(reverse("source_detail", args=[self.source.pk]), {"sheet": "Data", "start": 999})
+        self.assertEqual(response.context["excel_sheets"][0]["rows"], self.rows[44:])
+
+    def test_rows_endpoint_returns_ranges(self):
+        response = self.client.get(self.rows_url(), {"sheet": "Data", "start": 15, "limit": 100})
+
+        body = response.json()
+        self.assertEqual(body["rows"], self.rows[15:40])
+        self.assertEqual((body["row_count"], body["start"], body["next_start"]), (45, 15, 40))
+        self.assertEqual(body["columns"], ["n", "label"])
+
+        body = self.client.get(self.rows_url(), {"sheet": "Data", "start": 40}).json()
+        self.assertEqual((body["rows"], body["next_start"]), (self.rows[40:], None))
+        # Without ?sheet= the first sheet is used
+        self.assertEqual(self.client.get(self.rows_url()).json()["sheet"], "Data")
+
+    def test_rows_endpoint_errors(self):
+        self.assertEqual(self.client.get(self.rows_url(), {"sheet": "Nope"}).status_code, 404)
+        self.assertEqual(self.client.post(self.rows_url()).status_code, 405)
+
+        other = User.objects.create_user(username="o", email="o@example.com", password="pw")
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.rows_url()).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.rows_url()).status_code, 401)
+
+    def test_legacy_json_rows_are_read_without_writing(self):
+        legacy_json = json.dumps(excel_payload(self.rows, ["n", "label"]))
+        legacy = ExtractedData.objects.create(source=self.source, user=self.user, data=legacy_json)
+
+        response = self.client.get(self.rows_url(), {"start": 5, "limit": 3})
+        self.assertEqual(response.json()["rows"], self.rows[5:8])
+        self.assertEqual(response.json()["row_count"], 45)
+
+        response = self.client.get(reverse("source_detail", args=[self.source.pk]))
+        self.assertEqual(response.context["excel_sheets"][0]["rows"], self.rows[:10])
+
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.data, legacy_json)
+
+    def test_backfill_command_moves_legacy_rows_into_the_store(self):
+        legacy = ExtractedData.objects.create(
+            source=self.source, user=self.user, data=json.dumps(excel_payload(self.rows, ["n", "label"])),
+        )
+        out = io.StringIO()
+
+        call_command("backfill_extractions", stdout=out)
+
+        legacy.refresh_from_db()
+        self.assertTrue(sheetstore.is_stored(json.loads(legacy.data)))
+        self.assertEqual(load_sheets(json.loads(legacy.data))["sheets"]["Data"]["rows"], self.rows)
+        self.assertIn("moved 1 spreadsheet", out.getvalue())
+
+
+class SheetStoreCleanupTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        settings = override_settings(SHEET_STORE_DIR=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(username="u", email="u@example.com", password="pw")
+        self.client.force_login(self.user)
+
+    def _source(self, name, payload):
+        source = DataSource.objects.create(user=self.user, source_type="excel", file_name=name)
+        summary = store_sheets(payload)
+        ExtractedData.objects.create(source=source, user=self.user, data=json.dumps(summary))
+        return source, os.path.join(self.dir, summary["file"])
+
+    def test_shared_file_is_deleted_with_its_last_source(self):
+        first, path = self._source("a.xlsx", excel_payload([[1, "x"]]))
+        second, same_path = self._source("b.xlsx", excel_payload([[1, "x"]]))
+        self.assertEqual(path, same_path)
+
+        self.client.post(reverse("delete_source", args=[first.pk]))
+        self.assertTrue(os.path.exists(path))
+
+        self.client.post(reverse("delete_source", args=[second.pk]))
+        self.assertFalse(os.path.exists(path))
+
+    def test_collect_garbage_removes_old_unreferenced_files(self):
+        _, kept = self._source("a.xlsx", excel_payload([[1, "x"]]))
+        orphan = os.path.join(self.dir, "0" * 64 + ".sheets")
+        fresh_orphan = os.path.join(self.dir, "1" * 64 + ".sheets")
+        leftover = os.path.join(self.dir, "tmpabc.tmp")
+        for path in (orphan, fresh_orphan, leftover):
+            with open(path, "wb") as f:
+                f.write(b"x")
+        hours_ago = time.time() - 2 * 3600
+        for path in (kept, orphan, leftover):
+            os.utime(path, (hours_ago, hours_ago))
+
+        self.assertEqual(sheetstore.collect_garbage(), 2)
+
+        self.assertTrue(os.path.exists(kept))
+        self.assertTrue(os.path.exists(fresh_orphan))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(leftover))
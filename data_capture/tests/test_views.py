@@ -1,5 +1,8 @@
 from pathlib import Path
+import hashlib
 import json
+import shutil
+import tempfile
 
 from django.test import TestCase, override_settings
 from django.urls import reverse
@@ -7,10 +10,14 @@ from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from unittest.mock import patch, MagicMock
 
-from data_capture.models import DataSource, ExtractedData
+from data_capture.models import DataSource, ExtractedData, ExtractionJob
+from data_capture.jobs import run_pending_jobs
 
 User = get_user_model()
 
+TMP_MEDIA = Path(tempfile.mkdtemp(prefix="views_media_"))
+TMP_API_MEDIA = Path(tempfile.mkdtemp(prefix="views_api_media_"))
+
 # ---------- Helpers ----------
 
 def create_test_user():
@@ -85,11 +92,34 @@ class DeleteSourceViewTests(TestCase):
         # At least one audit log (upload_undo)
         mock_log.assert_called()
 
+    @patch("data_capture.views.log_audit_event")
+    def test_shared_stored_file_is_deleted_with_its_last_source(self, mock_log):
+        media = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, media, True)
+        (media / "uploads").mkdir()
+        stored = media / "uploads" / "abc_test.pdf"
+        stored.write_bytes(b"%PDF-1.4")
+        first, second = [
+            DataSource.objects.create(user=self.user, source_type="pdf", file_name="test.pdf", stored_name="abc_test.pdf")
+            for _ in range(2)
+        ]
+
+        with override_settings(MEDIA_ROOT=media):
+            self.client.post(reverse("delete_source", args=[first.pk]))
+            self.assertTrue(stored.exists())
+            self.client.post(reverse("delete_source", args=[second.pk]))
+            self.assertFalse(stored.exists())
+
 
 # ---------- UPLOAD FILE VIEW TESTS ----------
 
-@override_settings(MEDIA_ROOT=Path("test_media"))
+@override_settings(MEDIA_ROOT=TMP_MEDIA)
 class UploadFileViewTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TMP_MEDIA, ignore_errors=True)
+
     def setUp(self):
         self.user = create_test_user()
         self.client.force_login(self.user)
@@ -98,10 +128,10 @@ class UploadFileViewTests(TestCase):
         # Your upload view is named 'upload_file' in redirects
         return reverse("upload_file")
 
-    def _make_file(self, name="test.pdf", content=b"dummy", content_type="application/pdf"):
+    def _make_file(self, name="test.pdf", content=b"%PDF-1.4\n%dummy", content_type="application/pdf"):
         return SimpleUploadedFile(name, content, content_type=content_type)
 
-    @patch("data_capture.views.log_audit_event")
+    @patch("data_capture.pipeline.record_audit_event")
     def test_get_upload_redirects_to_home(self, mock_log):
         url = self._get_upload_url()
         response = self.client.get(url)
@@ -109,7 +139,7 @@ class UploadFileViewTests(TestCase):
         # No log_audit_event on GET
         mock_log.assert_not_called()
 
-    @patch("data_capture.views.log_audit_event")
+    @patch("data_capture.pipeline.record_audit_event")
     def test_upload_without_file_shows_error(self, mock_log):
         url = self._get_upload_url()
         response = self.client.post(url, {}, follow=True)
@@ -119,7 +149,7 @@ class UploadFileViewTests(TestCase):
         # One audit: upload_attempt with filename None
         mock_log.assert_called_once()
 
-    @patch("data_capture.views.log_audit_event")
+    @patch("data_capture.pipeline.record_audit_event")
     def test_upload_invalid_extension_rejected(self, mock_log):
         url = self._get_upload_url()
         bad_file = self._make_file(name="test.exe", content_type="application/octet-stream")
@@ -135,17 +165,105 @@ class UploadFileViewTests(TestCase):
         # upload_attempt only
         mock_log.assert_called_once()
 
-    @patch("data_capture.views.os.remove")
-    @patch("data_capture.views.log_audit_event")
-    @patch("data_capture.views.scan_file_for_malware")
-    @patch("data_capture.views.sanitize_file")
-    @patch("data_capture.views.extract_pdf_data")
+    @patch("data_capture.pipeline.record_audit_event")
+    def test_upload_content_not_matching_type_rejected(self, mock_log):
+        url = self._get_upload_url()
+        png = self._make_file(name="fake.pdf", content=b"\x89PNG\r\n\x1a\n" + b"0" * 32)
+
+        response = self.client.post(url, {"file": png, "source_type": "pdf"}, follow=True)
+
+        self.assertRedirects(response, reverse("home"))
+        self.assertEqual(ExtractionJob.objects.count(), 0)
+        self.assertFalse((TMP_MEDIA / "uploads" / "fake.pdf").exists())
+        # No half-written files left behind
+        self.assertEqual(list((TMP_MEDIA / "uploads").glob(".*.part")), [])
+
+    @patch("data_capture.pipeline.record_audit_event")
+    def test_upload_rejected_early_when_type_given_in_query(self, mock_log):
+        url = self._get_upload_url() + "?source_type=excel"
+        pdf = self._make_file(name="report.xlsx")
+
+        response = self.client.post(url, {"file": pdf, "source_type": "excel"}, follow=True)
+
+        self.assertRedirects(response, reverse("home"))
+        self.assertEqual(ExtractionJob.objects.count(), 0)
+        self.assertEqual(mock_log.call_args_list[-1].args[1], "upload_rejected")
+        self.assertEqual(list((TMP_MEDIA / "uploads").glob(".*.part")), [])
+
+    @patch("data_capture.pipeline.record_audit_event")
+    def test_rejected_request_leaves_no_files_from_earlier_parts(self, mock_log):
+        uploads = TMP_MEDIA / "uploads"
+        before = set(uploads.iterdir()) if uploads.exists() else set()
+        url = self._get_upload_url() + "?source_type=pdf"
+        first = self._make_file(name="first.pdf")
+        second = self._make_file(name="second.pdf", content=b"\x89PNG\r\n\x1a\n" + b"0" * 32)
+
+        self.client.post(url, {"file": [first, second], "source_type": "pdf"})
+
+        self.assertEqual(ExtractionJob.objects.count(), 0)
+        self.assertEqual(set(uploads.iterdir()) - before, set())
+
+    @patch("data_capture.pipeline.record_audit_event")
+    def test_uploads_with_the_same_name_do_not_overwrite_each_other(self, mock_log):
+        other = User.objects.create_user(username="other", email="other@example.com", password="pass1234")
+
+        self.client.post(self._get_upload_url(), {"file": self._make_file("scan.pdf", b"%PDF-1.4 mine"), "source_type": "pdf"})
+        self.client.force_login(other)
+        self.client.post(self._get_upload_url(), {"file": self._make_file("scan.pdf", b"%PDF-1.4 theirs"), "source_type": "pdf"})
+
+        mine, theirs = ExtractionJob.objects.order_by("pk")
+        self.assertNotEqual(mine.file_path, theirs.file_path)
+        self.assertEqual(Path(mine.file_path).read_bytes(), b"%PDF-1.4 mine")
+        self.assertEqual(Path(theirs.file_path).read_bytes(), b"%PDF-1.4 theirs")
+        self.assertTrue(Path(mine.file_path).name.endswith("_scan.pdf"))
+
+    def test_upload_still_requires_csrf_token(self):
+        uploads = TMP_MEDIA / "uploads"
+        before = set(uploads.iterdir()) if uploads.exists() else set()
+        client = self.client_class(enforce_csrf_checks=True)
+        client.force_login(self.user)
+
+        response = client.post(self._get_upload_url(), {"file": self._make_file("clean.pdf"), "source_type": "pdf"})
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(ExtractionJob.objects.count(), 0)
+        # The body was streamed to disk for the check; nothing of it is kept
+        self.assertEqual(set(uploads.iterdir()) - before, set())
+
+    @patch("data_capture.pipeline.record_audit_event")
+    def test_valid_upload_is_queued_not_processed_inline(self, mock_log):
+        url = self._get_upload_url()
+        test_file = self._make_file("clean.pdf")
+
+        response = self.client.post(
+            url,
+            {"file": test_file, "source_type": "pdf"},
+            follow=True,
+        )
+
+        self.assertRedirects(response, reverse("home"))
+        self.assertEqual(DataSource.objects.count(), 0)
+        job = ExtractionJob.objects.get()
+        self.assertEqual(job.status, ExtractionJob.STATUS_PENDING)
+        self.assertEqual(job.user, self.user)
+        self.assertEqual(job.file_name, "clean.pdf")
+        # Hash computed while the body was being received
+        self.assertEqual(job.file_hash, hashlib.sha256(b"%PDF-1.4\n%dummy").hexdigest())
+        self.assertEqual(Path(job.file_path).read_bytes(), b"%PDF-1.4\n%dummy")
+        # Dashboard shows the job as processing
+        self.assertIn(job, list(response.context["pending_jobs"]))
+
+    @patch("data_capture.pipeline.os.remove")
+    @patch("data_capture.pipeline.record_audit_event")
+    @patch("data_capture.pipeline.scan_file_for_malware")
+    @patch("data_capture.pipeline.sanitize_file")
+    @patch("data_capture.pipeline.run_extraction")
     def test_infected_file_is_blocked(
         self,
-        mock_extract_pdf,
+        mock_extract,
         mock_sanitize,
         mock_scan,
-        mock_log,
+        mock_record,
         mock_remove,
     ):
         url = self._get_upload_url()
@@ -155,35 +273,39 @@ class UploadFileViewTests(TestCase):
         mock_scan.return_value = (False, "Malware detected")
         # sanitize_file should NOT be called in this case
         mock_sanitize.return_value = (True, "ignored", "ignored")
-        mock_extract_pdf.return_value = {"type": "pdf", "content": []}
+        mock_extract.return_value = {"type": "pdf", "content": []}
 
         response = self.client.post(
             url,
             {"file": test_file, "source_type": "pdf"},
             follow=True,
         )
-
-        # User should be sent back to home with an error
         self.assertRedirects(response, reverse("home"))
+
+        self.assertEqual(run_pending_jobs(), 1)
+
         self.assertEqual(DataSource.objects.count(), 0)
         self.assertEqual(ExtractedData.objects.count(), 0)
+        job = ExtractionJob.objects.get()
+        self.assertEqual(job.status, ExtractionJob.STATUS_FAILED)
+        self.assertIn("malware", job.detail.lower())
 
         mock_scan.assert_called_once()
         mock_sanitize.assert_not_called()
-        mock_extract_pdf.assert_not_called()
+        mock_extract.assert_not_called()
         mock_remove.assert_called()              # file deleted from disk
-        self.assertGreaterEqual(mock_log.call_count, 1)  # at least one audit event
+        self.assertGreaterEqual(mock_record.call_count, 1)  # at least one audit event
 
-    @patch("data_capture.views.log_audit_event")
-    @patch("data_capture.views.scan_file_for_malware")
-    @patch("data_capture.views.sanitize_file")
-    @patch("data_capture.views.extract_pdf_data")
+    @patch("data_capture.pipeline.record_audit_event")
+    @patch("data_capture.pipeline.scan_file_for_malware")
+    @patch("data_capture.pipeline.sanitize_file")
+    @patch("data_capture.pipeline.run_extraction")
     def test_clean_pdf_upload_creates_datasource_and_extracted_data(
         self,
-        mock_extract_pdf,
+        mock_extract,
         mock_sanitize,
         mock_scan,
-        mock_log,
+        mock_record,
     ):
         url = self._get_upload_url()
         test_file = self._make_file("clean.pdf")
@@ -191,10 +313,10 @@ class UploadFileViewTests(TestCase):
         # Malware scan OK
         mock_scan.return_value = (True, "File is clean")
         # Sanitization OK
-        sanitized_path = str(Path("test_media") / "uploads" / "clean.pdf")
+        sanitized_path = str(TMP_MEDIA / "uploads" / "clean.pdf")
         mock_sanitize.return_value = (True, sanitized_path, "sanitized ok")
         # Extraction returns some structured data
-        mock_extract_pdf.return_value = {
+        mock_extract.return_value = {
             "type": "pdf",
             "pages": 1,
             "content": [{"page": 1, "text": "Hello"}],
@@ -205,22 +327,39 @@ class UploadFileViewTests(TestCase):
             {"file": test_file, "source_type": "pdf"},
             follow=True,
         )
-
         self.assertRedirects(response, reverse("home"))
+
+        self.assertEqual(run_pending_jobs(), 1)
+
         self.assertEqual(DataSource.objects.count(), 1)
         self.assertEqual(ExtractedData.objects.count(), 1)
 
         ds = DataSource.objects.first()
         ex = ExtractedData.objects.first()
+        job = ExtractionJob.objects.get()
         self.assertEqual(ds.user, self.user)
+        self.assertIsNotNone(ds.file_hash)
         self.assertEqual(ex.source, ds)
         self.assertEqual(ex.user, self.user)
+        self.assertEqual(job.status, ExtractionJob.STATUS_DONE)
+        self.assertEqual(job.source, ds)
 
         mock_scan.assert_called_once()
         mock_sanitize.assert_called_once()
-        mock_extract_pdf.assert_called_once()
-        # At least one 'upload_attempt' and one 'upload_success'
-        self.assertGreaterEqual(mock_log.call_count, 2)
+        mock_extract.assert_called_once_with("pdf", sanitized_path)
+        # 'upload_attempt' + 'upload_queued' from the view, 'upload_success' from the worker
+        actions = [c.args[1] for c in mock_record.call_args_list]
+        self.assertEqual(actions, ["upload_attempt", "upload_queued", "upload_success"])
+
+        # Every stage on both sides reported its timings
+        stages = [m["stage"] for m in job.metrics]
+        self.assertEqual(stages, [
+            "receive", "validate", "dedup", "scan", "sanitize", "extract",
+            "sanitize_output", "persist", "audit",
+        ])
+        receive = job.metrics[0]
+        self.assertEqual(receive["bytes"], len(b"%PDF-1.4\n%dummy"))
+        self.assertTrue(all(m["wall"] >= 0 and m["cpu"] >= 0 for m in job.metrics))
 
 
 # ---------- CONTACT VIEW TESTS ----------
@@ -291,8 +430,13 @@ class SourceDetailViewTests(TestCase):
 
 # ---------- API UPLOAD VIEW TESTS ----------
 
-@override_settings(MEDIA_ROOT=Path("test_media_api"))
+@override_settings(MEDIA_ROOT=TMP_API_MEDIA)
 class ApiUploadFileViewTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TMP_API_MEDIA, ignore_errors=True)
+
     def setUp(self):
         self.user = create_test_user()
         self.client.force_login(self.user)
@@ -300,7 +444,7 @@ class ApiUploadFileViewTests(TestCase):
     def _get_api_url(self):
         return reverse("api_upload_file")
 
-    def _make_file(self, name="test.pdf", content=b"dummy", content_type="application/pdf"):
+    def _make_file(self, name="test.pdf", content=b"%PDF-1.4\n%dummy", content_type="application/pdf"):
         return SimpleUploadedFile(name, content, content_type=content_type)
 
     def test_api_get_not_allowed(self):
@@ -323,12 +467,19 @@ class ApiUploadFileViewTests(TestCase):
         )
         self.assertEqual(response.status_code, 400)
 
-    @patch("data_capture.views.extract_pdf_data")
-    def test_api_valid_pdf_returns_success_json(self, mock_extract_pdf):
+    def test_api_anonymous_returns_401(self):
+        self.client.logout()
+        response = self.client.post(self._get_api_url(), {"file": self._make_file("api_test.pdf")})
+        self.assertEqual(response.status_code, 401)
+
+    @patch("data_capture.pipeline.scan_file_for_malware")
+    @patch("data_capture.pipeline.run_extraction")
+    def test_api_valid_pdf_returns_202_with_job(self, mock_extract, mock_scan):
         url = self._get_api_url()
         file_obj = self._make_file("api_test.pdf")
 
-        mock_extract_pdf.return_value = {
+        mock_scan.return_value = (True, "File is clean")
+        mock_extract.return_value = {
             "type": "pdf",
             "pages": 1,
             "content": [{"page": 1, "text": "Hello API"}],
@@ -339,11 +490,27 @@ class ApiUploadFileViewTests(TestCase):
             {"file": file_obj, "source_type": "pdf"},
         )
 
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 202)
         body = json.loads(response.content)
-        self.assertIn("message", body)
-        self.assertEqual(body["message"], "File uploaded and processed successfully")
-        self.assertIn("source_id", body)
-        self.assertIn("data", body)
+        self.assertEqual(body["status"], "pending")
+        self.assertIn("job_id", body)
+        self.assertEqual(body["status_url"], reverse("api_job_status", args=[body["job_id"]]))
+        self.assertEqual(DataSource.objects.count(), 0)
+
+        run_pending_jobs()
+
+        status = json.loads(self.client.get(body["status_url"]).content)
+        self.assertEqual(status["status"], "done")
         self.assertEqual(DataSource.objects.count(), 1)
         self.assertEqual(ExtractedData.objects.count(), 1)
+        self.assertEqual(status["source_id"], DataSource.objects.get().id)
+        # The API path is now scanned too
+        mock_scan.assert_called_once()
+
+    def test_api_job_status_hides_other_users_jobs(self):
+        other = User.objects.create_user(username="other", email="o@example.com", password="pass1234")
+        job = ExtractionJob.objects.create(
+            user=other, source_type="pdf", file_name="x.pdf", file_path="x.pdf",
+        )
+        response = self.client.get(reverse("api_job_status", args=[job.id]))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,357 @@
+import json
+import socket
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from data_capture import webcapture
+from data_capture.jobs import run_next_job
+from data_capture.models import AuditLog, DataSource, ExtractionJob, WebPageCache
+from data_capture.tests.fake_site import FakeSite
+from data_capture.webcapture import CaptureError, capture_pages, clean_urls, fetch, parse_page
+
+User = get_user_model()
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+  <title> Quarterly   report </title>
+  <meta name="description" content="Figures for Q3">
+  <meta property="og:title" content="Q3 report">
+  <meta name="viewport" content="width=device-width">
+  <link rel="canonical" href="/reports/q3">
+  <style>body { color: red }</style>
+  <script>var tracking = "ignored";</script>
+</head>
+<body>
+  <h1>Revenue</h1>
+  <p>Revenue grew by <b>12%</b>.</p>
+  <noscript>Enable JavaScript</noscript>
+  <a href="/about#team">About us</a>
+  <a href="/about">About again</a>
+  <a href="https://example.org/x?a=1&amp;b=2">Partner</a>
+  <a href="mailto:someone@example.com">Mail</a>
+  <a href="javascript:void(0)">Nothing</a>
+</body>
+</html>"""
+
+
+class ParsePageTests(SimpleTestCase):
+    def test_text_links_and_metadata(self):
+        data = parse_page(PAGE.encode(), 'https://example.com/reports/page.html')
+
+        self.assertEqual(data['type'], 'website')
+        self.assertEqual(data['title'], 'Quarterly report')
+        self.assertEqual(data['lang'], 'en')
+        self.assertEqual(data['description'], 'Figures for Q3')
+        self.assertEqual(data['meta'], {'description': 'Figures for Q3', 'og:title': 'Q3 report'})
+        self.assertEqual(data['canonical'], 'https://example.com/reports/q3')
+        self.assertEqual(data['headings'], [{'level': 1, 'text': 'Revenue'}])
+        self.assertEqual(data['text'].splitlines()[0], 'Revenue')
+        self.assertIn('Revenue grew by', data['text'])
+        self.assertNotIn('tracking', data['text'])
+        self.assertNotIn('Enable JavaScript', data['text'])
+
+        # Resolved, without fragments, de-duplicated, http(s) only
+        self.assertEqual(data['links'], [
+            {'url': 'https://example.com/about', 'text': 'About us'},
+            {'url': 'https://example.org/x?a=1&b=2', 'text': 'Partner'},
+        ])
+        self.assertEqual(data['link_count'], 2)
+
+    def test_base_href_and_declared_charset(self):
+        body = ('<html><head><meta charset="iso-8859-1"><base href="https://cdn.example.com/docs/">'
+                '</head><body><p>Caf\xe9</p><a href="guide">Guide</a></body></html>').encode('iso-8859-1')
+
+        data = parse_page(body, 'https://example.com/')
+
+        self.assertEqual(data['text'], 'Caf\xe9\nGuide')
+        self.assertEqual(data['links'][0]['url'], 'https://cdn.example.com/docs/guide')
+
+    @override_settings(WEB_CAPTURE_MAX_LINKS=2)
+    def test_links_are_capped_but_counted(self):
+        body = ''.join(f'<a href="/p{n}">{n}</a>' for n in range(5))
+
+        data = parse_page(body.encode(), 'https://example.com/')
+
+        self.assertEqual(len(data['links']), 2)
+        self.assertEqual(data['link_count'], 5)
+
+
+@override_settings(WEB_CAPTURE_ALLOW_PRIVATE=True, WEB_CAPTURE_TIMEOUT=5)
+class FetchTests(SimpleTestCase):
+    def setUp(self):
+        self.site = FakeSite()
+        self.site.__enter__()
+        self.addCleanup(self.site.__exit__)
+
+    def test_redirects_are_followed(self):
+        self.site.add('/old', location='/new')
+        self.site.add('/new', '<p>moved</p>')
+
+        final_url, headers, body, charset = fetch(self.site.url('/old'))
+
+        self.assertEqual(final_url, self.site.url('/new'))
+        self.assertEqual(body, b'<p>moved</p>')
+        self.assertEqual(charset, 'utf-8')
+
+    @override_settings(WEB_CAPTURE_MAX_REDIRECTS=2)
+    def test_redirect_loops_are_cut_off(self):
+        self.site.add('/loop', location='/loop')
+
+        with self.assertRaisesMessage(CaptureError, 'More than 2 redirects'):
+            fetch(self.site.url('/loop'))
+        self.assertEqual(len(self.site.requests), 3)
+
+    def test_errors_and_non_html_are_refused(self):
+        self.site.add('/data.json', '{}', content_type='application/json')
+
+        with self.assertRaisesMessage(CaptureError, 'HTTP 404'):
+            fetch(self.site.url('/missing'))
+        with self.assertRaisesMessage(CaptureError, 'Not an HTML page'):
+            fetch(self.site.url('/data.json'))
+
+    @override_settings(WEB_CAPTURE_MAX_BYTES=1000)
+    def test_size_cap(self):
+        self.site.add('/declared', 'x' * 2000)
+        self.site.add('/streamed', 'x' * 2000, send_length=False)
+        self.site.add('/small', 'x' * 1000, send_length=False)
+
+        with self.assertRaisesMessage(CaptureError, 'larger than 1000 bytes'):
+            fetch(self.site.url('/declared'))
+        with self.assertRaisesMessage(CaptureError, 'larger than 1000 bytes'):
+            fetch(self.site.url('/streamed'))
+        self.assertEqual(len(fetch(self.site.url('/small'))[2]), 1000)
+
+    @override_settings(WEB_CAPTURE_TIMEOUT=0.5)
+    def test_timeout_covers_the_whole_download(self):
+        # Each read succeeds quickly, but the whole page takes 4 seconds
+        self.site.add('/slow', 'x' * 400, trickle=0.08)
+
+        started = time.monotonic()
+        with self.assertRaisesMessage(CaptureError, 'Timed out'):
+            fetch(self.site.url('/slow'))
+        self.assertLess(time.monotonic() - started, 2)
+
+    @override_settings(WEB_CAPTURE_ALLOW_PRIVATE=False)
+    def test_private_addresses_are_refused(self):
+        self.site.add('/', '<p>intranet</p>')
+
+        with self.assertRaisesMessage(CaptureError, 'non-public address (127.0.0.1)'):
+            fetch(self.site.url('/'))
+        with self.assertRaisesMessage(CaptureError, 'non-public address'):
+            webcapture.check_url('http://[::ffff:10.0.0.1]/')
+        self.assertEqual(self.site.requests, [])
+
+    @override_settings(WEB_CAPTURE_ALLOW_PRIVATE=False)
+    def test_host_is_resolved_once_and_connected_to_as_checked(self):
+        # A rebinding host: public on the first lookup, loopback afterwards
+        answers = iter(['93.184.216.34'] + ['127.0.0.1'] * 5)
+        real_getaddrinfo = socket.getaddrinfo
+
+        def getaddrinfo(host, port, *args, **kwargs):
+            if host == 'rebind.example':
+                return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (next(answers), port))]
+            return real_getaddrinfo(host, port, *args, **kwargs)
+
+        url = f"http://rebind.example:{self.site.port}/"
+        self.site.add('/', '<p>intranet</p>')
+        with patch('socket.getaddrinfo', side_effect=getaddrinfo), \
+                patch('data_capture.webcapture.create_connection', side_effect=OSError('unreachable')) as connect:
+            with self.assertRaisesMessage(CaptureError, 'Fetch failed'):
+                fetch(url)
+            self.assertEqual([c.args[0] for c in connect.call_args_list], [('93.184.216.34', self.site.port)])
+
+            # The next connection looks the host up again and is refused
+            with self.assertRaisesMessage(CaptureError, 'non-public address (127.0.0.1)'):
+                fetch(url)
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(self.site.requests, [])
+
+    def test_clean_urls(self):
+        self.assertEqual(clean_urls([' https://a.example/ ', '', 'https://a.example/', 'http://b.example/x']),
+                         ['https://a.example/', 'http://b.example/x'])
+        with self.assertRaisesMessage(CaptureError, 'Not a valid http(s) URL'):
+            clean_urls(['file:///etc/passwd'])
+        with self.assertRaisesMessage(CaptureError, 'No URLs provided'):
+            clean_urls(['  '])
+
+
+@override_settings(WEB_CAPTURE_ALLOW_PRIVATE=True, WEB_CAPTURE_TIMEOUT=5)
+class CapturePagesTests(TestCase):
+    def setUp(self):
+        self.site = FakeSite()
+        self.site.__enter__()
+        self.addCleanup(self.site.__exit__)
+
+    def _conditional_headers(self):
+        headers = self.site.requests[-1][1]
+        return headers.get('If-None-Match'), headers.get('If-Modified-Since')
+
+    def test_unchanged_page_is_not_downloaded_again(self):
+        self.site.add('/', PAGE, etag='"v1"')
+        url = self.site.url('/')
+
+        first = capture_pages([url])[0]
+        second = capture_pages([url])[0]
+
+        self.assertEqual(first['cache'], 'miss')
+        self.assertEqual(second['cache'], 'not_modified')
+        self.assertEqual(self._conditional_headers(), ('"v1"', None))
+        self.assertEqual(second['data'], first['data'])
+        self.assertEqual(WebPageCache.objects.get().hits, 1)
+
+        # Changed page: a new ETag and a fresh parse
+        self.site.add('/', PAGE.replace('Revenue grew', 'Revenue fell'), etag='"v2"')
+        third = capture_pages([url])[0]
+        self.assertEqual(third['cache'], 'miss')
+        self.assertIn('Revenue fell', third['data']['text'])
+        self.assertEqual(WebPageCache.objects.get().etag, '"v2"')
+
+    def test_last_modified_and_unchanged_bodies(self):
+        self.site.add('/lm', PAGE, last_modified='Wed, 01 Oct 2025 10:00:00 GMT')
+        self.site.add('/plain', PAGE)
+
+        capture_pages([self.site.url('/lm'), self.site.url('/plain')])
+        second = capture_pages([self.site.url('/lm')])[0]
+        self.assertEqual(second['cache'], 'not_modified')
+        self.assertEqual(self._conditional_headers(), (None, 'Wed, 01 Oct 2025 10:00:00 GMT'))
+
+        # No validators: downloaded again, but the same body is not parsed again
+        self.assertEqual(capture_pages([self.site.url('/plain')])[0]['cache'], 'unchanged')
+
+    def test_cache_from_another_extractor_version_is_ignored(self):
+        self.site.add('/', PAGE, etag='"v1"')
+        capture_pages([self.site.url('/')])
+        WebPageCache.objects.update(extractor_version='0')
+
+        self.assertEqual(capture_pages([self.site.url('/')])[0]['cache'], 'miss')
+        self.assertEqual(self._conditional_headers(), (None, None))
+
+    @override_settings(WEB_CAPTURE_WORKERS=8)
+    def test_pages_are_fetched_concurrently(self):
+        urls = []
+        for n in range(8):
+            self.site.add(f'/p{n}', f'<title>Page {n}</title>', delay=0.3)
+            urls.append(self.site.url(f'/p{n}'))
+
+        started = time.monotonic()
+        captures = capture_pages(urls + [self.site.url('/missing')])
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 1.5)  # 2.4 s one after another
+        self.assertEqual([c['data']['title'] for c in captures[:8]], [f'Page {n}' for n in range(8)])
+        self.assertEqual(captures[8]['data'], None)
+        self.assertIn('HTTP 404', captures[8]['error'])
+
+    @override_settings(WEB_CAPTURE_WORKERS=2)
+    def test_connections_are_reused(self):
+        webcapture.close_session()
+        self.addCleanup(webcapture.close_session)
+        for n in range(6):
+            self.site.add(f'/p{n}', f'<p>{n}</p>')
+
+        capture_pages([self.site.url(f'/p{n}') for n in range(6)])
+        capture_pages([self.site.url(f'/p{n}') for n in range(6)])
+
+        self.assertLessEqual(self.site.connections, 2)
+
+
+@override_settings(WEB_CAPTURE_ALLOW_PRIVATE=True, WEB_CAPTURE_TIMEOUT=5)
+class CaptureViewTests(TestCase):
+    def setUp(self):
+        self.site = FakeSite()
+        self.site.__enter__()
+        self.addCleanup(self.site.__exit__)
+        self.site.add('/', PAGE.replace('<p>Revenue', '<p>&lt;script&gt;x&lt;/script&gt; Revenue'))
+        self.user = User.objects.create_user(username="u", email="u@example.com", password="pw")
+        self.client.force_login(self.user)
+
+    def test_form_queues_the_pages_and_the_worker_captures_them(self):
+        url = self.site.url('/')
+
+        response = self.client.post(reverse('capture_website'), {'urls': f"{url}\n{self.site.url('/gone')}"})
+
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertEqual(self.site.requests, [])
+        jobs = list(ExtractionJob.objects.order_by('pk'))
+        self.assertEqual([(job.source_type, job.url, job.status) for job in jobs], [
+            ('website', url, ExtractionJob.STATUS_PENDING),
+            ('website', self.site.url('/gone'), ExtractionJob.STATUS_PENDING),
+        ])
+        self.assertContains(self.client.get(reverse('home')), self.site.url('/gone'))
+
+        # One run of the worker takes both captures
+        self.assertEqual(run_next_job().pk, jobs[0].pk)
+        self.assertFalse(ExtractionJob.objects.exclude(status__in=['done', 'failed']).exists())
+
+        source = DataSource.objects.get()
+        self.assertEqual((source.source_type, source.website_url, source.user), ('website', url, self.user))
+        self.assertEqual(ExtractionJob.objects.get(pk=jobs[0].pk).source, source)
+        failed = ExtractionJob.objects.get(pk=jobs[1].pk)
+        self.assertEqual(failed.status, ExtractionJob.STATUS_FAILED)
+        self.assertIn('HTTP 404', failed.detail)
+        data = source.extracted_items.get().parsed
+        self.assertEqual(data['title'], 'Quarterly report')
+        self.assertNotIn('<script>', data['text'])
+        # Link URLs are stored as they are, not HTML-escaped
+        self.assertEqual(data['links'][1]['url'], 'https://example.org/x?a=1&b=2')
+        self.assertEqual(
+            list(AuditLog.objects.order_by('action').values_list('action', flat=True)),
+            ['website_capture_failed', 'website_captured', 'website_queued', 'website_queued'],
+        )
+        queued = AuditLog.objects.filter(action='website_queued').first()
+        self.assertEqual(queued.get_action_display(), 'Website queued for capture')
+
+        detail = self.client.get(reverse('source_detail', args=[source.pk]))
+        self.assertContains(detail, 'Quarterly report')
+        self.assertContains(detail, 'href="https://example.org/x?a=1&amp;b=2"')
+
+    @override_settings(WEB_CAPTURE_WORKERS=2)
+    def test_worker_claims_at_most_a_pool_of_captures(self):
+        for n in range(3):
+            self.site.add(f'/p{n}', f'<title>Page {n}</title>')
+        self.client.post(reverse('capture_website'), {'urls': ' '.join(self.site.url(f'/p{n}') for n in range(3))})
+
+        run_next_job()
+
+        self.assertEqual(
+            list(ExtractionJob.objects.order_by('pk').values_list('status', flat=True)),
+            [ExtractionJob.STATUS_DONE, ExtractionJob.STATUS_DONE, ExtractionJob.STATUS_PENDING],
+        )
+
+    def test_api_queues_a_list_of_urls(self):
+        response = self.client.post(
+            reverse('api_capture_website'),
+            json.dumps({'urls': [self.site.url('/'), self.site.url('/gone')]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 202)
+        jobs = response.json()['jobs']
+        self.assertEqual([job['url'] for job in jobs], [self.site.url('/'), self.site.url('/gone')])
+        self.assertEqual([job['status'] for job in jobs], ['pending', 'pending'])
+        self.assertFalse(DataSource.objects.exists())
+
+        run_next_job()
+        status = self.client.get(jobs[0]['status_url']).json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['url'], self.site.url('/'))
+        self.assertEqual(status['source_id'], DataSource.objects.get().id)
+        self.assertEqual(self.client.get(jobs[1]['status_url']).json()['status'], 'failed')
+
+    def test_api_rejects_bad_requests(self):
+        url = reverse('api_capture_website')
+
+        self.assertEqual(self.client.get(url).status_code, 405)
+        response = self.client.post(url, json.dumps({'urls': 'https://example.com/'}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'urls': ['ftp://example.com/']})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExtractionJob.objects.exists())
+
+        self.client.logout()
+        self.assertEqual(self.client.post(url, {'urls': [self.site.url('/')]}).status_code, 401)
@@ -0,0 +1,163 @@
+"""
+Upload handler that does all per-byte work while the request body arrives.
+
+Django's default handlers buffer the upload (in memory or in a temp file),
+the view then copies it to MEDIA_ROOT/uploads and the worker reads it again
+to hash it. StreamingUploadHandler writes each chunk once, straight into the
+uploads folder, updating the SHA-256, byte count and magic-byte sniff as it
+goes.
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload, StopFutureHandlers
+
+from .security import detect_file_type, SNIFF_BYTES
+from .storage import new_stored_path, upload_dir
+
+
+class StreamedUploadedFile(UploadedFile):
+    """
+    An upload already written to the uploads folder under a temporary name.
+
+    The view calls commit() once it has validated the upload, which renames
+    the file to a unique stored name, or discard() to delete it.
+    """
+
+    def __init__(self, file, name, content_type, size, charset, content_type_extra,
+                 sha256, detected_type):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = sha256
+        self.detected_type = detected_type
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def commit(self) -> str:
+        """
+        Move the received bytes to a new, unique path in the uploads folder
+        (same filesystem, no copy) and return it. Never replaces another
+        upload, whatever the client called the file.
+        """
+        final_path = new_stored_path(self.name)
+        self.file.close()
+        os.replace(self.file.name, final_path)
+        return str(final_path)
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.file.name)
+        except OSError:
+            pass
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """
+    Write uploads directly to MEDIA_ROOT/uploads, hashing and sniffing on the fly.
+
+    If `expected_type` is given (the client sends ``?source_type=`` or an
+    ``X-Source-Type`` header, because form fields are not available while the
+    body is still streaming) a file whose magic bytes don't match is rejected
+    as soon as its first chunk arrives.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, request=None, expected_type=None):
+        super().__init__(request)
+        self.expected_type = expected_type
+        self.rejection = None
+        # Files of this request already received, discarded if the request is rejected
+        self.received = []
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+
+        directory = upload_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+
+        # Hidden name in the final directory; commit() renames it into place
+        part_path = directory / f".{uuid.uuid4().hex}.part"
+        self.file = open(part_path, 'wb+')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.header = b''
+        self.detected_type = None
+
+        # We take over the file completely: no buffering by the default handlers
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if len(self.header) < SNIFF_BYTES:
+            self.header += raw_data[:SNIFF_BYTES - len(self.header)]
+            if len(self.header) >= SNIFF_BYTES:
+                self._sniff()
+
+        self.file.write(raw_data)
+        self.sha256.update(raw_data)
+        self.size += len(raw_data)
+        # Returning None stops the data from reaching other handlers
+        return None
+
+    def _sniff(self):
+        self.detected_type = detect_file_type(self.header)
+        if self.expected_type and self.detected_type != self.expected_type:
+            self.rejection = (
+                f"File content does not look like a valid {self.expected_type.upper()} file."
+            )
+            self._abort()
+            raise StopUpload(connection_reset=True)
+
+    def _abort(self):
+        """Delete the file being received and every earlier file of the request."""
+        self.file.close()
+        try:
+            os.remove(self.file.name)
+        except OSError:
+            pass
+        for uploaded_file in self.received:
+            uploaded_file.discard()
+        self.received = []
+
+    def file_complete(self, file_size):
+        if len(self.header) < SNIFF_BYTES:
+            # Small file: sniff whatever we got
+            self._sniff()
+
+        self.file.flush()
+        self.file.seek(0)
+        uploaded_file = StreamedUploadedFile(
+            file=self.file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=self.size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            sha256=self.sha256.hexdigest(),
+            detected_type=self.detected_type,
+        )
+        self.received.append(uploaded_file)
+        return uploaded_file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self._abort()
+
+
+def install_streaming_handler(request) -> StreamingUploadHandler:
+    """Replace the request's upload handlers; must run before request.POST/FILES is read."""
+    expected_type = request.GET.get('source_type') or request.META.get('HTTP_X_SOURCE_TYPE')
+    handler = StreamingUploadHandler(request, expected_type=expected_type)
+    request.upload_handlers = [handler]
+    return handler
+
+
+def discard_uploaded_files(request):
+    """Delete every file the request streamed to disk, for a request refused after its body was read."""
+    for _field, uploaded_files in request.FILES.lists():
+        for uploaded_file in uploaded_files:
+            if isinstance(uploaded_file, StreamedUploadedFile):
+                uploaded_file.discard()
@@ -1,12 +1,27 @@
 # data_capture/urls.py
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('home/', views.home, name='home'),
     path('upload/', views.upload_file, name='upload_file'),
     path('api/upload/', views.api_upload_file, name='api_upload_file'),
+    path('api/upload/batch/', views.api_upload_batch, name='api_upload_batch'),
+    path('capture/', views.capture_website, name='capture_website'),
+    path('api/capture/', views.api_capture_website, name='api_capture_website'),
+    path('api/jobs/<int:pk>/', views.api_job_status, name='api_job_status'),
+    path('api/uploads/', views.api_upload_sessions, name='api_upload_sessions'),
+    path('api/uploads/<uuid:session_id>/', views.api_upload_session, name='api_upload_session'),
+    path('api/uploads/<uuid:session_id>/finalize/', views.api_upload_session_finalize, name='api_upload_session_finalize'),
     path('source/<int:pk>/', views.source_detail, name='source_detail'),
+    path('api/sources/<int:pk>/pages/', views.api_source_pages, name='api_source_pages'),
+    path('api/sources/<int:pk>/sheets/rows/', views.api_source_sheet_rows, name='api_source_sheet_rows'),
     path('contact/', views.contact, name='contact'),
     path('source/<int:pk>/delete/', views.delete_source, name='delete_source'),
+
+    # Native async variants, for ASGI deployments
+    path('async/home/', async_views.home, name='async_home'),
+    path('async/upload/', async_views.upload_file, name='async_upload_file'),
+    path('async/api/upload/', async_views.api_upload_file, name='async_api_upload_file'),
+    path('async/source/<int:pk>/', async_views.source_detail, name='async_source_detail'),
 ]
@@ -1,51 +1,161 @@
 import os
+import hashlib
+import itertools
+import zipfile
 import PyPDF2
 import pdfplumber
+from pdfminer.pdfpage import PDFPage
+from pdfplumber.page import Page
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
 import pandas as pd
-import pytesseract
-from PIL import Image
+import pypdfium2  # installed with pdfplumber, which renders pages with it too
+from PIL import Image, ImageSequence
 from django.conf import settings
 
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+from .ocr import collect_tiled, ocr_available, ocr_images, ocr_tiled, submit_tiled
+from .ocrprep import prepare_for_ocr
+from .security import sanitize_extracted_data
+from .sheetstore import write_sheets
 
-# Optional: pytesseract for OCR (requires Tesseract OCR to be installed)
-try:
-    import pytesseract
-    PYTESSERACT_AVAILABLE = True
-except ImportError:
-    PYTESSERACT_AVAILABLE = False
 
+# Bump the version of an extractor whenever its output changes, so results
+# stored for duplicate uploads are not reused across versions.
+EXTRACTOR_VERSIONS = {
+    'pdf': '2',
+    'excel': '2',
+    'image': '4',
+    'website': '1',
+}
 
-def extract_pdf_data(file_path):
-    """Extract text data from PDF file"""
-    text_data = []
-    
+
+DEFAULT_PDF_PARALLEL_MIN_PAGES = 200
+DEFAULT_PDF_SHARD_PAGES = 50
+DEFAULT_PDF_OCR_DPI = 300
+DEFAULT_PDF_OCR_BATCH_PAGES = 2
+DEFAULT_EXCEL_CHUNK_ROWS = 1000
+DEFAULT_IMAGE_OCR_MAX_FRAMES = 50
+
+
+def _release_page(pdf, page):
+    """Drop everything pdfplumber/pdfminer cached while extracting `page`."""
+    if hasattr(page, 'close'):
+        # pdfplumber >= 0.11
+        page.close()
+    else:
+        page.flush_cache()
+        page.get_textmap.cache_clear()
+    # Parsed objects (content streams included) are re-read from the xref
+    # if a later page needs them; fonts stay cached in the resource manager.
+    # These are pdfminer internals (pinned in requirements.txt), so skip
+    # them if a release renames them; memory then grows per page again.
+    for name in ('_cached_objs', '_parsed_objs'):
+        cache = getattr(pdf.doc, name, None)
+        if isinstance(cache, dict):
+            cache.clear()
+
+
+def iter_pdf_pages(file_path, first=1, last=None, scanned=False):
+    """
+    Yield {'page', 'text'} for pages first..last (1-based, inclusive; last=None
+    means to the end) that have text, one page at a time.
+
+    Unlike iterating ``pdf.pages``, which keeps every Page and its layout
+    objects alive until the document is closed, each page is built on demand
+    and its caches are released once its text is out, so memory stays flat
+    however long the document is. Pages before `first` are only looked up
+    in the page tree, never built.
+
+    With scanned=True, pages without a text layer that carry images (scans)
+    are yielded too, as {'page', 'text': '', 'scanned': True} placeholders
+    for ocr_pdf_pages().
+    """
+    with pdfplumber.open(file_path) as pdf:
+        page_objs = itertools.islice(PDFPage.create_pages(pdf.doc), first - 1, last)
+        # doctop only orders text within a page, so a shard can start at 0
+        doctop = 0
+        for page_number, page_obj in enumerate(page_objs, first):
+            page = Page(pdf, page_obj, page_number=page_number, initial_doctop=doctop)
+            doctop += page.height
+
+            text = page.extract_text()
+            # Reuses the layout objects extract_text() just parsed
+            is_scan = scanned and not text.strip() and bool(page.images)
+            _release_page(pdf, page)
+            if is_scan:
+                yield {
+                    'page': page_number,
+                    'text': '',
+                    'scanned': True
+                }
+            elif text:
+                yield {
+                    'page': page_number,
+                    'text': text
+                }
+
+
+def _iter_pdf_pages_pypdf2(file_path, first=1, last=None):
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        end = len(pdf_reader.pages) if last is None else min(last, len(pdf_reader.pages))
+        for page_num in range(first, end + 1):
+            text = pdf_reader.pages[page_num - 1].extract_text()
+            if text:
+                yield {
+                    'page': page_num,
+                    'text': text
+                }
+
+
+def extract_pdf_pages(file_path, first=1, last=None):
+    """
+    Text of pages first..last (see iter_pdf_pages) as [{'page', 'text'}],
+    with placeholders for scanned pages. Falls back to PyPDF2 for just these
+    pages if pdfplumber fails on them (without scanned page detection).
+    """
     try:
         # Try using pdfplumber first (better for tables)
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    text_data.append({
-                        'page': page.page_number,
-                        'text': text
-                    })
+        return list(iter_pdf_pages(file_path, first, last, scanned=True))
     except Exception as e:
         print(f"Error with pdfplumber: {e}")
-        # Fallback to PyPDF2
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page_num, page in enumerate(pdf_reader.pages, 1):
-                    text = page.extract_text()
-                    if text:
-                        text_data.append({
-                            'page': page_num,
-                            'text': text
-                        })
-        except Exception as e2:
-            print(f"Error with PyPDF2: {e2}")
-    
+
+    # Fallback to PyPDF2, for this page range only
+    try:
+        return list(_iter_pdf_pages_pypdf2(file_path, first, last))
+    except Exception as e2:
+        print(f"Error with PyPDF2: {e2}")
+        return []
+
+
+def plan_pdf_shards(file_path):
+    """
+    [(first, last), ...] page ranges to extract in parallel, or None when the
+    document is below PDF_PARALLEL_MIN_PAGES (or cannot even be opened) and
+    should be extracted in one go.
+    """
+    min_pages = getattr(settings, 'PDF_PARALLEL_MIN_PAGES', DEFAULT_PDF_PARALLEL_MIN_PAGES)
+    shard_pages = max(1, getattr(settings, 'PDF_SHARD_PAGES', DEFAULT_PDF_SHARD_PAGES))
+    if not min_pages:
+        return None
+
+    try:
+        with open(file_path, 'rb') as file:
+            page_count = len(PyPDF2.PdfReader(file).pages)
+    except Exception:
+        return None
+    if page_count < min_pages:
+        return None
+
+    return [
+        (first, min(first + shard_pages - 1, page_count))
+        for first in range(1, page_count + 1, shard_pages)
+    ]
+
+
+def merge_pdf_shards(shards):
+    """Combine extract_pdf_pages() results, given in page order, into extract_pdf_data() output."""
+    text_data = [entry for shard in shards for entry in shard]
     return {
         'type': 'pdf',
         'pages': len(text_data),
@@ -53,26 +163,181 @@ def extract_pdf_data(file_path):
     }
 
 
-def extract_excel_data(file_path):
-    """Extract data from Excel file"""
+def plan_pdf_ocr(file_path, data):
+    """
+    [(page_numbers,), ...] batches of the scanned pages in extract_pdf_text()
+    output `data` to OCR in parallel; empty when there are none or OCR is
+    unavailable.
+    """
+    if not ocr_available():
+        return []
+    batch = max(1, getattr(settings, 'PDF_OCR_BATCH_PAGES', DEFAULT_PDF_OCR_BATCH_PAGES))
+    pages = [entry['page'] for entry in data.get('content', []) if entry.get('scanned')]
+    return [(pages[i:i + batch],) for i in range(0, len(pages), batch)]
+
+
+def ocr_pdf_pages(file_path, page_numbers):
+    """Render each of `page_numbers` and OCR them together. Returns [(page, text), ...]."""
+    dpi = getattr(settings, 'PDF_OCR_DPI', DEFAULT_PDF_OCR_DPI)
+    rendered = []
+    pdf = pypdfium2.PdfDocument(file_path)
     try:
-        # Read all sheets
-        excel_file = pd.ExcelFile(file_path)
-        sheets_data = {}
-        
+        for page_number in page_numbers:
+            page = pdf[page_number - 1]
+            try:
+                rendered.append((page_number, page.render(scale=dpi / 72, grayscale=True).to_pil()))
+            except Exception as e:
+                print(f"Error rendering page {page_number} for OCR: {e}")
+            finally:
+                page.close()
+    finally:
+        pdf.close()
+
+    texts = {}
+    if rendered:
+        try:
+            texts = dict(zip([page for page, _ in rendered], ocr_images([image for _, image in rendered])))
+        except Exception as e:
+            print(f"Error running OCR on pages {page_numbers}: {e}")
+    return [(page_number, texts.get(page_number, '')) for page_number in page_numbers]
+
+
+def merge_pdf_ocr(data, results):
+    """
+    Put ocr_pdf_pages() `results` into the scanned page placeholders of
+    `data`. Scanned pages OCR found no text on (or never ran on) are dropped.
+    """
+    texts = {page: text for batch in results for page, text in batch}
+    content = []
+    for entry in data.get('content', []):
+        if entry.get('scanned'):
+            text = texts.get(entry['page'])
+            if not text or not text.strip():
+                continue
+            entry = {'page': entry['page'], 'text': text, 'ocr': True}
+        content.append(entry)
+    data['content'] = content
+    data['pages'] = len(content)
+    return data
+
+
+def extract_pdf_text(file_path):
+    """The text layer of a PDF, with placeholders for scanned pages (see plan_pdf_ocr)."""
+    return merge_pdf_shards([extract_pdf_pages(file_path)])
+
+
+def extract_pdf_data(file_path):
+    """Extract text data from PDF file, running OCR on scanned pages"""
+    data = extract_pdf_text(file_path)
+    results = [ocr_pdf_pages(file_path, *args) for args in plan_pdf_ocr(file_path, data)]
+    return merge_pdf_ocr(data, results)
+
+
+def _trim_row(values) -> list:
+    """`values` as a list without its trailing empty cells."""
+    end = len(values)
+    while end and values[end - 1] is None:
+        end -= 1
+    return list(values[:end])
+
+
+def _excel_columns(header) -> list:
+    """Column names for a header row, filled in and de-duplicated the way pandas does."""
+    columns = []
+    seen = {}
+    for i, name in enumerate(header):
+        if name is None or name == '':
+            name = f'Unnamed: {i}'
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        columns.append(f'{name}.{count}' if count else name)
+    return columns
+
+
+def _sheet_chunks(name, rows, chunk_rows):
+    """(name, columns, rows) chunks for one sheet, from an iterator of row value tuples."""
+    header = ()
+    for values in rows:
+        header = _trim_row(values)
+        if header:
+            break
+    columns = _excel_columns(header)
+
+    chunk = []
+    blank = 0
+    yielded = False
+    for values in rows:
+        values = _trim_row(values)
+        if not values:
+            # Blank rows are kept only if data follows them
+            blank += 1
+            continue
+        if len(values) > len(columns):
+            columns.extend(f'Unnamed: {i}' for i in range(len(columns), len(values)))
+        for row in itertools.chain(itertools.repeat([], blank), [values]):
+            chunk.append(row + [None] * (len(columns) - len(row)))
+            if len(chunk) >= chunk_rows:
+                yield name, columns, chunk
+                chunk = []
+                yielded = True
+        blank = 0
+    if chunk or not yielded:
+        yield name, columns, chunk
+
+
+def _iter_excel_rows_pandas(file_path, chunk_rows):
+    # Formats openpyxl cannot read (.xls); the file is still only opened once
+    with pd.ExcelFile(file_path) as excel_file:
         for sheet_name in excel_file.sheet_names:
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
-            # Convert DataFrame to dictionary
-            sheets_data[sheet_name] = {
-                'columns': df.columns.tolist(),
-                'rows': df.values.tolist(),
-                'row_count': len(df)
-            }
-        
-        return {
-            'type': 'excel',
-            'sheets': sheets_data
-        }
+            df = excel_file.parse(sheet_name)
+            df = df.astype(object).where(df.notna(), None)
+            columns = df.columns.tolist()
+            for start in range(0, max(len(df), 1), chunk_rows):
+                yield sheet_name, columns, df.iloc[start:start + chunk_rows].values.tolist()
+
+
+def iter_excel_rows(file_path, chunk_rows=None):
+    """
+    Yield (sheet_name, columns, rows) for every sheet of a workbook, sheet by
+    sheet, with at most `chunk_rows` (EXCEL_CHUNK_ROWS) rows at a time. Each
+    sheet yields at least once, with empty `rows` if it has no data.
+
+    The first non-blank row is the header; empty cells are None. .xlsx files
+    are opened once in openpyxl's read-only mode and streamed, so memory is
+    bounded by the chunk size however big the workbook is. `columns` is the
+    same list for all of a sheet's chunks and grows if a later row is wider
+    than the header; rows already yielded are not padded again.
+    """
+    chunk_rows = max(1, chunk_rows or getattr(settings, 'EXCEL_CHUNK_ROWS', DEFAULT_EXCEL_CHUNK_ROWS))
+    try:
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    except (InvalidFileException, zipfile.BadZipFile):
+        yield from _iter_excel_rows_pandas(file_path, chunk_rows)
+        return
+
+    try:
+        for sheet in workbook.worksheets:
+            # The dimensions stored in the file may be wrong; read whatever rows are there
+            sheet.reset_dimensions()
+            yield from _sheet_chunks(sheet.title, sheet.iter_rows(values_only=True), chunk_rows)
+    finally:
+        workbook.close()
+
+
+def _sanitized_chunks(chunks):
+    for sheet_name, columns, rows in chunks:
+        # `columns` is the same list for all of a sheet's chunks: sanitize a copy
+        yield sheet_name, sanitize_extracted_data(list(columns)), sanitize_extracted_data(rows)
+
+
+def extract_excel_data(file_path):
+    """
+    Extract data from Excel file. The rows are sanitized and written to the
+    sheet store chunk by chunk as they are read, so only the store_sheets()
+    summary is returned (and sent back from the extraction pool).
+    """
+    try:
+        return write_sheets(_sanitized_chunks(iter_excel_rows(file_path)))
     except Exception as e:
         print(f"Error extracting Excel data: {e}")
         return {
@@ -81,38 +346,105 @@ def extract_excel_data(file_path):
         }
 
 
+def _ocr_frames(image):
+    """
+    Page-like results for the frames of a multi-frame image (TIFF pages, GIF
+    frames), up to IMAGE_OCR_MAX_FRAMES. Every frame is queued on the OCR
+    pool before any result is awaited, so they are read in parallel. A frame
+    identical to an earlier one (common in animations) is not read again but
+    points at it with 'same_as'.
+    """
+    limit = getattr(settings, 'IMAGE_OCR_MAX_FRAMES', DEFAULT_IMAGE_OCR_MAX_FRAMES)
+    queued = []
+    seen = {}
+    for index, frame in enumerate(ImageSequence.Iterator(image)):
+        if index >= limit:
+            break
+        page = index + 1
+        # Seeking reuses the frame object, so work on a copy
+        prepared, preprocessing = prepare_for_ocr(frame.copy())
+        key = (prepared.mode, prepared.size, hashlib.blake2b(prepared.tobytes(), digest_size=16).digest())
+        if key in seen:
+            queued.append((page, seen[key], None, None))
+            continue
+        seen[key] = page
+        queued.append((page, None, preprocessing, submit_tiled(prepared)))
+
+    content = []
+    for page, same_as, preprocessing, submitted in queued:
+        if same_as:
+            content.append({'page': page, 'same_as': same_as})
+            continue
+        entry = {'page': page, 'preprocessing': preprocessing}
+        try:
+            entry['text'], tiles = collect_tiled(*submitted)
+        except Exception as e:
+            print(f"Error running OCR on frame {page}: {e}")
+            entry['text'], tiles = '', []
+        if tiles:
+            entry['tiles'] = tiles
+        content.append(entry)
+    return content
+
+
 def extract_image_data(file_path):
     """Extract text from image using OCR"""
     try:
-        # Note: pytesseract requires Tesseract OCR to be installed
+        # Note: OCR requires Tesseract to be installed
         # For production, you might want to use a cloud OCR service
         image = Image.open(file_path)
+        frames = getattr(image, 'n_frames', 1)
         
-        # Try OCR if pytesseract is available and configured
-        if PYTESSERACT_AVAILABLE:
+        # Try OCR if Tesseract is installed
+        if ocr_available():
+            # Preprocessing may decode a JPEG at reduced size, so note these first
+            image_format, size, mode = image.format, image.size, image.mode
             try:
-                text = pytesseract.image_to_string(image)
-                return {
+                if frames > 1:
+                    # Multi-page TIFFs and animated GIFs: one entry per frame, like PDF pages
+                    content = _ocr_frames(image)
+                    result = {
+                        'type': 'image',
+                        'text': '\n\n'.join(entry['text'] for entry in content if entry.get('text')),
+                        'format': image_format,
+                        'size': size,
+                        'frames': frames,
+                        'content': content,
+                    }
+                    if frames > len(content):
+                        result['truncated'] = True
+                    return result
+
+                prepared, preprocessing = prepare_for_ocr(image)
+                # Very large images are read as tiles in parallel
+                text, tiles = ocr_tiled(prepared)
+                result = {
                     'type': 'image',
                     'text': text,
-                    'format': image.format,
-                    'size': image.size
+                    'format': image_format,
+                    'size': size,
+                    'preprocessing': preprocessing,
                 }
+                if tiles:
+                    result['tiles'] = tiles
+                return result
             except Exception:
                 # If OCR fails, return image metadata
                 return {
                     'type': 'image',
-                    'format': image.format,
-                    'size': image.size,
-                    'mode': image.mode,
+                    'format': image_format,
+                    'size': size,
+                    'mode': mode,
+                    'frames': frames,
                 }
         else:
-            # If pytesseract is not installed, return image metadata
+            # If Tesseract is not installed, return image metadata
             return {
                 'type': 'image',
                 'format': image.format,
                 'size': image.size,
                 'mode': image.mode,
+                'frames': frames,
             }
     except Exception as e:
         print(f"Error extracting image data: {e}")
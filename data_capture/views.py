@@ -1,17 +1,38 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.conf import settings
+from django.db.models import Q
+from django.core.paginator import Paginator
+from django.utils import timezone
 from .forms import ContactForm
 
-from .models import DataSource, ExtractedData
-from .utils import (extract_pdf_data,extract_excel_data,extract_image_data,)
-from .security import scan_file_for_malware, sanitize_file, log_audit_event, sanitize_extracted_data
-import os
+from .models import DataSource, ExtractedData, ExtractionJob, UploadSession
+from .security import log_audit_event
+from .jobs import enqueue_captures, enqueue_extraction
+from .pipeline import Upload, VALID_EXTENSIONS, upload_pipeline
+from .uploadhandlers import discard_uploaded_files, install_streaming_handler
+from . import chunked
+from .batch import process_batch, summarize
+from .pages import page_entries
+from .sheetstore import open_sheets, read_summary, release_sheet_files, sheet_files
+from .storage import release_stored_file, stored_url
+from .webcapture import CaptureError, clean_urls
 import json
-import hashlib
+import logging
+import time
+from datetime import timedelta
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PDF_PAGES_PER_REQUEST = 20
+DEFAULT_PDF_PAGES_PER_REQUEST_MAX = 100
+DEFAULT_SHEET_ROWS_PER_PAGE = 50
+DEFAULT_SHEET_ROWS_PER_REQUEST_MAX = 500
 
 
 @login_required
@@ -25,8 +46,23 @@ def home(request):
     )
     return render(request, 'data_capture/home.html', {
         'sources': user_sources,
+        'pending_jobs': pending_jobs_for(request.user),
     })
 
+
+def pending_jobs_for(user):
+    """Uploads the worker hasn't turned into a DataSource yet, plus recent failures."""
+    recent = timezone.now() - timedelta(days=1)
+    return (
+        ExtractionJob.objects
+        .filter(user=user)
+        .filter(
+            Q(status__in=[ExtractionJob.STATUS_PENDING, ExtractionJob.STATUS_RUNNING])
+            | Q(status=ExtractionJob.STATUS_FAILED, finished_at__gte=recent)
+        )
+        .order_by('-created_at')[:20]
+    )
+
 @login_required
 def delete_source(request, pk):
     source = get_object_or_404(DataSource, pk=pk, user=request.user)
@@ -44,174 +80,73 @@ def delete_source(request, pk):
         message=f"User requested undo for source #{source.id} ({filename})."
     )
 
-# 1) Delete file from disk
-    if source.file_name:
-        file_path = settings.MEDIA_ROOT / 'uploads' / source.file_name
-        try:
-            if file_path.exists():
-                file_path.unlink()
-        except Exception as e:
-            # We log this in the audit message to be safe, but do not block the undo.
-            log_audit_event(
-                request,
-                action='sanitization_failed',  # reuse or create a new action if you want
-                message=f"Failed to delete file on undo for source #{source.id}: {e}"
-            )
+# 1) Delete file from disk (unless a duplicate upload shares it)
+    try:
+        release_stored_file(source)
+    except Exception as e:
+        # We log this in the audit message to be safe, but do not block the undo.
+        log_audit_event(
+            request,
+            action='sanitization_failed',  # reuse or create a new action if you want
+            message=f"Failed to delete file on undo for source #{source.id}: {e}"
+        )
 
 # 2) Delete extracted data rows linked to this source
+    sheets = sheet_files(ExtractedData.objects.filter(source=source))
     ExtractedData.objects.filter(source=source).delete()
 
 # 3) Delete the DataSource itself
     source.delete()
 
+# 4) Delete the sheet store files no other extraction shares
+    release_sheet_files(sheets)
+
     messages.success(request, "Your upload has been removed .")
     return redirect('home')
 
 
 @login_required
+@csrf_exempt
 def upload_file(request):
-    """Handle file upload with security: validation, malware scan, sanitization, audit logs."""
+    """Validate and store an upload, then queue it for scanning + extraction."""
     if request.method != 'POST':
         return redirect('home')
 
-    uploaded_file = request.FILES.get('file')
-    source_type = request.POST.get('source_type', 'pdf')  # default pdf
+    # The streaming handler must be in place before the body is parsed, which
+    # is why CSRF is checked by the inner view rather than the middleware.
+    upload = Upload.from_request(request)
+    response = _upload_file(request, upload)
+    if upload.status is None:
+        # Refused by the CSRF check, which streamed the body to disk to read the token
+        discard_uploaded_files(request)
+    return response
 
-    # --------- Audit: upload attempt ----------
-    log_audit_event(request, 'upload_attempt', f"Attempting to upload file: {uploaded_file.name if uploaded_file else 'None'}")
 
-    if not uploaded_file:
-        messages.error(request, 'Please select a file to upload.')
-        return redirect('home')
+@csrf_protect
+def _upload_file(request, upload):
+    upload_pipeline.run(upload)
 
-    # Determine extension
-    filename = uploaded_file.name
-    if '.' in filename:
-        file_extension = filename.rsplit('.', 1)[-1].lower()
+    if upload.status == Upload.QUEUED:
+        messages.info(request, upload.detail)
     else:
-        file_extension = ''
+        messages.error(request, upload.detail)
+    return redirect('home')
 
-    valid_extensions = {
-        'pdf': ['pdf'],
-        'excel': ['xlsx', 'xls'],
-        'image': ['png', 'jpg', 'jpeg', 'gif', 'bmp'],
-    }
 
-    # Backend validation: ensure type matches extension
-    if source_type not in valid_extensions or file_extension not in valid_extensions[source_type]:
-        messages.error(
-            request,
-            f"File format incorrect. Please upload a valid {source_type.upper()} file."
-        )
+@login_required
+def capture_website(request):
+    """Queue the web pages listed in the `urls` field (one per line) for capture."""
+    if request.method != 'POST':
         return redirect('home')
 
-    # Ensure uploads folder exists
-    media_dir = settings.MEDIA_ROOT / 'uploads'
-    media_dir.mkdir(parents=True, exist_ok=True)
-
-    # Save uploaded file to disk (raw)
-    file_path = media_dir / uploaded_file.name
-    with open(file_path, 'wb+') as dest:
-        for chunk in uploaded_file.chunks():
-            dest.write(chunk)
-
-    file_path_str = str(file_path)
-
-    # --------- Malware scan ----------
-    scan_status, scan_detail = scan_file_for_malware(file_path_str)
-
-    if scan_status is False:
-        # Infected
-        log_audit_event(request, 'upload_blocked_malware', f"{filename}: {scan_detail}")
-        # Optionally delete the file
-        try:
-            os.remove(file_path_str)
-        except OSError:
-            pass
-
-        messages.error(request, "Upload blocked: file appears to contain malware.")
+    try:
+        urls = clean_urls(request.POST.get('urls', '').split())
+    except CaptureError as e:
+        messages.error(request, str(e))
         return redirect('home')
 
-    elif scan_status is None:
-        # Scanner missing or error
-        log_audit_event(request, 'malware_scanner_unavailable', f"{filename}: {scan_detail}")
-        # We still allow upload but we log the risk.
-
-    # --------- Sanitization (pdf + image) ----------
-    sanitized_ok, sanitized_path, sanitize_msg = sanitize_file(file_path_str, source_type)
-    file_path_str = sanitized_path  # in case it ever changes in future
-
-    if not sanitized_ok:
-        log_audit_event(request, 'sanitization_failed', f"{filename}: {sanitize_msg}")
-        messages.warning(
-            request,
-            "File uploaded, but sanitization failed. Proceed with caution."
-        )
-    else:
-        # You may log success if you like (optional)
-        pass
-
-    # --------- Compute hash AFTER sanitization (optional but nice) ----------
-    sha256 = hashlib.sha256()
-    with open(file_path_str, 'rb') as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            sha256.update(chunk)
-    file_hash = sha256.hexdigest()
-
-        # --------- Extract data ----------
-    extracted_data = None
-
-    if source_type == 'pdf':
-        extracted_data = extract_pdf_data(file_path_str)
-    elif source_type == 'excel':
-        extracted_data = extract_excel_data(file_path_str)
-    elif source_type == 'image':
-        extracted_data = extract_image_data(file_path_str)
-
-    # ✅ sanitize AFTER extraction
-    if extracted_data:
-        extracted_data = sanitize_extracted_data(extracted_data)
-
-
-
-  
-
-
-    
-    # --------- Create DataSource record ----------
-    data_source = DataSource.objects.create(
-        user=request.user,
-        source_type=source_type,
-        file_name=uploaded_file.name,
-        file_hash=file_hash,  # if you added this field earlier
-    )
-
-    # --------- Save extracted data + log success ----------
-    if extracted_data:
-        data_json = json.dumps(extracted_data, default=str)
-
-        # If you have ExtractedData & content hashes:
-        try:
-            content_hash = hashlib.sha256(data_json.encode('utf-8')).hexdigest()
-            ExtractedData.objects.create(
-                source=data_source,
-                user=request.user,
-                data=data_json,
-                content_hash=content_hash,
-            )
-        except TypeError:
-            
-            pass
-
-        log_audit_event(
-            request,
-            'upload_success',
-            f"File {filename} uploaded and processed successfully."
-        )
-        messages.success(request, 'File uploaded successfully.')
-    else:
-        messages.error(request, 'Failed to upload file .')
-
+    jobs = enqueue_captures(request, urls)
+    messages.info(request, f"{len(jobs)} page(s) queued for capture.")
     return redirect('home')
 
 @login_required
@@ -249,16 +184,97 @@ def source_detail(request, pk):
     """Show one upload with its extracted data, nicely formatted per type."""
     source = get_object_or_404(DataSource, pk=pk, user=request.user)
 
-    # Get the latest extracted record for this source
-    extracted_obj = source.extracted_items.order_by('-created_at').first()
+    # Get the latest extracted record for this source; for PDFs the page
+    # text is read from ExtractedPage rows, so `data` is only loaded if needed
+    extracted_obj = source.extracted_items.defer('data').order_by('-created_at').first()
 
+    context = source_detail_context(source, extracted_obj, request.GET)
+    return render(request, 'data_capture/source_detail.html', context)
+
+
+def _int_param(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def sheet_pages(source, summary, params):
+    """
+    The sheets of a sheet store `summary`, each with one page of
+    SHEET_ROWS_PER_PAGE rows: the first, or for the sheet named by
+    ?sheet= the one starting at row ?start= (0-based). Row numbers are
+    the cursor, so any page is read straight from its blocks.
+    """
+    per_page = getattr(settings, 'SHEET_ROWS_PER_PAGE', DEFAULT_SHEET_ROWS_PER_PAGE)
+    selected = params.get('sheet')
+    rows_url = reverse('api_source_sheet_rows', args=[source.pk])
+
+    sheets = []
+    for index, (name, info) in enumerate(summary.get('sheets', {}).items()):
+        row_count = info.get('row_count', 0)
+        start = _int_param(params, 'start', 0) if name == selected else 0
+        start = max(0, min(start, row_count - 1 if row_count else 0))
+
+        def page_url(first, name=name, index=index):
+            return '?' + urlencode({'sheet': name, 'start': first}) + f'#sheet-{index}'
+
+        sheets.append({
+            'name': name,
+            'anchor': f'sheet-{index}',
+            'columns': info.get('columns', []),
+            'row_count': row_count,
+            'start': start,
+            'first_row': start + 1,
+            'last_row': min(start + per_page, row_count),
+            'prev_url': page_url(max(start - per_page, 0)) if start > 0 else None,
+            'next_url': page_url(start + per_page) if start + per_page < row_count else None,
+            'rows_url': rows_url + '?' + urlencode({'sheet': name}),
+            'rows': [],
+        })
+
+    try:
+        with open_sheets(summary) as stored:
+            for sheet in sheets:
+                sheet['rows'] = stored.read_rows(sheet['name'], sheet['start'], sheet['start'] + per_page)
+    except (OSError, ValueError, KeyError):
+        logger.exception("Error reading stored sheets for source %s", source.pk)
+        for sheet in sheets:
+            sheet['rows'] = []
+            sheet['error'] = "The stored rows of this sheet could not be read."
+    return sheets
+
+
+def source_detail_context(source, extracted_obj, params=None):
+    """Template context for source_detail (shared with the async view)."""
     pdf_pages = None
     excel_sheets = None
     image_data = None
+    website_data = None
     raw_data = None
     extracted_type = None
 
-    if extracted_obj:
+    pdf_page_count = 0
+    if extracted_obj and source.source_type == 'pdf':
+        per_page = getattr(settings, 'PDF_PAGES_PER_REQUEST', DEFAULT_PDF_PAGES_PER_REQUEST)
+        paginator = Paginator(page_entries(extracted_obj), per_page)
+        pdf_page_count = paginator.count
+
+    sheet_summary = None
+    if extracted_obj and source.source_type == 'excel':
+        sheet_summary = read_summary(extracted_obj)
+
+    if pdf_page_count:
+        # Only the first batch is rendered; the rest comes from api_source_pages
+        extracted_type = 'pdf'
+        pdf_pages = list(paginator.page(1).object_list)
+
+    elif sheet_summary is not None:
+        # One page of rows per sheet; other pages by link or api_source_sheet_rows
+        extracted_type = 'excel'
+        excel_sheets = sheet_pages(source, sheet_summary, params or {})
+
+    elif extracted_obj:
         raw_data = extracted_obj.data
         try:
             parsed = json.loads(extracted_obj.data)
@@ -288,23 +304,115 @@ def source_detail(request, pk):
                 # Just pass the whole dict to display details
                 image_data = parsed
 
+            elif extracted_type == 'website':
+                # Expecting: {'type': 'website', 'url', 'title', 'text', 'links': [{url, text}], ...}
+                website_data = parsed
+
     image_url = None
-    if source.source_type == "image" and source.file_name:
-        image_url = settings.MEDIA_URL + "uploads/" + source.file_name
+    # Browsers do not display TIFF
+    if source.source_type == "image" and source.stored_name and not source.stored_name.lower().endswith(('.tif', '.tiff')):
+        image_url = stored_url(source.stored_name)
 
-    context = {
+    return {
         'source': source,
         'extracted_obj': extracted_obj,
         'extracted_type': extracted_type,
         'pdf_pages': pdf_pages,
         'excel_sheets': excel_sheets,
         'image_data': image_data,
+        'website_data': website_data,
         'raw_data': raw_data,
         'image_url': image_url,
+        'pdf_page_count': pdf_page_count,
+        'pdf_pages_url': reverse('api_source_pages', args=[source.pk]) if pdf_page_count else None,
     }
 
-    return render(request, 'data_capture/source_detail.html', context)
 
+def api_source_pages(request, pk):
+    """
+    Text of a PDF source's pages, PDF_PAGES_PER_REQUEST at a time
+    (?page=N, optionally ?per_page=M up to PDF_PAGES_PER_REQUEST_MAX).
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    source = DataSource.objects.filter(pk=pk, user=request.user).first()
+    extracted_obj = (
+        source.extracted_items.defer('data').order_by('-created_at').first()
+        if source is not None else None
+    )
+    if extracted_obj is None or source.source_type != 'pdf':
+        return JsonResponse({'error': 'Source not found'}, status=404)
+
+    per_page = getattr(settings, 'PDF_PAGES_PER_REQUEST', DEFAULT_PDF_PAGES_PER_REQUEST)
+    max_per_page = getattr(settings, 'PDF_PAGES_PER_REQUEST_MAX', DEFAULT_PDF_PAGES_PER_REQUEST_MAX)
+    try:
+        per_page = max(1, min(int(request.GET.get('per_page', per_page)), max_per_page))
+    except ValueError:
+        pass
+
+    paginator = Paginator(page_entries(extracted_obj), per_page)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    return JsonResponse({
+        'source_id': source.pk,
+        'page': page_obj.number,
+        'num_pages': paginator.num_pages,
+        'count': paginator.count,
+        'has_next': page_obj.has_next(),
+        'pages': list(page_obj.object_list),
+    })
+
+
+def api_source_sheet_rows(request, pk):
+    """
+    A range of rows of one sheet of an Excel source: ?sheet=<name> (default:
+    the first sheet), ?start=<row> (0-based) and ?limit=<rows> (default
+    SHEET_ROWS_PER_PAGE, at most SHEET_ROWS_PER_REQUEST_MAX). `next_start`
+    is the cursor for the following range, null after the last row.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    source = DataSource.objects.filter(pk=pk, user=request.user).first()
+    extracted_obj = (
+        source.extracted_items.defer('data').order_by('-created_at').first()
+        if source is not None and source.source_type == 'excel' else None
+    )
+    summary = read_summary(extracted_obj) if extracted_obj is not None else None
+    if summary is None:
+        return JsonResponse({'error': 'Source not found'}, status=404)
+
+    sheet_name = request.GET.get('sheet') or next(iter(summary['sheets']), None)
+    if sheet_name not in summary['sheets']:
+        return JsonResponse({'error': 'Sheet not found'}, status=404)
+
+    limit = _int_param(request.GET, 'limit', getattr(settings, 'SHEET_ROWS_PER_PAGE', DEFAULT_SHEET_ROWS_PER_PAGE))
+    limit = max(1, min(limit, getattr(settings, 'SHEET_ROWS_PER_REQUEST_MAX', DEFAULT_SHEET_ROWS_PER_REQUEST_MAX)))
+    start = max(0, _int_param(request.GET, 'start', 0))
+    row_count = summary['sheets'][sheet_name]['row_count']
+
+    try:
+        with open_sheets(summary) as stored:
+            rows = stored.read_rows(sheet_name, start, start + limit)
+    except (OSError, ValueError) as e:
+        return JsonResponse({'error': f"Stored rows could not be read: {e}"}, status=500)
+
+    return JsonResponse({
+        'source_id': source.pk,
+        'sheet': sheet_name,
+        'columns': summary['sheets'][sheet_name]['columns'],
+        'row_count': row_count,
+        'start': start,
+        'next_start': start + limit if start + limit < row_count else None,
+        'rows': rows,
+    }, json_dumps_params={'default': str})
 
 
 @csrf_exempt
@@ -312,73 +420,285 @@ def api_upload_file(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
 
-    uploaded_file = request.FILES.get('file')
-    source_type = request.POST.get('source_type', 'pdf')
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
 
-    if not uploaded_file:
-        return JsonResponse({'error': 'No file provided'}, status=400)
+    upload = upload_pipeline.run(Upload.from_request(request))
 
-    filename = uploaded_file.name
-    file_extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if upload.status != Upload.QUEUED:
+        return JsonResponse({'error': upload.detail}, status=400)
+
+    return JsonResponse({
+        'message': 'File accepted for processing',
+        'job_id': upload.job.id,
+        'status': upload.job.status,
+        'status_url': reverse('api_job_status', args=[upload.job.id]),
+    }, status=202)
+
+
+@csrf_exempt
+def api_upload_batch(request):
+    """
+    Upload and process many files in one request.
+
+    Multipart field `files` (repeated); `source_type` applies to every file,
+    or is detected from each file's content when omitted.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    started = time.perf_counter()
+    handler = install_streaming_handler(request)
+    uploaded_files = request.FILES.getlist('files')
+    forced_type = request.POST.get('source_type')
+
+    if handler.rejection:
+        # Files received before the rejected one are already on disk
+        for uploaded_file in uploaded_files:
+            uploaded_file.discard()
+        return JsonResponse({'error': handler.rejection}, status=400)
+
+    if not uploaded_files:
+        return JsonResponse({'error': 'No files provided'}, status=400)
+
+    max_files = getattr(settings, 'BATCH_UPLOAD_MAX_FILES', 500)
+    if len(uploaded_files) > max_files:
+        for uploaded_file in uploaded_files:
+            uploaded_file.discard()
+        return JsonResponse({'error': f'Too many files (max {max_files})'}, status=400)
+
+    rejected = []
+    accepted = []
+    for uploaded_file in uploaded_files:
+        filename = uploaded_file.name
+        source_type = forced_type or uploaded_file.detected_type
+        file_extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+        if (source_type not in VALID_EXTENSIONS
+                or file_extension not in VALID_EXTENSIONS[source_type]
+                or uploaded_file.detected_type != source_type):
+            uploaded_file.discard()
+            rejected.append({
+                'file_name': filename,
+                'source_type': source_type,
+                'source_id': None,
+                'status': 'rejected',
+                'detail': 'File format incorrect or content does not match its type.',
+                'timings': {},
+            })
+            continue
+
+        file_path = uploaded_file.commit()
+        accepted.append((filename, file_path, source_type, uploaded_file.sha256))
+
+    results = process_batch(request, accepted) if accepted else []
+    results += rejected
+
+    return JsonResponse({
+        'results': results,
+        'summary': summarize(results, started),
+    })
+
+
+@csrf_exempt
+def api_capture_website(request):
+    """
+    Queue web pages for capture as website sources, one job per URL.
+
+    JSON body {"urls": [...]}, or form field `urls` (repeated).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    if request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        values = payload.get('urls') if isinstance(payload, dict) else None
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            return JsonResponse({'error': '"urls" must be a list of strings'}, status=400)
+    else:
+        values = request.POST.getlist('urls')
+
+    try:
+        urls = clean_urls(values)
+    except CaptureError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    jobs = enqueue_captures(request, urls)
+    return JsonResponse({
+        'message': 'Pages accepted for capture',
+        'jobs': [
+            {
+                'url': job.url,
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': reverse('api_job_status', args=[job.id]),
+            }
+            for job in jobs
+        ],
+    }, status=202)
+
+
+def api_job_status(request, pk):
+    """Poll the state of a background extraction job."""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        job = ExtractionJob.objects.get(pk=pk, user=request.user)
+    except ExtractionJob.DoesNotExist:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+
+    return JsonResponse({
+        'job_id': job.id,
+        'status': job.status,
+        'detail': job.detail,
+        'file_name': job.file_name,
+        'source_type': job.source_type,
+        'url': job.url or None,
+        'source_id': job.source_id,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'metrics': job.metrics,
+    })
 
-    valid_extensions = {
-        'pdf': ['pdf'],
-        'excel': ['xlsx', 'xls'],
-        'image': ['png', 'jpg', 'jpeg', 'gif', 'bmp'],
+
+# ---------- Resumable uploads (see chunked.py for the protocol) ----------
+
+
+def _session_json(session):
+    return {
+        'session_id': str(session.id),
+        'file_name': session.file_name,
+        'source_type': session.source_type,
+        'offset': session.offset,
+        'total_size': session.total_size,
+        'status': session.status,
+        'upload_url': reverse('api_upload_session', args=[session.id]),
+        'finalize_url': reverse('api_upload_session_finalize', args=[session.id]),
     }
 
-    if source_type not in valid_extensions or file_extension not in valid_extensions[source_type]:
+
+def _chunk_error_response(error):
+    body = {'error': str(error)}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    return JsonResponse(body, status=error.status)
+
+
+@csrf_exempt
+def api_upload_sessions(request):
+    """Start a resumable upload."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        payload = json.loads(request.body or b'{}')
+        filename = str(payload.get('file_name') or '')
+        source_type = str(payload.get('source_type') or 'pdf')
+        total_size = int(payload.get('total_size'))
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Expected JSON with file_name, source_type and total_size'}, status=400)
+
+    file_extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if source_type not in VALID_EXTENSIONS or file_extension not in VALID_EXTENSIONS[source_type]:
         return JsonResponse(
             {'error': f"File format incorrect. Please upload a valid {source_type.upper()} file."},
             status=400
         )
 
-    media_dir = settings.MEDIA_ROOT / 'uploads'
-    media_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        session = chunked.create_session(request.user, filename, source_type, total_size)
+    except chunked.ChunkError as e:
+        return _chunk_error_response(e)
 
-    file_path = media_dir / filename
-    with open(file_path, 'wb+') as dest:
-        for chunk in uploaded_file.chunks():
-            dest.write(chunk)
+    log_audit_event(request, 'upload_session_started', f"{session.file_name} ({total_size} bytes), session {session.id}.")
+    return JsonResponse(_session_json(session), status=201)
 
 
-    sanitized_ok, sanitized_path, sanitize_msg = sanitize_file(str(file_path), source_type)
-    if sanitized_ok:
-        log_audit_event(request, 'sanitization_success', f"{filename}: {sanitize_msg}")
-    else:
-        log_audit_event(request, 'sanitization_failed', f"{filename}: {sanitize_msg}")
-
-    file_path = sanitized_path
-    # --------- Extract data ----------
-    extracted_data = None
-    if source_type == 'pdf':
-        extracted_data = extract_pdf_data(str(file_path))
-    elif source_type == 'excel':
-        extracted_data = extract_excel_data(str(file_path))
-    elif source_type == 'image':
-        extracted_data = extract_image_data(str(file_path))
-
-    # ✅ sanitize AFTER extraction
-    if extracted_data:
-        extracted_data = sanitize_extracted_data(extracted_data)
-
-        data_source = DataSource.objects.create(
-            user=request.user,
-            source_type=source_type,
-            file_name=filename,
-        )
+@csrf_exempt
+def api_upload_session(request, session_id):
+    """GET: current offset, PUT: append a chunk, DELETE: abort."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
 
-        ExtractedData.objects.create(
-            source=data_source,
-            user=request.user,
-            data=json.dumps(extracted_data, default=str),
-        )
+    try:
+        session = UploadSession.objects.get(pk=session_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        return JsonResponse({'error': 'Upload session not found'}, status=404)
 
-        return JsonResponse({
-            'message': 'File uploaded and processed successfully',
-            'source_id': data_source.id,
-            'data': extracted_data,
-        })
+    if request.method == 'GET':
+        return JsonResponse(_session_json(session))
+
+    if request.method == 'DELETE':
+        chunked.abort_session(session)
+        return JsonResponse(_session_json(session))
+
+    if request.method != 'PUT':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    # The body is streamed from the request, never loaded into memory whole
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        content_range = request.META.get('HTTP_CONTENT_RANGE')
+        if content_range:
+            start, range_length = chunked.parse_content_range(content_range, session.total_size)
+            if range_length != length:
+                raise chunked.ChunkError("Content-Range does not match Content-Length.")
+        else:
+            start = int(request.GET.get('offset', session.offset))
+        chunked.append_chunk(session, request, start, length)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid offset or Content-Length'}, status=400)
+    except chunked.ChunkError as e:
+        return _chunk_error_response(e)
+
+    return JsonResponse(_session_json(session))
+
+
+@csrf_exempt
+def api_upload_session_finalize(request, session_id):
+    """Turn a fully received session into an extraction job."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        session = UploadSession.objects.get(pk=session_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        return JsonResponse({'error': 'Upload session not found'}, status=404)
+
+    def enqueue(file_path, file_hash):
+        return enqueue_extraction(request, file_path, session.file_name, session.source_type, file_hash=file_hash)
+
+    try:
+        job = chunked.complete_session(session, enqueue)
+    except chunked.ChunkError as e:
+        if e.status == 400:
+            log_audit_event(request, 'upload_rejected', f"{session.file_name}: {e}")
+        return _chunk_error_response(e)
 
-    return JsonResponse({'error': 'Failed to extract data'}, status=500)
+    log_audit_event(request, 'upload_queued', f"{session.file_name} queued for processing (job #{job.id}).")
 
+    return JsonResponse({
+        'message': 'File accepted for processing',
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': reverse('api_job_status', args=[job.id]),
+    }, status=202)
@@ -0,0 +1,519 @@
+"""
+Website capture: fetch web pages and extract their text, links and metadata.
+
+Pages are fetched through one requests.Session per process, whose
+connection pool keeps WEB_CAPTURE_WORKERS connections per host alive, so
+several pages of one site reuse connections instead of handshaking for each.
+Every fetch is bounded:
+
+* WEB_CAPTURE_CONNECT_TIMEOUT to connect, and WEB_CAPTURE_TIMEOUT for the
+  whole download (checked between reads, so a server trickling bytes cannot
+  hold a worker);
+* WEB_CAPTURE_MAX_BYTES of body, checked against Content-Length and again
+  while streaming (after decompression);
+* HTML content types only, and WEB_CAPTURE_MAX_REDIRECTS redirects, which
+  are followed here so that every hop is checked;
+* hosts resolving to private, loopback or link-local addresses are refused
+  unless WEB_CAPTURE_ALLOW_PRIVATE is set. The check is made when a
+  connection is opened, on the addresses it then connects to, so a host
+  cannot pass with one DNS answer and be reached with another; environment
+  proxies are ignored for the same reason.
+
+Pages are parsed with lxml when it is installed (several times faster than
+Python's html.parser, which is the fallback).
+
+The last capture of each URL is kept in WebPageCache with its ETag and
+Last-Modified. Capturing the URL again sends a conditional GET; a 304 reuses
+the stored result without downloading or parsing the page, and a 200 with
+the same body as before skips parsing.
+
+capture_pages() fetches and parses on a thread pool; the cache is read
+before and written after, on the calling thread. Views do not capture: they
+queue one ExtractionJob per URL, and the worker captures the pending pages
+together (see jobs.py).
+"""
+import copy
+import hashlib
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+import requests
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import create_connection
+
+from .models import DataSource, ExtractedData, WebPageCache
+from .security import sanitize_extracted_data, sanitize_text
+from .utils import EXTRACTOR_VERSIONS
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+DEFAULT_WEB_CAPTURE_WORKERS = 8
+DEFAULT_WEB_CAPTURE_CONNECT_TIMEOUT = 5
+DEFAULT_WEB_CAPTURE_TIMEOUT = 20
+DEFAULT_WEB_CAPTURE_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_WEB_CAPTURE_MAX_REDIRECTS = 5
+DEFAULT_WEB_CAPTURE_MAX_URLS = 50
+DEFAULT_WEB_CAPTURE_MAX_LINKS = 1000
+DEFAULT_WEB_CAPTURE_USER_AGENT = 'DataCapture/1.0'
+
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+READ_SIZE = 64 * 1024
+
+# Elements whose content is not page text
+NON_TEXT_TAGS = ['script', 'style', 'noscript', 'template', 'svg', 'iframe', 'object']
+# <meta name=...>/<meta property=...> kept in 'meta'
+META_NAMES = ('description', 'keywords', 'author', 'robots', 'generator')
+META_PREFIXES = ('og:', 'twitter:', 'article:')
+MAX_HEADINGS = 200
+
+_url_validator = URLValidator(schemes=['http', 'https'])
+
+
+class CaptureError(Exception):
+    """The page could not be captured; the message says why."""
+
+
+# --------- Session ----------
+
+def public_addresses(host: str, port: int) -> list:
+    """The addresses `host` resolves to; CaptureError if any of them is not public."""
+    try:
+        addresses = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except (ValueError, OSError) as e:
+        raise CaptureError(f"Cannot resolve {host}: {e}")
+    checked = []
+    for address in addresses:
+        _check_address(host, address[4][0])
+        checked.append(address[4][0])
+    return list(dict.fromkeys(checked))
+
+
+def _check_address(host: str, address: str):
+    ip = ipaddress.ip_address(address.split('%')[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    if not ip.is_global:
+        raise CaptureError(f"{host} resolves to a non-public address ({ip}).")
+
+
+class _PublicAddressMixin:
+    """Connects only to the public addresses found by one lookup of the host."""
+
+    def _new_conn(self):
+        if getattr(settings, 'WEB_CAPTURE_ALLOW_PRIVATE', False):
+            return super()._new_conn()
+        error = None
+        for address in public_addresses(self._dns_host, self.port):
+            try:
+                # An address literal: create_connection() does no DNS lookup
+                return create_connection(
+                    (address, self.port),
+                    self.timeout,
+                    source_address=self.source_address,
+                    socket_options=self.socket_options,
+                )
+            except socket.timeout as e:
+                raise ConnectTimeoutError(
+                    self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})",
+                ) from e
+            except OSError as e:
+                error = e
+        raise NewConnectionError(self, f"Failed to establish a new connection: {error}")
+
+
+class _PublicHTTPConnection(_PublicAddressMixin, HTTPConnection):
+    pass
+
+
+class _PublicHTTPSConnection(_PublicAddressMixin, HTTPSConnection):
+    # The socket goes to the checked address; TLS still verifies and sends
+    # SNI for the host name
+    pass
+
+
+class _PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+
+class _PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+
+class PublicAddressAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections refuse non-public addresses (see check_url())."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _PublicHTTPConnectionPool,
+            'https': _PublicHTTPSConnectionPool,
+        }
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """This process's session (a forked child gets its own connections)."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            workers = getattr(settings, 'WEB_CAPTURE_WORKERS', DEFAULT_WEB_CAPTURE_WORKERS)
+            session = requests.Session()
+            adapter = PublicAddressAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            # A proxy would be the address connected to, not the checked host
+            session.trust_env = False
+            session.headers.update({
+                'User-Agent': getattr(settings, 'WEB_CAPTURE_USER_AGENT', DEFAULT_WEB_CAPTURE_USER_AGENT),
+                'Accept': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.1',
+            })
+            # Every user's captures share the session: no cookies are kept
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
+# --------- Fetching ----------
+
+def clean_urls(values) -> list:
+    """The http(s) URLs in `values`, stripped and de-duplicated; CaptureError if any is invalid."""
+    urls = list(dict.fromkeys(value.strip() for value in values if value and value.strip()))
+    if not urls:
+        raise CaptureError("No URLs provided.")
+    max_urls = getattr(settings, 'WEB_CAPTURE_MAX_URLS', DEFAULT_WEB_CAPTURE_MAX_URLS)
+    if len(urls) > max_urls:
+        raise CaptureError(f"Too many URLs (max {max_urls}).")
+    for url in urls:
+        try:
+            _url_validator(url)
+        except ValidationError:
+            raise CaptureError(f"Not a valid http(s) URL: {url}")
+    return urls
+
+
+def check_url(url: str):
+    """
+    Raise CaptureError unless `url` is http(s), and not on a non-public
+    address literal. Host names are checked when the session connects to
+    them, on the addresses it connects to.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise CaptureError(f"Only http and https URLs can be captured: {url}")
+    if getattr(settings, 'WEB_CAPTURE_ALLOW_PRIVATE', False):
+        return
+    try:
+        ipaddress.ip_address(parts.hostname.split('%')[0])
+    except ValueError:
+        return
+    _check_address(parts.hostname, parts.hostname)
+
+
+def _charset(content_type: str):
+    """The charset parameter of a Content-Type header, if there is one."""
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset':
+            return value.strip().strip('"\'') or None
+    return None
+
+
+def _read_body(response, deadline: float, max_bytes: int) -> bytes:
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise CaptureError(f"Page is larger than {max_bytes} bytes.")
+
+    # read1() returns after one read from the socket, so the deadline is
+    # checked however slowly the bytes arrive
+    raw = response.raw
+    chunks = []
+    size = 0
+    while True:
+        if time.monotonic() > deadline:
+            raise CaptureError("Timed out downloading the page.")
+        chunk = raw.read1(READ_SIZE, decode_content=True)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise CaptureError(f"Page is larger than {max_bytes} bytes.")
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def fetch(url: str, cached=None):
+    """
+    GET `url`, following redirects. Returns (final URL, headers, body,
+    charset from the headers or None), or None if `cached` (a WebPageCache)
+    is still current.
+    """
+    session = get_session()
+    timeout = getattr(settings, 'WEB_CAPTURE_TIMEOUT', DEFAULT_WEB_CAPTURE_TIMEOUT)
+    connect_timeout = getattr(settings, 'WEB_CAPTURE_CONNECT_TIMEOUT', DEFAULT_WEB_CAPTURE_CONNECT_TIMEOUT)
+    max_bytes = getattr(settings, 'WEB_CAPTURE_MAX_BYTES', DEFAULT_WEB_CAPTURE_MAX_BYTES)
+    max_redirects = getattr(settings, 'WEB_CAPTURE_MAX_REDIRECTS', DEFAULT_WEB_CAPTURE_MAX_REDIRECTS)
+
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+
+    deadline = time.monotonic() + timeout
+    for _ in range(max_redirects + 1):
+        check_url(url)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise CaptureError("Timed out downloading the page.")
+        try:
+            response = session.get(
+                url,
+                headers=headers,
+                stream=True,
+                allow_redirects=False,
+                timeout=(min(connect_timeout, remaining), remaining),
+            )
+        except requests.Timeout:
+            raise CaptureError("Timed out downloading the page.")
+        except requests.RequestException as e:
+            raise CaptureError(f"Fetch failed: {e}")
+
+        with response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers['Location'])
+                continue
+            if response.status_code == 304 and cached is not None:
+                return None
+            if response.status_code != 200:
+                raise CaptureError(f"The server answered HTTP {response.status_code}.")
+
+            content_type = response.headers.get('Content-Type', '')
+            if content_type.split(';')[0].strip().lower() not in HTML_CONTENT_TYPES:
+                raise CaptureError(f"Not an HTML page ({content_type or 'no content type'}).")
+            try:
+                body = _read_body(response, deadline, max_bytes)
+            except requests.RequestException as e:
+                raise CaptureError(f"Fetch failed: {e}")
+            except OSError as e:
+                # Socket timeouts while streaming come through urllib3 unwrapped
+                raise CaptureError(f"Fetch failed: {e}")
+            return url, response.headers, body, _charset(content_type)
+
+    raise CaptureError(f"More than {max_redirects} redirects.")
+
+
+# --------- Parsing ----------
+
+def _absolute(base: str, href: str):
+    """`href` resolved against `base` without its fragment, if it is an http(s) URL."""
+    try:
+        url = urldefrag(urljoin(base, href.strip()))[0]
+    except ValueError:
+        return None
+    return url if urlsplit(url).scheme in ('http', 'https') else None
+
+
+def _squeeze(text: str) -> str:
+    return ' '.join(text.split())
+
+
+def parse_page(body: bytes, url: str, encoding=None) -> dict:
+    """Text, links and metadata of the HTML page `body`, fetched from `url`."""
+    soup = BeautifulSoup(body, HTML_PARSER, from_encoding=encoding)
+    for tag in soup(NON_TEXT_TAGS):
+        tag.decompose()
+
+    base = soup.find('base', href=True)
+    base_url = _absolute(url, base['href']) or url if base else url
+
+    html_tag = soup.find('html')
+    meta = {}
+    for tag in soup.find_all('meta', content=True):
+        name = (tag.get('name') or tag.get('property') or '').strip().lower()
+        if name in META_NAMES or name.startswith(META_PREFIXES):
+            meta.setdefault(name, _squeeze(tag['content']))
+    canonical = soup.find('link', rel='canonical', href=True)
+
+    headings = []
+    for tag in soup.find_all(['h1', 'h2', 'h3'], limit=MAX_HEADINGS):
+        text = _squeeze(tag.get_text(' '))
+        if text:
+            headings.append({'level': int(tag.name[1]), 'text': text})
+
+    max_links = getattr(settings, 'WEB_CAPTURE_MAX_LINKS', DEFAULT_WEB_CAPTURE_MAX_LINKS)
+    links = []
+    seen = set()
+    for tag in soup.find_all('a', href=True):
+        href = _absolute(base_url, tag['href'])
+        if href is None or href in seen:
+            continue
+        seen.add(href)
+        if len(links) < max_links:
+            links.append({'url': href, 'text': _squeeze(tag.get_text(' '))})
+
+    content = soup.body or soup
+    lines = (_squeeze(line) for line in content.get_text('\n').splitlines())
+
+    return {
+        'type': 'website',
+        'url': url,
+        'title': _squeeze(soup.title.get_text(' ')) if soup.title else '',
+        'lang': (html_tag.get('lang') or '').strip() if html_tag else '',
+        'description': meta.get('description') or meta.get('og:description', ''),
+        'canonical': _absolute(base_url, canonical['href']) if canonical else None,
+        'meta': meta,
+        'headings': headings,
+        'links': links,
+        'link_count': len(seen),
+        'text': '\n'.join(line for line in lines if line),
+    }
+
+
+# --------- Capturing ----------
+
+def url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def _capture(url: str, cached) -> dict:
+    """Fetch and parse `url`, reusing `cached` where possible; no database access."""
+    started = time.perf_counter()
+    fetched = fetch(url, cached)
+    if fetched is None:
+        return {
+            'url': url, 'data': json.loads(cached.data), 'error': None, 'cache': 'not_modified',
+            'seconds': round(time.perf_counter() - started, 4),
+        }
+
+    final_url, headers, body, encoding = fetched
+    body_hash = hashlib.sha256(body).hexdigest()
+    if cached is not None and cached.body_hash == body_hash:
+        data, cache = json.loads(cached.data), 'unchanged'
+    else:
+        data, cache = parse_page(body, final_url, encoding), 'miss'
+    return {
+        'url': url, 'data': data, 'error': None, 'cache': cache,
+        'seconds': round(time.perf_counter() - started, 4),
+        'etag': headers.get('ETag', '')[:255],
+        'last_modified': headers.get('Last-Modified', '')[:64],
+        'body_hash': body_hash,
+    }
+
+
+def _update_cache(captures, cached):
+    version = EXTRACTOR_VERSIONS['website']
+    for capture in captures:
+        key = url_hash(capture['url'])
+        if capture['cache'] == 'not_modified':
+            WebPageCache.objects.filter(pk=cached[key].pk).update(hits=F('hits') + 1, fetched_at=timezone.now())
+        elif capture['cache'] == 'unchanged':
+            WebPageCache.objects.filter(pk=cached[key].pk).update(
+                hits=F('hits') + 1,
+                etag=capture['etag'],
+                last_modified=capture['last_modified'],
+                fetched_at=timezone.now(),
+            )
+        elif capture['cache'] == 'miss':
+            WebPageCache.objects.update_or_create(url_hash=key, defaults={
+                'url': capture['url'],
+                'etag': capture['etag'],
+                'last_modified': capture['last_modified'],
+                'body_hash': capture['body_hash'],
+                'data': json.dumps(capture['data']),
+                'extractor_version': version,
+            })
+
+
+def capture_pages(urls) -> list:
+    """
+    Capture `urls` concurrently. Returns one dict per URL, in order, with
+    'url', 'data' (parse_page() output, or None), 'error', 'seconds' and
+    'cache': 'miss', 'not_modified' (304) or 'unchanged' (same body), or
+    None on error.
+    """
+    version = EXTRACTOR_VERSIONS['website']
+    unique = list(dict.fromkeys(urls))
+    cached = {
+        row.url_hash: row
+        for row in WebPageCache.objects.filter(url_hash__in=[url_hash(url) for url in unique])
+        if row.extractor_version == version
+    }
+
+    workers = getattr(settings, 'WEB_CAPTURE_WORKERS', DEFAULT_WEB_CAPTURE_WORKERS)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(unique)))) as pool:
+        futures = {url: pool.submit(_capture, url, cached.get(url_hash(url))) for url in unique}
+
+    captures = {}
+    for url, future in futures.items():
+        try:
+            captures[url] = future.result()
+        except Exception as e:
+            error = str(e) if isinstance(e, CaptureError) else f"Capture failed: {e}"
+            captures[url] = {'url': url, 'data': None, 'error': error, 'cache': None, 'seconds': None}
+
+    _update_cache(captures.values(), cached)
+    return [captures[url] for url in urls]
+
+
+def _sanitized(data: dict) -> dict:
+    """
+    Copy of `data` for ExtractedData. URLs are left alone: they are absolute
+    http(s) URLs by construction, and escaping would break them as links.
+    """
+    data = copy.deepcopy(data)
+    links = data.pop('links', [])
+    urls = {key: data.pop(key, None) for key in ('url', 'canonical')}
+    sanitize_extracted_data(data)
+    for link in links:
+        link['text'] = sanitize_text(link['text'])
+    data.update(urls, links=links)
+    return data
+
+
+def save_capture(capture: dict, user) -> DataSource:
+    """Save a successful capture_pages() result as a website DataSource of `user`."""
+    data_json = json.dumps(_sanitized(capture['data']))
+    with transaction.atomic():
+        source = DataSource.objects.create(user=user, source_type='website', website_url=capture['url'])
+        ExtractedData.objects.create(
+            source=source,
+            user=user,
+            data=data_json,
+            content_hash=hashlib.sha256(data_json.encode('utf-8')).hexdigest(),
+            extractor_version=EXTRACTOR_VERSIONS['website'],
+        )
+    return source
@@ -176,6 +176,116 @@ CORS_ALLOW_CREDENTIALS = True
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 
+# Batch uploads (api/upload/batch/): files per request and files processed at once
+BATCH_UPLOAD_MAX_FILES = 500
+BATCH_UPLOAD_WORKERS = int(os.getenv('BATCH_UPLOAD_WORKERS', 8))
+DATA_UPLOAD_MAX_NUMBER_FILES = BATCH_UPLOAD_MAX_FILES
+
+# Resumable uploads (api/uploads/): max size of one chunk and of the whole file
+UPLOAD_CHUNK_MAX_SIZE = 16 * 1024 * 1024  # 16MB
+UPLOAD_SESSION_MAX_SIZE = 4 * 1024 * 1024 * 1024  # 4GB
+UPLOAD_SESSION_TTL = timedelta(days=2)  # unfinished sessions are purged after this
+
+# Extraction engine: one process pool per source type (0 = run in-process)
+_CPU_COUNT = os.cpu_count() or 2
+EXTRACTION_WORKERS = {
+    'pdf': int(os.getenv('EXTRACTION_PDF_WORKERS', max(1, _CPU_COUNT // 2))),
+    'excel': int(os.getenv('EXTRACTION_EXCEL_WORKERS', max(1, _CPU_COUNT // 4))),
+    'image': int(os.getenv('EXTRACTION_IMAGE_WORKERS', max(1, _CPU_COUNT // 2))),
+}
+EXTRACTION_TASK_TIMEOUT = int(os.getenv('EXTRACTION_TASK_TIMEOUT', 300))  # seconds
+
+# PDFs with at least this many pages (0 = never) are extracted in shards of
+# PDF_SHARD_PAGES pages on the PDF pool, at most PDF_SHARD_WORKERS at a time
+# (0 = as many as the pool has workers)
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 200))
+PDF_SHARD_PAGES = int(os.getenv('PDF_SHARD_PAGES', 50))
+PDF_SHARD_WORKERS = int(os.getenv('PDF_SHARD_WORKERS', 0))
+
+# PDF pages with no text layer but with images (scans) are rendered at
+# PDF_OCR_DPI and OCRed on the image pool, PDF_OCR_BATCH_PAGES pages per task
+PDF_OCR_DPI = int(os.getenv('PDF_OCR_DPI', 300))
+PDF_OCR_BATCH_PAGES = int(os.getenv('PDF_OCR_BATCH_PAGES', 2))
+
+# Workbooks are streamed sheet by sheet, this many rows at a time
+EXCEL_CHUNK_ROWS = int(os.getenv('EXCEL_CHUNK_ROWS', 1000))
+
+# Extracted spreadsheet rows are kept in columnar files here (see
+# data_capture/sheetstore.py), compressed in blocks of this many rows
+SHEET_STORE_DIR = Path(os.getenv('SHEET_STORE_DIR', BASE_DIR / 'sheet_store'))
+SHEET_STORE_BLOCK_ROWS = int(os.getenv('SHEET_STORE_BLOCK_ROWS', 8192))
+
+# Malware scanning through a running clamd (Unix socket or TCP). When neither
+# is set, or clamd is unreachable, each upload is scanned with clamscan.
+CLAMD_SOCKET = os.getenv('CLAMD_SOCKET', '')  # e.g. /var/run/clamav/clamd.ctl
+CLAMD_HOST = os.getenv('CLAMD_HOST', '')
+CLAMD_PORT = int(os.getenv('CLAMD_PORT', 3310))
+CLAMD_TIMEOUT = int(os.getenv('CLAMD_TIMEOUT', 60))  # seconds
+CLAMD_POOL_SIZE = int(os.getenv('CLAMD_POOL_SIZE', 4))  # idle connections kept open
+
+# Scan verdicts are cached per (SHA-256, signature version)
+SCAN_CACHE_SIZE = int(os.getenv('SCAN_CACHE_SIZE', 10000))  # in-memory LRU entries
+SCAN_VERSION_TTL = int(os.getenv('SCAN_VERSION_TTL', 300))  # seconds between signature version checks
+
+# PDF sanitization limits; bigger files are stored unsanitized (and flagged)
+PDF_SANITIZE_MAX_PAGES = int(os.getenv('PDF_SANITIZE_MAX_PAGES', 5000))
+PDF_SANITIZE_MAX_OBJECTS = int(os.getenv('PDF_SANITIZE_MAX_OBJECTS', 1000000))
+
+# Image sanitization: refuse images above this many pixels, and optionally
+# recompress PNG/GIF afterwards ('' = never, 'inline', or 'background')
+IMAGE_SANITIZE_MAX_PIXELS = int(os.getenv('IMAGE_SANITIZE_MAX_PIXELS', 89478485))  # Pillow's default
+IMAGE_SANITIZE_OPTIMIZE = os.getenv('IMAGE_SANITIZE_OPTIMIZE', '')
+# Multi-frame images (TIFF pages, GIF frames): uploads with more frames are
+# rejected; OCR reads at most IMAGE_OCR_MAX_FRAMES of them
+IMAGE_MAX_FRAMES = int(os.getenv('IMAGE_MAX_FRAMES', 500))
+IMAGE_OCR_MAX_FRAMES = int(os.getenv('IMAGE_OCR_MAX_FRAMES', 50))
+
+# OCR (see data_capture/ocr.py). The tesseract binary and tessdata are found
+# on PATH and in the usual install locations unless set here.
+# requirements.txt alone OCRs with the tesseract binary, which loads the
+# language model again for every batch of OCR_BATCH_IMAGES images. Workers
+# only keep the model loaded with tesserocr (requirements-ocr.txt); the
+# extraction worker warns at startup without it, or refuses to start if
+# OCR_REQUIRE_TESSEROCR is set.
+OCR_REQUIRE_TESSEROCR = os.getenv('OCR_REQUIRE_TESSEROCR', 'False').lower() == 'true'
+TESSERACT_CMD = os.getenv('TESSERACT_CMD', '')
+TESSDATA_PREFIX = os.getenv('TESSDATA_PREFIX', '')
+OCR_LANG = os.getenv('OCR_LANG', 'eng')  # e.g. eng+deu
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', 0))  # per process; 0 = CPUs shared out over the PDF and image pools
+OCR_BATCH_IMAGES = int(os.getenv('OCR_BATCH_IMAGES', 8))  # images per tesseract run without tesserocr
+OCR_TIMEOUT = int(os.getenv('OCR_TIMEOUT', 120))  # seconds per tesseract run
+# Images over OCR_TILE_THRESHOLD_PIXELS are read as overlapping full-width
+# strips of OCR_TILE_HEIGHT rows, in parallel
+OCR_TILE_THRESHOLD_PIXELS = int(os.getenv('OCR_TILE_THRESHOLD_PIXELS', 20_000_000))
+OCR_TILE_HEIGHT = int(os.getenv('OCR_TILE_HEIGHT', 2000))
+OCR_TILE_OVERLAP = int(os.getenv('OCR_TILE_OVERLAP', 200))
+# Preprocessing before OCR (see data_capture/ocrprep.py); each step can be turned off
+OCR_PREPROCESS_GRAYSCALE = os.getenv('OCR_PREPROCESS_GRAYSCALE', 'True').lower() == 'true'
+OCR_TARGET_DPI = int(os.getenv('OCR_TARGET_DPI', 300))  # downscale to this; 0 = keep full resolution
+OCR_DESKEW = os.getenv('OCR_DESKEW', 'True').lower() == 'true'
+OCR_BINARIZE = os.getenv('OCR_BINARIZE', 'sauvola')  # 'sauvola', 'otsu' or '' to leave it to tesseract
+
+# Website capture (see data_capture/webcapture.py)
+WEB_CAPTURE_WORKERS = int(os.getenv('WEB_CAPTURE_WORKERS', 8))  # concurrent fetches, and pooled connections per host
+WEB_CAPTURE_CONNECT_TIMEOUT = float(os.getenv('WEB_CAPTURE_CONNECT_TIMEOUT', 5))
+WEB_CAPTURE_TIMEOUT = float(os.getenv('WEB_CAPTURE_TIMEOUT', 20))  # seconds for the whole download of a page
+WEB_CAPTURE_MAX_BYTES = int(os.getenv('WEB_CAPTURE_MAX_BYTES', 5 * 1024 * 1024))
+WEB_CAPTURE_MAX_REDIRECTS = int(os.getenv('WEB_CAPTURE_MAX_REDIRECTS', 5))
+WEB_CAPTURE_MAX_URLS = int(os.getenv('WEB_CAPTURE_MAX_URLS', 50))  # per request
+WEB_CAPTURE_MAX_LINKS = int(os.getenv('WEB_CAPTURE_MAX_LINKS', 1000))  # links kept per page
+WEB_CAPTURE_USER_AGENT = os.getenv('WEB_CAPTURE_USER_AGENT', 'DataCapture/1.0')
+# Allow hosts on private, loopback and link-local addresses (intranet sites)
+WEB_CAPTURE_ALLOW_PRIVATE = os.getenv('WEB_CAPTURE_ALLOW_PRIVATE', 'False').lower() == 'true'
+
+# PDF pages sent to the detail view per request (api/sources/<id>/pages/)
+PDF_PAGES_PER_REQUEST = 20
+PDF_PAGES_PER_REQUEST_MAX = 100
+
+# Spreadsheet rows per page in the detail view, and the most
+# api/sources/<id>/sheets/rows/ returns at once
+SHEET_ROWS_PER_PAGE = 50
+SHEET_ROWS_PER_REQUEST_MAX = 500
+
 # Login URL for @login_required decorator
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/home/'